@@ -0,0 +1,58 @@
+"""
+Benchmark insert throughput for each journal mode and durability
+(synchronous) setting, inserting logs one commit at a time and in a
+single batched commit.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+
+from benchmarks.common import (
+    generate_logs,
+    timeit,
+)
+from spooncalc.dbtools import Database
+
+SETTINGS = [
+    ("delete", "full"),  # sqlite3 defaults, i.e. before WAL
+    ("wal", "extra"),
+    ("wal", "full"),
+    ("wal", "normal"),
+    ("wal", "off"),
+]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logs", type=int, default=500)
+    args = parser.parse_args()
+
+    logs = generate_logs(n_days=args.logs // 10 + 1, logs_per_day=10)[: args.logs]
+
+    for journal_mode, synchronous in SETTINGS:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db = Database(os.path.join(tmpdir, "bench.db"), journal_mode=journal_mode, synchronous=synchronous)
+
+            def insert_each() -> None:
+                for log in logs:
+                    db.insert_activitylog(log)
+
+            def insert_batched() -> None:
+                with db.batch():
+                    for log in logs:
+                        db.insert_activitylog(log)
+
+            each = timeit(insert_each, repeat=1)
+            batched = timeit(insert_batched, repeat=1)
+            print(
+                f"{journal_mode:>6} {synchronous:>6}: "
+                f"{len(logs) / each:10.0f} logs/s per-commit, "
+                f"{len(logs) / batched:10.0f} logs/s batched"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark the mean and spread of cumulative daily spoons sampled on the
+15 minute grid against the exact, event-based calculation, with and
+without simplification, for windows of several lengths.
+
+The calculation alone is timed on prefetched daily curves, as well as
+get_mean_and_spread including fetching each day's logs.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+from typing import List
+
+from benchmarks.common import (
+    generate_logs,
+    populate,
+    timeit,
+)
+from spooncalc import (
+    analyser,
+    timeutils,
+)
+from spooncalc.analyser import Curve
+from spooncalc.models.binstats import BinStats
+
+
+def grid_mean_and_spread(curves: List[Curve]) -> int:
+    """Sample prefetched curves at each time bin, as get_mean_and_spread does, returning the number of points"""
+    times = analyser.bin_times()
+    stats = BinStats(len(times))
+    for xs, ys in curves:
+        stats.add([analyser.linearly_interpolate(time, xs, ys) for time in times])
+    stats.band()
+    return len(times)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logs-per-day", type=int, default=12)
+    parser.add_argument("--windows", type=int, nargs="+", default=[7, 14, 28, 90])
+    parser.add_argument("--tolerance", type=float, default=0.1, help="simplification tolerance in spoons")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, "bench.db")
+        db = populate(db_path, generate_logs(max(args.windows), args.logs_per_day))
+        start, end = timeutils.day_start_hour(), timeutils.day_end_hour()
+
+        for n_days in args.windows:
+            with timeutils.clock.frozen():
+                curves = [analyser.fetch_cumulative_time_spoons(db, offset) for offset in range(-n_days, 0)]
+            exact = analyser.exact_mean_and_spread(curves, start, end)
+            simplified = analyser.exact_mean_and_spread(curves, start, end, args.tolerance)
+
+            print(f"{n_days} days of {args.logs_per_day} logs")
+            results = [
+                ("grid", lambda: grid_mean_and_spread(curves), grid_mean_and_spread(curves)),
+                ("exact", lambda: analyser.exact_mean_and_spread(curves, start, end), len(exact.times)),
+                (
+                    f"exact (tol {args.tolerance})",
+                    lambda: analyser.exact_mean_and_spread(curves, start, end, args.tolerance),
+                    len(simplified.times),
+                ),
+            ]
+            for label, func, n_points in results:
+                print(f"  {label:>18}: {timeit(func) * 1e3:8.2f} ms ({n_points} points)")
+            for mode in analyser.MEAN_MODES:
+                t = timeit(lambda: analyser.get_mean_and_spread(db, -n_days, 0, mode=mode))
+                print(f"  {'fetched, ' + mode:>18}: {t * 1e3:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Benchmark queries of recent and old days on a multi-year database, with
+every log in the activities table and after archiving each past year into
+its own partition (see Database.archive_year).
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+from datetime import datetime
+
+from benchmarks.common import (
+    generate_logs,
+    populate,
+    timeit,
+)
+from spooncalc import analyser
+from spooncalc.dbtools import Database
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--logs-per-day", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, "spooncalc.db")
+        db = populate(db_path, generate_logs(args.years * 365, args.logs_per_day))
+        print(f"{db.submit_query('SELECT COUNT(*) FROM activities')[0][0]} logs over {args.years} years")
+
+        benchmarks = {
+            "open database": lambda: Database(db_path),
+            "breakdown (30 days)": lambda: db.daily_breakdown(-30, 0),
+            "mean and spread (14 days)": lambda: analyser.get_mean_and_spread(db),
+            "first page of logs": lambda: db.get_logs_page(limit=50),
+            "count all logs": lambda: db.query().aggregate("count"),
+            "breakdown (a year ago)": lambda: db.daily_breakdown(-400, -370),
+        }
+        before = {label: timeit(func) for label, func in benchmarks.items()}
+
+        for year in range(datetime.now().year - args.years, datetime.now().year):
+            db.archive_year(year)
+        db.submit_query("VACUUM")
+        print(f"{db.submit_query('SELECT COUNT(*) FROM activities')[0][0]} logs left unarchived")
+
+        for label, func in benchmarks.items():
+            after = timeit(func)
+            print(f"{label:>26}: unpartitioned {before[label] * 1e3:8.2f} ms, partitioned {after * 1e3:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Benchmark `update_plot` of the plot screen's plots with and without
+LTTB downsampling of the plotted points.
+
+Requires kivy and kivy_garden.graph.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+
+from benchmarks.common import (
+    generate_logs,
+    populate,
+    timeit,
+)
+from spooncalc import plotutils
+from spooncalc.models.activitylog import QUALIFIERS
+from spooncalc.screens.plotscreen.dailytotalsplot import DailyTotalsPlot
+from spooncalc.screens.plotscreen.hourlycumulative import HourlyCumulative
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=int, default=3 * 365)
+    parser.add_argument("--logs-per-day", type=int, default=4)
+    parser.add_argument("--short-logs", type=int, default=400, help="number of logs on the final day")
+    parser.add_argument("--width", type=float, default=393, help="graph width in pixels")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, "bench.db")
+        logs = generate_logs(args.days, args.logs_per_day)
+        logs += generate_logs(1, args.short_logs, seed=1)
+        db = populate(db_path, logs)
+
+        for label, ppp in [("all points", None), ("lttb", plotutils.POINTS_PER_PIXEL)]:
+            totals = DailyTotalsPlot(db, points_per_pixel=ppp)
+            totals.graph.width = args.width
+            totals.apply_qual_mask({q: True for q in QUALIFIERS + ["total"]})
+            totals.xmin = -args.days
+            totals.update_plot()  # warm the per-day cache
+
+            hourly = HourlyCumulative(db, points_per_pixel=ppp)
+            hourly.graph.width = args.width
+            hourly.day_offset = -1
+
+            n_points = sum(len(p.points) for p in totals.plots.values())
+            print(f"DailyTotalsPlot  {label:>10}: {timeit(totals.update_plot) * 1e3:8.2f} ms ({n_points} points)")
+            t = timeit(hourly.update_plot)
+            print(f"HourlyCumulative {label:>10}: {t * 1e3:8.2f} ms ({len(hourly.plot.points)} points)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark analytics queries on a large database through a read-write
+Database (a fresh connection per query) and through its memory-mapped,
+read-only reader.
+
+The database is grown to the requested size by repeatedly copying all
+of its logs further into the past, and is kept (see --db) such that it
+need only be built once.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+
+from benchmarks.common import (
+    generate_logs,
+    populate,
+    timeit,
+)
+from spooncalc import analyser
+from spooncalc.dbtools import Database
+
+
+def grow(db_path: str, size_mb: int) -> None:
+    """
+    Double the logs of a database, shifted into the past, until it is
+    `size_mb` large. The copies are given random placeholder content
+    hashes, rather than being backfilled (slowly) when next opened.
+    """
+    db = populate(db_path, generate_logs(n_days=365, logs_per_day=20))
+    cols = ", ".join(Database.PLAIN_COLNAMES + ("qualifiers",))
+    shifted_cols = cols.replace("start, end", "datetime(start, :shift), datetime(end, :shift)")
+    cols += ", content_hash, day"
+    shifted_cols += ", hex(randomblob(20)), day - :days"
+    while os.path.getsize(db_path) < size_mb * 1024 * 1024:
+        with db.cursor() as c:
+            c.execute("SELECT max(day) - min(day) + 1 FROM activities")
+            days = c.fetchone()[0]
+            c.execute(
+                f"INSERT INTO activities({cols}) SELECT {shifted_cols} FROM activities",
+                {"shift": f"-{days} days", "days": days},
+            )
+        db.checkpoint("truncate")
+        print(f"  {os.path.getsize(db_path) / 1024 / 1024:.0f} MB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", default="bench-readonly.db", help="path of the (reused) database")
+    parser.add_argument("--size-mb", type=int, default=1024)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db) or os.path.getsize(args.db) < args.size_mb * 1024 * 1024:
+        print(f"Growing {args.db} to {args.size_mb} MB")
+        grow(args.db, args.size_mb)
+
+    writer = Database(args.db)
+    reader = writer.reader()
+    n_logs = writer.submit_query("SELECT count(*) FROM activities")[0][0]
+    print(f"{n_logs} logs, {os.path.getsize(args.db) / 1024 / 1024:.0f} MB")
+
+    benchmarks = {
+        "full scan": lambda db: db.submit_query("SELECT count(*), sum(length(name)) FROM activities"),
+        "mean and spread (14 days)": lambda db: analyser.get_mean_and_spread(db),
+        "daily totals (30 days)": lambda db: analyser.fetch_daily_totals(db, -30, 30),
+        "search totals": lambda db: db.search_activity_totals("activity 1"),
+    }
+    for label, func in benchmarks.items():
+        read_write = timeit(lambda: func(writer), repeat=args.repeat)
+        read_only = timeit(lambda: func(reader), repeat=args.repeat)
+        print(
+            f"{label:>26}: read-write {read_write * 1000:8.1f} ms, "
+            f"read-only {read_only * 1000:8.1f} ms ({read_write / read_only:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Run benchmarks from the repository root, e.g.
+    python -m benchmarks.bench_plot_downsampling
+"""
+
+from __future__ import annotations
+
+import random
+import sqlite3
+import time
+from datetime import (
+    datetime,
+    timedelta,
+)
+from typing import (
+    Callable,
+    List,
+)
+
+from spooncalc.dbtools import Database
+from spooncalc.models.activitylog import (
+    QUALIFIERS,
+    ActivityLog,
+    qualifier_bitmask,
+)
+
+
+def generate_logs(n_days: int, logs_per_day: int, seed: int = 0) -> List[ActivityLog]:
+    """Generate `logs_per_day` back-to-back random logs for each of the past `n_days` days"""
+    rng = random.Random(seed)
+    today = datetime.now().replace(hour=8, minute=0, second=0, microsecond=0)
+    minutes = max(1, 16 * 60 // logs_per_day)
+    logs = []
+    for day in range(n_days, 0, -1):
+        start = today - timedelta(days=day)
+        for i in range(logs_per_day):
+            end = start + timedelta(minutes=minutes)
+            log = ActivityLog(
+                start=start,
+                end=end,
+                name=f"activity {rng.randrange(50)}",
+                cogload=rng.choice([0.0, 0.5, 1.0, 1.5, 2.0]),
+                physload=rng.choice([0.0, 0.5, 1.0, 1.5, 2.0]),
+            )
+            for qual in QUALIFIERS:
+                setattr(log, qual, rng.random() < 0.2)
+            logs.append(log)
+            start = end
+    return logs
+
+
+def populate(db_path: str, logs: List[ActivityLog]) -> Database:
+    """
+    Bulk insert `logs` straight into the activities table, then reopen
+    the database such that all derived tables are backfilled.
+    """
+    Database(db_path)
+    cols = Database.PLAIN_COLNAMES + ("qualifiers",)
+    rows = [[str(getattr(log, c)) for c in Database.PLAIN_COLNAMES] + [qualifier_bitmask(log)] for log in logs]
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        f"INSERT INTO activities({', '.join(cols)}) VALUES({', '.join('?' for _ in cols)})",
+        rows,
+    )
+    conn.commit()
+    conn.close()
+    return Database(db_path)
+
+
+def timeit(func: Callable, repeat: int = 5) -> float:
+    """Get the best wall time, in seconds, of `repeat` calls of `func`"""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best
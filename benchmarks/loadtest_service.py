@@ -0,0 +1,145 @@
+"""
+Load test the HTTP service (see spooncalc.service) with concurrent
+clients, each keeping its connection alive, and report the throughput
+and latency percentiles of each endpoint.
+
+Either targets a running service (see --url), or starts one in this
+process on a temporary database of generated logs.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import (
+    datetime,
+    timedelta,
+)
+from typing import (
+    Dict,
+    List,
+    Tuple,
+)
+from urllib.parse import urlsplit
+
+from benchmarks.common import (
+    generate_logs,
+    populate,
+)
+from spooncalc.service import Service
+
+Timings = Dict[str, List[float]]
+
+
+def start_service(db_path: str, workers: int) -> Tuple[str, Service]:
+    """Serve a database from a background thread, returning its url"""
+    service = Service(populate(db_path, generate_logs(n_days=365, logs_per_day=12)), workers=workers)
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(service.start("127.0.0.1", 0))
+    threading.Thread(target=loop.run_forever, name="spooncalc-service-loop", daemon=True).start()
+    port = server.sockets[0].getsockname()[1]
+    return f"http://127.0.0.1:{port}", service
+
+
+def requests_mix(rng: random.Random) -> Tuple[str, str, str, bytes]:
+    """Pick a (label, method, path, body) request, mostly reads and a few inserts"""
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    roll = rng.random()
+    if roll < 0.3:
+        start = today - timedelta(days=rng.randrange(7, 365))
+        end = start + timedelta(days=rng.choice([1, 7, 30]))
+        return "logs", "GET", f"/logs?start={start.date()}&end={end.date()}", b""
+    if roll < 0.6:
+        return "daily-totals", "GET", f"/daily-totals?start=-{rng.choice([7, 30, 90])}&end=0", b""
+    if roll < 0.9:
+        mode = rng.choice(["grid", "exact"])
+        return f"mean-spread ({mode})", "GET", f"/mean-spread?start=-14&end=0&mode={mode}", b""
+    start = today - timedelta(days=rng.randrange(400, 800), minutes=rng.randrange(24 * 60))
+    log = {
+        "start": str(start),
+        "end": str(start + timedelta(minutes=30)),
+        "name": f"load test {rng.randrange(1000)}",
+        "cogload": 1.0,
+        "physload": 0.5,
+    }
+    return "insert", "POST", "/logs", json.dumps(log).encode("utf-8")
+
+
+def client(url: str, n_requests: int, seed: int) -> Tuple[Timings, int]:
+    """Send `n_requests` requests over one connection, returning the latencies of each label and the errors"""
+    rng = random.Random(seed)
+    target = urlsplit(url)
+    conn = http.client.HTTPConnection(target.hostname, target.port)
+    timings: Timings = {}
+    errors = 0
+    for _ in range(n_requests):
+        label, method, path, body = requests_mix(rng)
+        t0 = time.perf_counter()
+        conn.request(method, path, body=body or None, headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        response.read()
+        timings.setdefault(label, []).append(time.perf_counter() - t0)
+        errors += response.status >= 400
+    conn.close()
+    return timings, errors
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Get the (nearest rank) percentile of sorted values"""
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", help="url of a running service, e.g. http://127.0.0.1:8765")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=100, help="requests per client")
+    parser.add_argument("--workers", type=int, default=4, help="query threads of an in-process service")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        url, service = args.url, None
+        if url is None:
+            url, service = start_service(os.path.join(tmpdir, "loadtest.db"), args.workers)
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.clients) as pool:
+            results = list(pool.map(lambda seed: client(url, args.requests, seed), range(args.clients)))
+        elapsed = time.perf_counter() - t0
+
+        timings: Timings = {}
+        for client_timings, _ in results:
+            for label, values in client_timings.items():
+                timings.setdefault(label, []).extend(values)
+        n_requests = sum(len(values) for values in timings.values())
+        print(
+            f"{n_requests} requests from {args.clients} clients in {elapsed:.2f} s: "
+            f"{n_requests / elapsed:.0f} requests/s, {sum(errors for _, errors in results)} errors"
+        )
+        for label, values in sorted(timings.items()):
+            values.sort()
+            print(
+                f"  {label:>19}: {len(values):5d} requests, p50 {percentile(values, 0.5) * 1e3:7.2f} ms, "
+                f"p95 {percentile(values, 0.95) * 1e3:7.2f} ms, p99 {percentile(values, 0.99) * 1e3:7.2f} ms"
+            )
+
+        conn = http.client.HTTPConnection(urlsplit(url).hostname, urlsplit(url).port)
+        conn.request("GET", "/stats")
+        print("Service-side timing:")
+        for route, stats in json.loads(conn.getresponse().read()).items():
+            print(f"  {route:>19}: {stats['count']:5d} requests, mean {stats['mean_ms']:7.2f} ms, max {stats['max_ms']:7.2f} ms")
+        conn.close()
+        if service is not None:
+            service.close()
+
+
+if __name__ == "__main__":
+    main()
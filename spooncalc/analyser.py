@@ -5,14 +5,59 @@ informative plots
 
 from __future__ import annotations
 
+import heapq
+from itertools import groupby
 from typing import (
+    Iterator,
     List,
+    NamedTuple,
     Optional,
     Tuple,
 )
 
-from spooncalc import timeutils
+from spooncalc import (
+    plotutils,
+    timeutils,
+)
 from spooncalc.dbtools import Database
+from spooncalc.models.binstats import (
+    BinStats,
+    RollingBinStats,
+)
+
+# The width, in hours, of the time bins of mean and spread curves
+BIN_HOURS = 0.25
+# How get_mean_and_spread samples the curves of each day: at each time bin
+# ("grid"), or at every breakpoint of any curve ("exact")
+MEAN_MODES = ("grid", "exact")
+
+Curve = Tuple[List[float], List[float]]  # the xs and ys of a piecewise-linear curve
+
+
+class MeanCurve(NamedTuple):
+    """
+    The mean of piecewise-linear curves, with its spread, as calculated by
+    exact_mean_and_spread
+
+    Attributes
+    ----------
+    times : list(float)
+        the x value of each point
+    means : list(float)
+        the mean at each time
+    below : list(float)
+        one standard deviation below the mean at each time
+    above : list(float)
+        one standard deviation above the mean at each time
+    breakpoints : int
+        the number of points of the exact curve, before any simplification
+    """
+
+    times: List[float]
+    means: List[float]
+    below: List[float]
+    above: List[float]
+    breakpoints: int
 
 
 def fetch_daily_totals(db: Database, start_day_offset: int, span: int) -> dict:
@@ -35,7 +80,8 @@ def fetch_daily_totals(db: Database, start_day_offset: int, span: int) -> dict:
     {-2: 20.5, -1: 22.5, 0: 4.25}
     """
 
-    spoons_each_day = {i: fetch_daily_total(db, i) for i in range(start_day_offset, start_day_offset + span)}
+    totals = db.get_daily_totals(start_day_offset, start_day_offset + span)
+    spoons_each_day = {i: totals.get(i, 0.0) for i in range(start_day_offset, start_day_offset + span)}
     return spoons_each_day
 
 
@@ -57,7 +103,7 @@ def fetch_daily_total(db: Database, day_offset: int) -> float:
         The total number of spoons spent on this day
     """
 
-    return sum(log.spoons for log in db.get_logs_from_day(day_offset))
+    return db.get_daily_totals(day_offset, day_offset + 1).get(day_offset, 0.0)
 
 
 def fetch_average_spoons_per_day(
@@ -85,11 +131,7 @@ def fetch_average_spoons_per_day(
     start=-14, end=0: spoons per day, averaged over past 14 days
                       (i.e.not including today)
     """
-    logs = db.get_logs_between_offsets(day_offset_start, day_offset_end)
-    total_spoons = 0
-    for log in logs:
-        total_spoons += log.spoons
-
+    total_spoons = db.query().between_offsets(day_offset_start, day_offset_end).aggregate("total", "spoons")
     return total_spoons / (day_offset_end - day_offset_start)
 
 
@@ -122,7 +164,9 @@ def fetch_cumulative_time_spoons(
             logged activities.
     """
 
-    logs = db.get_logs_between_offsets(day_offset, day_offset + 1)
+    with timeutils.clock.frozen():
+        logs = db.get_logs_between_offsets(day_offset, day_offset + 1)
+        midnight = timeutils.date_midnight_from_offset(day_offset)
     logs = sorted(logs, key=lambda e: e.end)
 
     # if no logs, return a single point at (0,0)
@@ -137,10 +181,7 @@ def fetch_cumulative_time_spoons(
     ys = [0.0, 0.0]
     total_spoons = 0.0
     for log in logs:
-        hours_since_midnight = timeutils.hours_between(
-            timeutils.date_midnight_from_offset(day_offset),
-            str(log.end),  # (re)casting to str to satisfy typehints
-        )
+        hours_since_midnight = timeutils.hours_between(midnight, log.end)
         total_spoons += log.spoons
         xs.append(hours_since_midnight)
         ys.append(total_spoons)
@@ -207,7 +248,11 @@ def calc_stdev(values: List[float], mean: Optional[float] = None) -> float:
 
 
 def get_mean_and_spread(
-    db: Database, day_offset_start: int = -14, day_offset_end: int = 0
+    db: Database,
+    day_offset_start: int = -14,
+    day_offset_end: int = 0,
+    mode: str = "grid",
+    tolerance: float = 0.0,
 ) -> Tuple[List[float], List[float], List[float], List[float]]:
     """
     Get mean and spread of cumulative daily spoon plots.
@@ -220,6 +265,13 @@ def get_mean_and_spread(
         number of days between today and start day
     day_offset_end : int
         number of days between today and end day
+    mode : str {"grid", "exact"}
+        whether to sample every day's curve at each time bin of width
+        BIN_HOURS, or to calculate the mean exactly from the breakpoints of
+        every day's curve (see exact_mean_and_spread)
+    tolerance : float
+        in "exact" mode, the (vertical) error in spoons to which the curves
+        are simplified. If 0, every breakpoint is kept.
 
     Returns
     -------
@@ -236,35 +288,211 @@ def get_mean_and_spread(
             curves for `below`, but rather calculate the 84%
             and 16%
     """
-    cumulative_plots = [
-        fetch_cumulative_time_spoons(db, day_offset) for day_offset in range(day_offset_start, day_offset_end)
-    ]
+    if mode not in MEAN_MODES:
+        raise ValueError(f"Unknown mode: {mode}")
+    if mode == "exact":
+        with timeutils.clock.frozen():
+            curves = [
+                fetch_cumulative_time_spoons(db, day_offset) for day_offset in range(day_offset_start, day_offset_end)
+            ]
+        curve = exact_mean_and_spread(curves, timeutils.day_start_hour(), timeutils.day_end_hour(), tolerance)
+        return curve.times, curve.means, curve.below, curve.above
+
+    times = bin_times()
+    stats = BinStats(len(times))
+    with timeutils.clock.frozen():
+        for day_offset in range(day_offset_start, day_offset_end):
+            stats.add(sample_cumulative_spoons(db, day_offset, times))
+
+    means, below, above = stats.band()
+    return times, means, below, above
 
+
+def curve_events(day: int, curve: Curve) -> Iterator[Tuple[float, int, int, float, float]]:
+    """
+    Get the breakpoints of a piecewise-linear curve as events, in order:
+    (x, day, index, y, slope of the following segment)
     """
-    the following pure python is equivalent to:
-    times = numpy.linspace(
-        timeutils.day_start_hour(),
-        timeutils.day_end_hour(),
-        0.25
-    )
+    xs, ys = curve
+    for i, (x, y) in enumerate(zip(xs, ys)):
+        slope = 0.0
+        if i + 1 < len(xs) and xs[i + 1] > x:
+            slope = (ys[i + 1] - y) / (xs[i + 1] - x)
+        yield x, day, i, y, slope
+
+
+def exact_mean_and_spread(
+    curves: List[Curve],
+    start: float,
+    end: float,
+    tolerance: float = 0.0,
+) -> MeanCurve:
+    """
+    Calculate the mean and spread of piecewise-linear curves between x
+    values `start` and `end`, without sampling the curves on a grid.
+
+    The breakpoints of every curve are merged into one sorted stream of
+    events, at which the sums of the curves' values, slopes, squared
+    values, products of value and slope and squared slopes are updated.
+    Between events these sums change by known polynomials, so the mean
+    (which is piecewise-linear) is exact everywhere, and the spread is
+    exact at every breakpoint. A vertical step (e.g. two logs ending at
+    once) is kept as two points at the same time.
+
+    Each curve is held constant beyond its last breakpoint, as by
+    linearly_interpolate, and its xs are assumed to be sorted.
+
+    Parameters
+    ----------
+    curves : list((list(float), list(float)))
+        the xs and ys of each curve, e.g. from fetch_cumulative_time_spoons
+    start : float
+        the x value of the first point
+    end : float
+        the x value of the last point
+    tolerance : float
+        the vertical error to which the mean and spread are simplified
+        (see plotutils.simplify). If 0, every breakpoint is kept.
     """
-    dt = 0.25  # 15 min resolution
+    n = len(curves)
+    if n == 0:
+        return MeanCurve([], [], [], [], 0)
+
+    # The value and slope of each curve as of its latest event
+    values = [0.0] * n
+    slopes = [0.0] * n
+    event_xs = [0.0] * n
+    # Sums over all curves at x: values, slopes, squared values, values
+    # times slopes and squared slopes
+    total = total_slope = total_sq = total_product = total_slope_sq = 0.0
+    x_now = min([start] + [xs[0] for xs, _ in curves if xs])
+
+    def advance(x: float) -> None:
+        nonlocal total, total_sq, total_product, x_now
+        dx = x - x_now
+        total_sq += 2 * total_product * dx + total_slope_sq * dx * dx
+        total_product += total_slope_sq * dx
+        total += total_slope * dx
+        x_now = x
+
+    def point() -> Tuple[float, float]:
+        mean = total / n
+        return mean, max(0.0, total_sq / n - mean * mean) ** 0.5
+
     times: List[float] = []
-    means: List[float] = []
-    above: List[float] = []
-    below: List[float] = []
+    points: List[Tuple[float, float]] = []
+    events = heapq.merge(*[curve_events(day, curve) for day, curve in enumerate(curves)])
+    for x, group in groupby(events, key=lambda event: event[0]):
+        if x > end:
+            break
+        if x > start and not times:
+            advance(start)
+            times.append(start)
+            points.append(point())
+        if x > x_now:
+            advance(x)
+        before = point()
+        for _, day, _, y, slope in group:
+            old_value = values[day] + slopes[day] * (x - event_xs[day])
+            old_slope = slopes[day]
+            total += y - old_value
+            total_slope += slope - old_slope
+            total_sq += y * y - old_value * old_value
+            total_product += y * slope - old_value * old_slope
+            total_slope_sq += slope * slope - old_slope * old_slope
+            values[day], slopes[day], event_xs[day] = y, slope, x
+        if x < start:
+            continue
+        after = point()
+        if times and max(abs(a - b) for a, b in zip(before, after)) > 1e-9:
+            times.append(x)
+            points.append(before)
+        times.append(x)
+        points.append(after)
+
+    if not times:
+        advance(start)
+        times.append(start)
+        points.append(point())
+    if times[-1] < end:
+        advance(end)
+        times.append(end)
+        points.append(point())
+
+    means = [mean for mean, _ in points]
+    below = [mean - stdev for mean, stdev in points]
+    above = [mean + stdev for mean, stdev in points]
+    breakpoints = len(times)
+    if tolerance > 0:
+        kept = plotutils.simplify(times, [means, below, above], tolerance)
+        times, means, below, above = ([values[i] for i in kept] for values in (times, means, below, above))
+    return MeanCurve(times, means, below, above, breakpoints)
+
+
+def bin_times() -> List[float]:
+    """
+    Get the start time (in hours) of each time bin of a day, from
+    timeutils.day_start_hour() in steps of BIN_HOURS.
 
+    The following pure python is equivalent to:
+    numpy.arange(timeutils.day_start_hour(), timeutils.day_end_hour(), BIN_HOURS)
+    """
+    times: List[float] = []
     t = timeutils.day_start_hour()
     while t < timeutils.day_end_hour():
         times.append(t)
-        t += dt
+        t += BIN_HOURS
+    return times
+
+
+def sample_cumulative_spoons(db: Database, day_offset: int, times: List[float]) -> List[float]:
+    """
+    Get the cumulative spoons spent on a day (see
+    fetch_cumulative_time_spoons) at each of `times`
+    """
+    xs, ys = fetch_cumulative_time_spoons(db, day_offset)
+    return [linearly_interpolate(time, xs, ys) for time in times]
 
-    for time in times:
-        cumulative_spoons = [linearly_interpolate(time, xs, ys) for xs, ys in cumulative_plots]
-        mean = calc_mean(cumulative_spoons)
-        stdev = calc_stdev(cumulative_spoons, mean)
-        means.append(mean)
-        above.append(mean + stdev)
-        below.append(mean - stdev)
 
+def update_mean_and_spread(
+    db: Database,
+    stats: RollingBinStats,
+    day_offset_start: int = -14,
+    day_offset_end: int = 0,
+) -> Tuple[List[float], List[float], List[float], List[float]]:
+    """
+    Get mean and spread of cumulative daily spoon plots, as for
+    get_mean_and_spread, from incrementally maintained statistics.
+
+    The window of `stats` is moved to the days between the offsets, such
+    that only days new to the window (e.g. once a day has closed) and
+    days invalidated since the previous update (e.g. by inserting or
+    deleting a past log) are fetched and sampled. Otherwise, this costs
+    O(bins), without fetching any logs.
+
+    Parameters
+    ----------
+    db : Database
+        a reference to a database wrapper
+    stats : RollingBinStats
+        the statistics of the window, with one bin per time of bin_times()
+    day_offset_start : int
+        number of days between today and start day
+    day_offset_end : int
+        number of days between today and end day
+
+    Returns
+    -------
+    times, mean, below, above
+        as for get_mean_and_spread
+    """
+    times = bin_times()
+    with timeutils.clock.frozen():
+        today = timeutils.day_index_from_offset(0)
+        stats.update(
+            range(today + day_offset_start, today + day_offset_end),
+            lambda day: sample_cumulative_spoons(db, day - today, times),
+        )
+
+    means, below, above = stats.stats.band()
     return times, means, below, above
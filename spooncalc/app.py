@@ -1,7 +1,13 @@
 from __future__ import annotations
 
 import os
+import threading
+from datetime import datetime
 from pathlib import Path
+from typing import (
+    Callable,
+    Optional,
+)
 
 from kivy.config import Config
 
@@ -13,6 +19,8 @@ Config.set("graphics", "width", "393")
 Config.set("graphics", "height", "830")
 
 from kivy.app import App
+from kivy.clock import mainthread
+from kivy.logger import Logger
 from kivy.core.window import Window
 from kivy.uix.screenmanager import (
     FadeTransition,
@@ -20,16 +28,19 @@ from kivy.uix.screenmanager import (
 )
 from kivy.utils import platform
 
-from spooncalc.dbtools import Database
-from spooncalc.models.activitylog import (
-    ActivityLog,
-    clean_param,
+from spooncalc import (
+    backup,
+    csvimport,
+    snapshot,
+    sync,
 )
+from spooncalc.dbtools import Database
 from spooncalc.screens.importscreen import importscreen
 from spooncalc.screens.inputscreen import inputscreen
 from spooncalc.screens.logsscreen import logsscreen
 from spooncalc.screens.menuscreen import menuscreen
 from spooncalc.screens.plotscreen import plotscreen
+from spooncalc.screens.searchscreen import searchscreen
 
 # Android specific imports and setup
 if platform == "android":
@@ -65,6 +76,7 @@ class MyScreenManager(ScreenManager):
              InputScreen
              PlotScreen
              LogsScreen
+             SearchScreen
              ImportScreen
     """
 
@@ -111,17 +123,25 @@ class SpoonCalcApp(App):
         """
         self.EXTERNALSTORAGE = EXTERNALSTORAGE
         self.db = Database(db_path="spooncalc.db")
+        # Screens which only read (e.g. plots) share a memory-mapped reader
+        self.analytics_db = self.db.reader()
+        self.backups = backup.BackupManager(
+            self.db,
+            directory=os.path.join(self.EXTERNALSTORAGE, "spooncalc-backups"),
+        )
 
         sm = MyScreenManager()
         sm.add_widget(
             menuscreen.MenuScreen(
                 export_callback=self.export_database,
-                db=self.db,
+                backup_callback=self.backup_database,
+                db=self.analytics_db,
             )
         )
         sm.add_widget(inputscreen.InputScreen(db=self.db))
         sm.add_widget(logsscreen.LogsScreen(db=self.db))
-        sm.add_widget(plotscreen.PlotScreen(db=self.db))
+        sm.add_widget(plotscreen.PlotScreen(db=self.analytics_db))
+        sm.add_widget(searchscreen.SearchScreen(db=self.analytics_db))
         sm.add_widget(importscreen.ImportScreen(import_callback=self.import_csv_data))
         self.manager = sm
 
@@ -139,42 +159,103 @@ class SpoonCalcApp(App):
         return True
 
     def import_csv_data(self, filename) -> None:
+        """
+        Import a csv file (or binary snapshot) previously exported by
+        SpoonCalc, skipping duplicates. Large csv files are parsed in
+        parallel, except on android. A changes (.jsonl) file is applied
+        incrementally, and a backup (.db) file instead replaces the database.
+        """
         filepath = os.path.join(self.EXTERNALSTORAGE, filename)
-        with open(filepath, "r") as fp:
-            header = fp.readline()  # skip header
-            # colnames = header.strip().split(',')
-            for line in fp:
-                self.insert_if_unique(header, line)
+        if filename.endswith(backup.BACKUP_SUFFIX):
+            self.restore_backup(filepath)
+            return
+        if filename.endswith(".jsonl"):
+            try:
+                applied = sync.import_changes(self.db, filepath)
+            except ValueError as e:
+                Logger.error(f"SpoonCalc: Not applying changes: {e}")
+                return
+            Logger.info(f"SpoonCalc: Applied {applied} changes")
+            return
+        if filename.endswith(".spoon"):
+            try:
+                inserted = snapshot.import_snapshot(self.db, filepath)
+            except snapshot.SnapshotError as e:
+                Logger.error(f"SpoonCalc: Not importing snapshot: {e}")
+                return
+            Logger.info(f"SpoonCalc: Imported {inserted} logs from snapshot")
+            return
+
+        workers = 1 if platform == "android" else None
+        try:
+            result = csvimport.import_csv(self.db, filepath, workers=workers)
+        except csvimport.CSVError as e:
+            Logger.error(f"SpoonCalc: Not importing csv: {e}")
+            return
+
+        Logger.info(f"SpoonCalc: Imported {result.inserted} logs, skipped {result.skipped} duplicates")
+        for line, message in result.errors:
+            Logger.warning(f"SpoonCalc: Skipped invalid line {line} of {filename}: {message}")
+        if result.inserted:
+            # Only the span of the import may hold new overlaps
+            threading.Thread(
+                target=self.report_overlaps,
+                args=(result.first_start, result.last_end),
+                name="spooncalc-overlaps",
+                daemon=True,
+            ).start()
+
+    def report_overlaps(self, start: datetime, end: datetime) -> None:
+        """Log the pairs of overlapping logs within [start, end), e.g. after an import"""
+        overlaps = self.db.overlap_report(start, end)
+        if overlaps:
+            first, second = overlaps[0]
+            Logger.warning(
+                f"SpoonCalc: {len(overlaps)} pairs of logs overlap, e.g. "
+                f"{first.name} ({first.start:%d.%m.%Y %H:%M}) and {second.name} ({second.start:%d.%m.%Y %H:%M})"
+            )
 
-    def insert_if_unique(self, header: str, csv_row: str) -> None:
+    def export_database(self) -> None:
         """
-        Take a raw csv row, extract relevant data, and insert into database.
-
-        If the row already exists in database (i.e. all data entries match
-        exactly), then the row is skipped
-
-        Paramters
-        ---------
-        header : str
-            A raw csv header from a previous database export
-        csv_row : str
-            A raw csv row from a previous database export
+        Export the entire activities database as a csv file, and as a
+        binary snapshot which is much faster to import. The changes since
+        the previous export are also exported, for syncing other devices.
         """
-        colnames = header.strip().split(",")
-        values = csv_row.strip().split(",")
+        filename = os.path.join(self.EXTERNALSTORAGE, "spoon-output.csv")
+        self.db.export_database(filename)
+        snapshot.export_snapshot(self.db, os.path.join(self.EXTERNALSTORAGE, "spoon-output.spoon"))
+        sync.export_changes(self.db, os.path.join(self.EXTERNALSTORAGE, "spoon-changes.jsonl"))
 
-        # Collect values applicable to ActivityLog class
-        activitylog_params = {
-            k: clean_param(v) for k, v in zip(colnames, values) if k in ActivityLog.__dict__["__dataclass_fields__"]
-        }
+    def backup_database(self, progress: Callable[[float], None], on_done: Callable[[Optional[str]], None]) -> None:
+        """
+        Back up the database in the background, keeping rotating backups
+        in the "spooncalc-backups" directory.
+
+        Parameters
+        ----------
+        progress : Callable
+            called on the main thread with the fraction of the backup done
+        on_done : Callable
+            called on the main thread with the path of the backup, or None
+            if it failed
+        """
 
-        activitylog = ActivityLog(**activitylog_params)  # type: ignore
+        @mainthread
+        def finish(path: Optional[str], error: Optional[Exception]) -> None:
+            if error is not None:
+                Logger.error(f"SpoonCalc: Backup failed: {error}")
+            on_done(path)
 
-        self.db.insert_activitylog_if_unique(activitylog)
+        self.backups.start_backup(progress=mainthread(progress), on_done=finish)
 
-    def export_database(self) -> None:
+    def restore_backup(self, filepath: str) -> None:
         """
-        Export the entire activities database as a csv file.
+        Replace the database with a backup, if it is a valid backup.
+        The current database is backed up first.
         """
-        filename = os.path.join(self.EXTERNALSTORAGE, "spoon-output.csv")
-        self.db.export_database(filename)
+        try:
+            self.backups.restore(filepath)
+        except backup.BackupError as e:
+            Logger.error(f"SpoonCalc: Not restoring backup: {e}")
+            return
+        Logger.info(f"SpoonCalc: Restored backup {filepath}")
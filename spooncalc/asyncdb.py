@@ -0,0 +1,280 @@
+"""
+Await Database queries from asyncio programs, without wrapping every
+call in `run_in_executor` by hand.
+
+Every query runs on a dedicated thread holding a single connection (see
+Database.session), in the order it was submitted. At most `max_pending`
+queries are queued at once: further callers wait (without blocking their
+event loop) until the thread catches up.
+
+Examples
+--------
+>>> async with AsyncDatabase(Database("spooncalc.db")) as db:
+...     logs = await db.get_logs_between_datetimes(start, end)
+...     async for log in db.iter_logs_between_datetimes(start, end):
+...         print(log.name)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import queue
+import threading
+from concurrent.futures import Future
+from datetime import (
+    date,
+    datetime,
+)
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+from spooncalc.dbtools import Database
+from spooncalc.models.activitylog import ActivityLog
+from spooncalc.query import ActivityQuery
+
+# Number of logs fetched per page by the async iterators
+PAGE_SIZE = 500
+
+Job = Tuple[Future, Callable, tuple]
+
+
+class AsyncDatabase:
+    """
+    An asyncio facade of a Database, whose methods return the same results
+    as the Database methods of the same name.
+
+    Cancelling a query that is still queued skips it. Cancelling a read
+    that is already running interrupts it (see sqlite3.Connection.interrupt),
+    whereas a running write always completes, such that it's never left
+    half applied. Change events are published from the connection thread.
+
+    Attributes
+    ----------
+    db : Database
+        the wrapped database
+    max_pending : int
+        the maximum number of queued (or running) queries
+    jobs : queue.Queue
+        the queries to run, in order, each a future, function and arguments
+    thread : threading.Thread
+        the thread running the queries on its connection
+    """
+
+    def __init__(self, db: Database, max_pending: int = 64) -> None:
+        self.db = db
+        self.max_pending = max_pending
+        self.jobs: queue.Queue[Optional[Job]] = queue.Queue()
+        self.slots: Optional[asyncio.Semaphore] = None
+        self.connection = None
+        # The future of the running read, if any, which may be interrupted
+        self.running: Optional[Future] = None
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self.serve, name="spooncalc-db", daemon=True)
+        self.thread.start()
+        self.ready.wait()
+
+    async def __aenter__(self) -> AsyncDatabase:
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, exc_traceback) -> None:
+        await self.close()
+
+    def serve(self) -> None:
+        """Run queued queries on a single connection, until closed"""
+        with self.db.session() as conn:
+            self.connection = conn
+            self.ready.set()
+            while True:
+                job = self.jobs.get()
+                if job is None:
+                    break
+                future, func, args = job
+                # Skip queries cancelled while queued
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    result = func(*args)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+                finally:
+                    with self.lock:
+                        self.running = None
+
+    async def close(self) -> None:
+        """Stop the connection thread, once the queued queries have run"""
+        self.jobs.put(None)
+        await asyncio.get_running_loop().run_in_executor(None, self.thread.join)
+
+    async def run(self, func: Callable, *args: Any, interruptible: bool = False) -> Any:
+        """
+        Run a function of the database on the connection thread, waiting
+        for a free slot in the queue first.
+
+        Parameters
+        ----------
+        func : callable
+            e.g. a Database method, or any function that only queries the
+            database through it
+        args
+            the arguments of `func`
+        interruptible : bool
+            whether `func` only reads, such that it may be interrupted
+            when cancelled while running
+        """
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.max_pending)
+        slots = self.slots
+        await slots.acquire()
+        loop = asyncio.get_running_loop()
+        future: Future = Future()
+
+        def release(_: Future) -> None:
+            # The slot is held until the job is done (or skipped), rather
+            # than until its awaiter is, which may be cancelled first
+            try:
+                loop.call_soon_threadsafe(slots.release)
+            except RuntimeError:
+                pass  # the event loop is closed
+
+        future.add_done_callback(release)
+
+        def call(*args: Any) -> Any:
+            if interruptible:
+                with self.lock:
+                    self.running = future
+            return func(*args)
+
+        self.jobs.put((future, call, args))
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # A queued query is cancelled along with its awaiter, a
+            # running one must be interrupted
+            with self.lock:
+                if self.running is future and self.connection is not None:
+                    self.connection.interrupt()
+            raise
+
+    def query(self) -> ActivityQuery:
+        """Start a query of activity logs, to be fetched by `logs` or `aggregate`"""
+        return self.db.query()
+
+    async def logs(self, query: ActivityQuery) -> List[ActivityLog]:
+        """Fetch the logs of a query (see ActivityQuery.logs)"""
+        return await self.run(query.logs, interruptible=True)
+
+    async def aggregate(
+        self,
+        query: ActivityQuery,
+        function: str,
+        column: str = "id",
+        group_by: Optional[str] = None,
+    ) -> Any:
+        """Aggregate a column of the logs of a query (see ActivityQuery.aggregate)"""
+        return await self.run(query.aggregate, function, column, group_by, interruptible=True)
+
+    async def get_logs_between_datetimes(self, start: datetime, end: datetime) -> List[ActivityLog]:
+        """See Database.get_logs_between_datetimes"""
+        return await self.run(self.db.get_logs_between_datetimes, start, end, interruptible=True)
+
+    async def get_logs_between_offsets(self, start: int, end: int) -> List[ActivityLog]:
+        """See Database.get_logs_between_offsets"""
+        return await self.run(self.db.get_logs_between_offsets, start, end, interruptible=True)
+
+    async def get_logs_page(
+        self,
+        before: Optional[Tuple[datetime, int]] = None,
+        limit: int = 50,
+    ) -> List[ActivityLog]:
+        """See Database.get_logs_page"""
+        return await self.run(self.db.get_logs_page, before, limit, interruptible=True)
+
+    async def get_all_logs(self) -> List[ActivityLog]:
+        """See Database.get_all_logs"""
+        return await self.run(self.db.get_all_logs, interruptible=True)
+
+    async def get_daily_totals(self, start: int, end: int) -> Dict[int, float]:
+        """See Database.get_daily_totals"""
+        return await self.run(self.db.get_daily_totals, start, end, interruptible=True)
+
+    async def daily_breakdown(self, start: int, end: int) -> Dict[str, Dict[str, Dict[int, float]]]:
+        """See Database.daily_breakdown"""
+        return await self.run(self.db.daily_breakdown, start, end, interruptible=True)
+
+    async def get_spoons_by_qualifier(self, start: int, end: int) -> Dict[str, float]:
+        """See Database.get_spoons_by_qualifier"""
+        return await self.run(self.db.get_spoons_by_qualifier, start, end, interruptible=True)
+
+    async def get_rollups(self, level: str, start: date, end: date) -> Dict[str, Dict[str, Dict[date, float]]]:
+        """See Database.get_rollups"""
+        return await self.run(self.db.get_rollups, level, start, end, interruptible=True)
+
+    async def insert_activitylog(self, log: ActivityLog) -> bool:
+        """See Database.insert_activitylog"""
+        return await self.run(self.db.insert_activitylog, log)
+
+    async def insert_activitylogs(self, logs: List[ActivityLog]) -> int:
+        """See Database.insert_activitylogs"""
+        return await self.run(self.db.insert_activitylogs, logs)
+
+    async def delete_entry(self, id: int) -> None:
+        """See Database.delete_entry"""
+        await self.run(self.db.delete_entry, id)
+
+    async def delete_entries(self, ids: List[int]) -> int:
+        """See Database.delete_entries"""
+        return await self.run(self.db.delete_entries, ids)
+
+    async def export_database(self, filename: str) -> None:
+        """See Database.export_database"""
+        await self.run(self.db.export_database, filename)
+
+    async def iter_logs(self, query: ActivityQuery, page_size: int = PAGE_SIZE) -> AsyncIterator[ActivityLog]:
+        """
+        Iterate over the logs of a query, ordered by start and then id, by
+        fetching a page at a time (by keyset pagination). The next page is
+        only fetched once the previous page has been consumed.
+
+        Raises
+        ------
+        ValueError
+            if `query` is already ordered, which would break the keyset
+            pagination
+        """
+        if query.ordering:
+            raise ValueError("Can't iterate over an ordered query, which is always ordered by start and id")
+        query = query.order_by("start", "id").limit(page_size)
+        page_query = query
+        while True:
+            logs = await self.logs(page_query)
+            for log in logs:
+                yield log
+            if len(logs) < page_size:
+                return
+            page_query = query.where(
+                "(start, id) > (?, ?)",
+                logs[-1].start.strftime(self.db.DATETIME_FORMATSTRING),
+                logs[-1].id,
+            )
+
+    def iter_logs_between_datetimes(
+        self,
+        start: datetime,
+        end: datetime,
+        page_size: int = PAGE_SIZE,
+    ) -> AsyncIterator[ActivityLog]:
+        """
+        Iterate over the logs starting between the datetimes [start, end),
+        i.e. those of get_logs_between_datetimes, ordered by start and id
+        """
+        return self.iter_logs(self.db.query().between(start, end), page_size)
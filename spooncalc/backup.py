@@ -0,0 +1,401 @@
+"""
+Back up and restore the activities database with the sqlite3 backup API.
+
+Pages are copied a few at a time, so a backup can run in a background
+thread while the app keeps reading and writing the database. Each backup
+is written to a temporary file and renamed once complete, so a backup
+directory never holds a partial backup under a backup's name.
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import (
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from spooncalc import timeutils
+from spooncalc.dbtools import Database
+from spooncalc.events import BulkImportDone
+
+BACKUP_PREFIX = "spooncalc-backup-"
+BACKUP_SUFFIX = ".db"
+TIMESTAMP_FORMAT = "%Y%m%d-%H%M%S-%f"
+# Number of pages copied per step of a backup
+PAGES_PER_STEP = 64
+
+ProgressCallback = Callable[[float], None]  # called with the fraction copied
+
+
+class BackupError(ValueError):
+    """Raised when a file can't be restored as the activities database"""
+
+
+@dataclass
+class RetentionPolicy:
+    """
+    Which backups to keep when old backups are pruned.
+
+    Attributes
+    ----------
+    keep_last : int
+        the number of most recent backups to keep
+    keep_daily : int
+        the number of days for which the latest backup of the day is kept
+    keep_weekly : int
+        the number of ISO weeks for which the latest backup of the week
+        is kept
+    """
+
+    keep_last: int = 3
+    keep_daily: int = 7
+    keep_weekly: int = 4
+
+    def select(self, timestamps: List[datetime]) -> Set[datetime]:
+        """Get the timestamps of the backups to keep"""
+        timestamps = sorted(timestamps, reverse=True)
+        keep = set(timestamps[: self.keep_last])
+
+        for n_periods, period in (
+            (self.keep_daily, lambda t: t.date()),
+            (self.keep_weekly, lambda t: t.isocalendar()[:2]),
+        ):
+            seen = set()
+            for timestamp in timestamps:
+                if period(timestamp) in seen:
+                    continue
+                if len(seen) == n_periods:
+                    break
+                seen.add(period(timestamp))
+                keep.add(timestamp)
+        return keep
+
+
+def read_only_uri(path: str) -> str:
+    """Get the uri opening a database read-only, escaping any special characters of its path"""
+    return f"{Path(path).absolute().as_uri()}?mode=ro"
+
+
+def copy_file(
+    source: sqlite3.Connection,
+    target_path: str,
+    pages: int = PAGES_PER_STEP,
+    progress: Optional[ProgressCallback] = None,
+    before_rename: Optional[Callable[[sqlite3.Connection], None]] = None,
+) -> None:
+    """
+    Copy an open sqlite3 database to a file, `pages` pages at a time.
+
+    The copy is written next to `target_path` and renamed into place once
+    complete, after calling `before_rename` with its connection, if given.
+    The copy is left in rollback journal mode, such that it's a single file
+    and opening it read-only leaves no write-ahead log behind.
+    """
+
+    def on_step(status: int, remaining: int, total: int) -> None:
+        if progress is not None and total > 0:
+            progress(1 - remaining / total)
+
+    partial_path = target_path + ".partial"
+    target = sqlite3.connect(partial_path)
+    try:
+        source.backup(target, pages=pages, progress=on_step)
+        target.execute("PRAGMA journal_mode = delete")
+        if before_rename is not None:
+            before_rename(target)
+    finally:
+        target.close()
+    os.replace(partial_path, target_path)
+
+
+def get_partitions(conn: sqlite3.Connection) -> List[Tuple[int, str]]:
+    """
+    Get the year and filename of each partition (see Database.archive_year)
+    of a database, none if written before partitions were introduced
+    """
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'partitions'").fetchone() is None:
+        return []
+    return conn.execute("SELECT year, filename FROM partitions ORDER BY year").fetchall()
+
+
+def copy_partitions(partitions: List[Tuple[int, str]], source_path: str, target_path: str) -> Dict[int, str]:
+    """
+    Copy the partition files of the database at `source_path` next to
+    `target_path`, named after it (see Database.PARTITION_FILENAME).
+
+    Returns
+    -------
+    dict(int: str)
+        the filename of each copied partition, by year
+    """
+    filenames = {}
+    for year, filename in partitions:
+        filenames[year] = Database.PARTITION_FILENAME.format(stem=Path(target_path).stem, year=year)
+        source = sqlite3.connect(read_only_uri(os.path.join(os.path.dirname(os.path.abspath(source_path)), filename)), uri=True)
+        try:
+            copy_file(source, os.path.join(os.path.dirname(os.path.abspath(target_path)), filenames[year]))
+        finally:
+            source.close()
+    return filenames
+
+
+def rename_partitions(conn: sqlite3.Connection, filenames: Dict[int, str]) -> None:
+    """Record the filename of each partition of a database, by year (see copy_partitions)"""
+    conn.executemany("UPDATE partitions SET filename = ? WHERE year = ?", [(name, year) for year, name in filenames.items()])
+    conn.commit()
+
+
+def copy_database(
+    source_path: str,
+    target_path: str,
+    pages: int = PAGES_PER_STEP,
+    progress: Optional[ProgressCallback] = None,
+) -> None:
+    """
+    Copy a sqlite3 database, `pages` pages at a time, along with its
+    partition files (see Database.archive_year), which are named after
+    the copy.
+
+    The copy is written next to `target_path` and renamed into place once
+    complete, after its partitions are copied, such that a copy under its
+    name always has its partitions.
+    """
+    source = sqlite3.connect(source_path)
+    try:
+
+        def copy_partitions_of(target: sqlite3.Connection) -> None:
+            # The partitions named by the copy, rather than the source,
+            # which may since have archived another year
+            rename_partitions(target, copy_partitions(get_partitions(target), source_path, target_path))
+
+        copy_file(source, target_path, pages, progress, before_rename=copy_partitions_of)
+    finally:
+        source.close()
+    if progress is not None:
+        progress(1.0)
+
+
+def validate_backup(path: str) -> int:
+    """
+    Check that a file is a backup that can be restored by this version of
+    SpoonCalc.
+
+    Returns
+    -------
+    int
+        the schema version of the backup
+
+    Raises
+    ------
+    BackupError
+        if the file isn't a sqlite3 database holding an activities table,
+        was written by a newer schema version than Database.SCHEMA_VERSION,
+        is a partition file, or is missing any of its partition files
+    """
+    if not os.path.isfile(path):
+        raise BackupError(f"{path} does not exist")
+    try:
+        conn = sqlite3.connect(read_only_uri(path), uri=True)
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            has_activities = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'activities'"
+            ).fetchone()
+            integrity = conn.execute("PRAGMA quick_check").fetchone()[0]
+            partitions = get_partitions(conn)
+            # Partition files hold activities, but no partitions table
+            is_partition = version >= 6 and not conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'partitions'"
+            ).fetchone()
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError as e:
+        raise BackupError(f"{path} is not a SpoonCalc database: {e}") from e
+
+    if not has_activities:
+        raise BackupError(f"{path} holds no activities table")
+    if not 1 <= version <= Database.SCHEMA_VERSION:
+        raise BackupError(f"{path} has unsupported schema version {version}")
+    if integrity != "ok":
+        raise BackupError(f"{path} is corrupt: {integrity}")
+    if is_partition:
+        raise BackupError(f"{path} is the partition of a year, not a database")
+    for year, filename in partitions:
+        if not os.path.isfile(os.path.join(os.path.dirname(os.path.abspath(path)), filename)):
+            raise BackupError(f"{path} is missing its partition of {year}: {filename}")
+    return version
+
+
+class BackupManager:
+    """
+    Takes, prunes and restores rotating backups of a database.
+
+    Attributes
+    ----------
+    db : Database
+        a reference to the database wrapper being backed up
+    directory : str
+        the directory holding the backups
+    policy : RetentionPolicy
+        which backups are kept after each new backup
+    pages : int
+        the number of pages copied per step
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        directory: str,
+        policy: Optional[RetentionPolicy] = None,
+        pages: int = PAGES_PER_STEP,
+    ) -> None:
+        self.db = db
+        self.directory = directory
+        self.policy = policy or RetentionPolicy()
+        self.pages = pages
+        self.lock = threading.Lock()
+
+    def list_backups(self) -> List[Tuple[datetime, str]]:
+        """Get the timestamp and path of every backup, oldest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        backups = []
+        for filename in os.listdir(self.directory):
+            if not (filename.startswith(BACKUP_PREFIX) and filename.endswith(BACKUP_SUFFIX)):
+                continue
+            stamp = filename[len(BACKUP_PREFIX) : -len(BACKUP_SUFFIX)]
+            try:
+                timestamp = datetime.strptime(stamp, TIMESTAMP_FORMAT)
+            except ValueError:
+                continue
+            backups.append((timestamp, os.path.join(self.directory, filename)))
+        return sorted(backups)
+
+    def backup(self, progress: Optional[ProgressCallback] = None) -> str:
+        """
+        Back up the database, then prune old backups.
+
+        Returns
+        -------
+        str
+            the path of the new backup
+        """
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            stamp = timeutils.clock.now().strftime(TIMESTAMP_FORMAT)
+            path = os.path.join(self.directory, f"{BACKUP_PREFIX}{stamp}{BACKUP_SUFFIX}")
+            copy_database(self.db.db_path, path, pages=self.pages, progress=progress)
+            self.prune()
+        return path
+
+    def start_backup(
+        self,
+        progress: Optional[ProgressCallback] = None,
+        on_done: Optional[Callable[[Optional[str], Optional[Exception]], None]] = None,
+    ) -> threading.Thread:
+        """
+        Back up the database in a background thread.
+
+        Both callbacks are called from the background thread. `on_done` is
+        called with the path of the new backup, or the exception raised.
+        """
+
+        def run() -> None:
+            try:
+                path = self.backup(progress)
+            except (OSError, sqlite3.Error) as e:
+                if on_done is not None:
+                    on_done(None, e)
+                return
+            if on_done is not None:
+                on_done(path, None)
+
+        thread = threading.Thread(target=run, name="spooncalc-backup", daemon=True)
+        thread.start()
+        return thread
+
+    def prune(self) -> List[str]:
+        """
+        Delete the backups not selected by the retention policy.
+
+        Returns
+        -------
+        list(str)
+            the paths of the deleted backups
+        """
+        backups = self.list_backups()
+        keep = self.policy.select([timestamp for timestamp, _ in backups])
+        deleted = []
+        for timestamp, path in backups:
+            if timestamp not in keep:
+                for partition_path in self.partition_paths(path):
+                    os.remove(partition_path)
+                os.remove(path)
+                # Left by opening backups taken in write-ahead log mode
+                for sidecar in (path + "-wal", path + "-shm"):
+                    if os.path.isfile(sidecar):
+                        os.remove(sidecar)
+                deleted.append(path)
+        return deleted
+
+    @staticmethod
+    def partition_paths(path: str) -> List[str]:
+        """Get the paths of the existing partition files of a backup"""
+        try:
+            conn = sqlite3.connect(read_only_uri(path), uri=True)
+            try:
+                partitions = get_partitions(conn)
+            finally:
+                conn.close()
+        except sqlite3.DatabaseError:
+            return []
+        paths = [os.path.join(os.path.dirname(os.path.abspath(path)), filename) for _, filename in partitions]
+        return [partition_path for partition_path in paths if os.path.isfile(partition_path)]
+
+    def restore(self, path: str) -> None:
+        """
+        Replace the contents of the database with those of a backup.
+
+        The backup is validated, then copied into the live database through
+        the backup API in a single step (and transaction). Unlike replacing
+        the database file, this is safe while other connections (and the
+        write-ahead log) are open. The partition files of the backup (see
+        Database.archive_year) replace those of the database, whose
+        partitions of other years are removed. The current contents, and
+        partitions, are backed up first, and the schema is updated
+        afterwards if the backup is from an older version.
+
+        Raises
+        ------
+        BackupError
+            if the backup fails validation (see validate_backup)
+        """
+        validate_backup(path)
+        self.backup()
+        with self.lock:
+            source = sqlite3.connect(read_only_uri(path), uri=True)
+            target = sqlite3.connect(self.db.db_path)
+            try:
+                replaced = get_partitions(target)
+                filenames = copy_partitions(get_partitions(source), path, self.db.db_path)
+                source.backup(target)
+                rename_partitions(target, filenames)
+            finally:
+                target.close()
+                source.close()
+            for year, filename in replaced:
+                partition_path = self.db.partition_path(filename)
+                if year not in filenames and os.path.isfile(partition_path):
+                    os.remove(partition_path)
+        self.db.initialize_schema()
+        self.db.publish(BulkImportDone())
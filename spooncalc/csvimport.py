@@ -0,0 +1,259 @@
+"""
+Parse and import csv files previously exported by SpoonCalc.
+
+Large files are split into chunks of whole lines, which are parsed and
+validated in parallel by a pool of processes. The parsed rows are inserted
+by the calling process alone, in file order, such that both the database
+contents and the reported errors are deterministic.
+"""
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import (
+    dataclass,
+    field,
+    fields,
+)
+from datetime import datetime
+from typing import (
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from spooncalc.dbtools import Database
+from spooncalc.models.activitylog import (
+    ActivityLog,
+    clean_param,
+)
+
+# ActivityLog fields read from a csv, in the order of each parsed row tuple
+ROW_FIELDS = [f.name for f in fields(ActivityLog) if f.name != "id"]
+# Files smaller than this are parsed in the calling process
+PARALLEL_MIN_BYTES = 4 * 1024 * 1024
+# Approximate size of the chunks parsed by each process
+CHUNK_BYTES = 4 * 1024 * 1024
+
+Row = Tuple  # the values of ROW_FIELDS, in order
+RowError = Tuple[int, str]  # (line number, message)
+
+
+class CSVError(ValueError):
+    """Raised when a whole csv file can't be read, e.g. if it isn't valid utf-8"""
+
+
+@dataclass
+class ImportResult:
+    """
+    The outcome of importing a csv file
+
+    Attributes
+    ----------
+    inserted : int
+        the number of rows inserted
+    skipped : int
+        the number of valid rows skipped, as duplicates of existing logs
+    errors : list((int, str))
+        the line number and reason of each invalid row, in file order
+    first_start : datetime | None
+        the earliest start of the valid rows, if any
+    last_end : datetime | None
+        the latest end of the valid rows, if any
+    """
+
+    inserted: int = 0
+    skipped: int = 0
+    errors: List[RowError] = field(default_factory=list)
+    first_start: Optional[datetime] = None
+    last_end: Optional[datetime] = None
+
+
+def parse_row(colnames: List[str], csv_row: str) -> ActivityLog:
+    """
+    Parse a raw csv row into an activity log.
+
+    Parameters
+    ----------
+    colnames : list(str)
+        the column names, from the csv header
+    csv_row : str
+        a raw csv row from a previous database export
+
+    Raises
+    ------
+    ValueError
+        if the row is not a valid activity log
+    """
+    values = csv_row.strip().split(",")
+    if len(values) != len(colnames):
+        raise ValueError(f"expected {len(colnames)} values, found {len(values)}")
+
+    # Collect values applicable to ActivityLog class
+    activitylog_params = {k: clean_param(v) for k, v in zip(colnames, values) if k in ROW_FIELDS}
+    for time_field in ("start", "end"):
+        if not isinstance(activitylog_params.get(time_field), datetime):
+            raise ValueError(f"invalid {time_field} time")
+
+    return ActivityLog(**activitylog_params)  # type: ignore
+
+
+def parse_chunk(path: str, start: int, end: int, colnames: List[str]) -> Tuple[List[Row], List[RowError], int]:
+    """
+    Parse the lines of a csv file between byte offsets `start` and `end`.
+
+    Parameters
+    ----------
+    path : str
+        the path to the csv file
+    start, end : int
+        byte offsets of the chunk, both at the start of a line
+    colnames : list(str)
+        the column names, from the csv header
+
+    Returns
+    -------
+    rows : list(tuple)
+        the values of ROW_FIELDS of each valid row
+    errors : list((int, str))
+        the line number (within the chunk, from 0) and reason of each
+        invalid row
+    n_lines : int
+        the number of lines in the chunk
+
+    Raises
+    ------
+    CSVError
+        if the chunk isn't valid utf-8
+    """
+    with open(path, "rb") as fp:
+        fp.seek(start)
+        data = fp.read(end - start)
+    try:
+        lines = data.decode("utf-8").split("\n")
+    except UnicodeDecodeError as e:
+        raise CSVError(f"{path} is not valid utf-8 (at byte {start + e.start})") from e
+    if lines[-1] == "":
+        lines.pop()  # the chunk ends with a newline
+
+    rows = []
+    errors = []
+    for i, line in enumerate(lines):
+        if not line.strip():
+            continue
+        try:
+            log = parse_row(colnames, line)
+        except (ValueError, TypeError) as e:
+            errors.append((i, str(e)))
+            continue
+        rows.append(tuple(getattr(log, f) for f in ROW_FIELDS))
+    return rows, errors, len(lines)
+
+
+def chunk_ranges(path: str, start: int, chunk_bytes: int = CHUNK_BYTES) -> List[Tuple[int, int]]:
+    """
+    Split a file from byte offset `start` into ranges of roughly
+    `chunk_bytes` bytes, each ending at the end of a line.
+    """
+    size = os.path.getsize(path)
+    ranges = []
+    with open(path, "rb") as fp:
+        while start < size:
+            fp.seek(min(start + chunk_bytes, size))
+            fp.readline()  # advance to the start of the next line
+            end = min(fp.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def read_csv(path: str, workers: Optional[int] = None) -> Iterator[Tuple[List[ActivityLog], List[RowError]]]:
+    """
+    Parse a csv file exported by SpoonCalc, in batches of rows.
+
+    Parameters
+    ----------
+    path : str
+        the path to the csv file
+    workers : int | None
+        the number of processes used to parse large files, by default
+        one per cpu. With 1, everything is parsed in the calling process.
+
+    Yields
+    ------
+    logs : list(ActivityLog)
+        the valid rows of a batch, in file order
+    errors : list((int, str))
+        the (1-based) line number and reason of each invalid row of a batch
+
+    Raises
+    ------
+    CSVError
+        if the file isn't valid utf-8, which may be raised after batches
+        have been yielded
+    """
+    with open(path, "rb") as fp:
+        header = fp.readline()
+        header_end = fp.tell()
+    try:
+        colnames = header.decode("utf-8").strip().split(",")
+    except UnicodeDecodeError as e:
+        raise CSVError(f"{path} is not valid utf-8 (at byte {e.start})") from e
+
+    ranges = chunk_ranges(path, header_end)
+    workers = workers or os.cpu_count() or 1
+    args = ([path] * len(ranges), [r[0] for r in ranges], [r[1] for r in ranges], [colnames] * len(ranges))
+
+    if workers > 1 and os.path.getsize(path) >= PARALLEL_MIN_BYTES:
+        executor: Optional[ProcessPoolExecutor] = ProcessPoolExecutor(max_workers=workers)
+        results = executor.map(parse_chunk, *args)
+    else:
+        executor = None
+        results = map(parse_chunk, *args)
+
+    try:
+        first_line = 2  # line 1 is the header
+        for rows, errors, n_lines in results:
+            logs = [ActivityLog(**dict(zip(ROW_FIELDS, row))) for row in rows]
+            yield logs, [(first_line + i, message) for i, message in errors]
+            first_line += n_lines
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def import_csv(db: Database, path: str, workers: Optional[int] = None) -> ImportResult:
+    """
+    Import a csv file exported by SpoonCalc in a single transaction,
+    skipping duplicates of existing logs.
+
+    Parameters
+    ----------
+    db : Database
+        a reference to a database wrapper
+    path : str
+        the path to the csv file
+    workers : int | None
+        the number of processes used to parse large files (see read_csv)
+
+    Raises
+    ------
+    CSVError
+        if the file can't be read (see read_csv), in which case no log is
+        inserted
+    """
+    result = ImportResult()
+    with db.batch():
+        for logs, errors in read_csv(path, workers):
+            inserted = db.insert_activitylogs(logs)
+            result.inserted += inserted
+            result.skipped += len(logs) - inserted
+            result.errors += errors
+            if logs:
+                first_start = min(log.start for log in logs)
+                last_end = max(log.end for log in logs)
+                result.first_start = first_start if result.first_start is None else min(result.first_start, first_start)
+                result.last_end = last_end if result.last_end is None else max(result.last_end, last_end)
+    return result
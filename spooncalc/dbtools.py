@@ -4,37 +4,123 @@ A collection of helper functions for interacting with database
 
 from __future__ import annotations
 
+import heapq
+import itertools
+import json
+import os
 import sqlite3
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
 from datetime import (
+    date,
     datetime,
     timedelta,
 )
+from pathlib import Path
 from sqlite3 import Cursor as SQLCursor
 from typing import (
     Any,
+    Callable,
+    Dict,
+    Iterator,
     List,
+    Optional,
+    Set,
+    Tuple,
 )
 
 from spooncalc import timeutils
+from spooncalc.events import (
+    BulkImportDone,
+    EventBus,
+    LogInserted,
+    LogsDeleted,
+)
 from spooncalc.models.activitylog import (
+    PHYSLOAD_BOOST_SPOON_VALUE,
+    QUALIFIER_BITS,
+    QUALIFIERS,
     ActivityLog,
     clean_param,
+    qualifier_bitmask,
+    qualifiers_from_bitmask,
 )
+from spooncalc.models.namestats import NameStats
+from spooncalc.query import ActivityQuery
+
+
+def connect(
+    db_path: str,
+    pragmas: Optional[Dict[str, Any]] = None,
+    read_only: bool = False,
+) -> sqlite3.Connection:
+    """
+    Open a connection to a sqlite3 database, applying per-connection pragmas.
+    A read-only connection fails to open if the database does not exist.
+    """
+    if read_only:
+        conn = sqlite3.connect(f"{Path(db_path).absolute().as_uri()}?mode=ro", uri=True)
+    else:
+        # Uri filenames are enabled such that partitions are attached by
+        # uri, see Database.attach_partitions
+        conn = sqlite3.connect(db_path, uri=True)
+    for pragma, value in (pragmas or {}).items():
+        conn.execute(f"PRAGMA {pragma} = {value}")
+    conn.create_function("has_qualifier", 2, has_qualifier, deterministic=True)
+    return conn
+
+
+def has_qualifier(mask: Optional[int], qual: str) -> Optional[int]:
+    """
+    SQL function of whether a qualifier bitmask includes a qualifier, for
+    ad hoc queries, e.g. `SELECT name FROM activities WHERE
+    has_qualifier(qualifiers, 'rest')`.
+    """
+    if mask is None or qual not in QUALIFIER_BITS:
+        return None
+    return int(mask & QUALIFIER_BITS[qual] != 0)
 
 
 class Cursor:
     """A context manager for connecting to sqlite3 databases"""
 
-    def __init__(self, db_path: str) -> None:
-        """Initialize the context manager"""
+    def __init__(
+        self,
+        db_path: str,
+        pragmas: Optional[Dict[str, Any]] = None,
+        connection: Optional[sqlite3.Connection] = None,
+        commit: bool = True,
+        on_commit: Optional[Callable[[bool], None]] = None,
+    ) -> None:
+        """
+        Initialize the context manager
+
+        Parameters
+        ----------
+        db_path : str
+            a path to the database file
+        pragmas : dict(str: Any) | None
+            pragmas applied to a newly built connection, e.g. synchronous
+        connection : sqlite3.Connection | None
+            an already open connection to reuse, which is left open on exit
+        commit : bool
+            whether to commit upon exiting, false within batched commits
+        on_commit : callable | None
+            called after committing, with whether the commit succeeded
+        """
         self.db_path = db_path
+        self.pragmas = pragmas
+        self.shared_conn = connection
+        self.commit = commit
+        self.on_commit = on_commit
 
     def __enter__(self) -> SQLCursor:
         """
         Upon entering the context manager, build the connection and return
         a cursor
         """
-        self.conn = sqlite3.connect(self.db_path)
+        self.conn = self.shared_conn or connect(self.db_path, self.pragmas)
         self.cursor = self.conn.cursor()
         return self.cursor
 
@@ -43,8 +129,19 @@ class Cursor:
         Upon exiting the context manager, commmit the changes and close
         the connection
         """
-        self.conn.commit()
-        self.conn.close()
+        try:
+            if self.commit:
+                try:
+                    self.conn.commit()
+                except sqlite3.Error:
+                    if self.on_commit is not None:
+                        self.on_commit(False)
+                    raise
+                if self.on_commit is not None:
+                    self.on_commit(True)
+        finally:
+            if self.shared_conn is None:
+                self.conn.close()
 
 
 class Database:
@@ -69,8 +166,69 @@ class Database:
         "boost",
         "misc",
     )
-
-    def __init__(self, db_path: str = "spooncalc.db") -> None:
+    # Columns stored as they are, qualifiers being packed into a bitmask
+    # column instead (see activitylog.qualifier_bitmask)
+    PLAIN_COLNAMES = tuple(col for col in ACTIVITIES_COLNAMES if col not in QUALIFIERS)
+    # Columns from which an ActivityLog is read (see row_to_activitylog)
+    LOG_COLNAMES = ("id",) + PLAIN_COLNAMES + ("qualifiers",)
+    # SQL expression of whether a log has the qualifier of a bit, which
+    # also matches the partial index of the qualifier's logs
+    QUALIFIER_SQL = "(qualifiers & {bit})"
+    # Each rollup row holds spoons and hours for the total and every qualifier
+    ROLLUP_SERIES = ["total"] + QUALIFIERS
+    ROLLUP_YMODES = ("spoons", "hours")
+    # SQL expressions equivalent to ActivityLog.hours and ActivityLog.spoons.
+    # Durations are taken in whole seconds, as stored, since differences of
+    # julianday are inexact
+    HOURS_SQL = "((strftime('%s', end) - strftime('%s', start)) / 3600.0)"
+    SPOONS_SQL = (
+        f"({HOURS_SQL} * (cogload + physload"
+        f" + (CASE WHEN qualifiers & {QUALIFIER_BITS['boost']} THEN {PHYSLOAD_BOOST_SPOON_VALUE} ELSE 0 END)))"
+    )
+    # SQL expression of the (whole) minutes since 1970-01-01 of a datetime
+    # column, as stored in the interval index
+    MINUTES_SQL = "CAST(strftime('%s', {column}) AS INTEGER) / 60"
+    # Full-text queries shorter than this can't use the trigram index
+    SEARCH_MIN_LENGTH = 3
+    # The maximum number of parameters of a query (999 before sqlite 3.32)
+    MAX_PARAMS = 999
+
+    SYNCHRONOUS_LEVELS = ("off", "normal", "full", "extra")
+    # SQL expression equivalent to timeutils.day_index(start), for a given
+    # day boundary (in hours)
+    DAY_INDEX_SQL = "CAST(julianday(date(start, '-{boundary} hours')) - julianday('1970-01-01') AS INTEGER)"
+
+    # Columns of the activities table of a year partition (see archive_year)
+    PARTITION_COLNAMES = LOG_COLNAMES + ("content_hash", "day")
+    # Partition files are named after the database file and their year,
+    # e.g. spooncalc-2021.db
+    PARTITION_FILENAME = "{stem}-{year}.db"
+    # The maximum number of databases attached to a connection at once (the
+    # default SQLITE_MAX_ATTACHED, which can't be raised at runtime)
+    MAX_ATTACHED = 10
+
+    # Unique suffixes of the temporary tables of partitions' logs (see activities_source)
+    temp_table_ids = itertools.count()
+
+    # Stored as `PRAGMA user_version`, e.g. to validate backups on restore
+    SCHEMA_VERSION = 6
+    # Per-connection pragmas of read-only (analytics) databases: pages are
+    # read from a memory map of the file rather than copied into the page
+    # cache, and a larger cache holds everything else (e.g. indexes)
+    READ_ONLY_PRAGMAS = {
+        "query_only": 1,
+        "mmap_size": 1024 * 1024 * 1024,
+        "cache_size": -64 * 1024,  # in KiB
+    }
+
+    def __init__(
+        self,
+        db_path: str = "spooncalc.db",
+        journal_mode: str = "wal",
+        synchronous: str = "normal",
+        checkpoint_pages: int = 1000,
+        read_only: bool = False,
+    ) -> None:
         """
         Initialize a Database object
 
@@ -78,12 +236,189 @@ class Database:
         ----------
         db_path : str
             a path to the database file. The file may not exist.
+        journal_mode : str
+            the sqlite3 journal mode. In "wal" mode readers (e.g. plots)
+            are not blocked while an import is writing.
+        synchronous : str {"off", "normal", "full", "extra"}
+            the durability of each commit. In "wal" mode "normal" only
+            risks losing the latest commits on power loss, never corruption.
+        checkpoint_pages : int
+            the size (in pages) the write-ahead log may grow to before
+            it is automatically checkpointed into the database file
+        read_only : bool
+            whether to only ever read from the database (see `reader`). The
+            database must already have been initialized by a writer.
         """
+        if synchronous not in self.SYNCHRONOUS_LEVELS:
+            raise ValueError(f"Unknown synchronous level: {synchronous}")
         self.db_path = db_path
+        self.read_only = read_only
+        # Whether the activities table still has a text column per qualifier
+        self.legacy_qualifiers = False
+        # Connections of open batches (or sessions), one per thread
+        self.local = threading.local()
+        # Change events, published once each change is committed
+        self.events = EventBus()
+        if read_only:
+            self.pragmas = dict(self.READ_ONLY_PRAGMAS)
+            self.search_indexed = bool(
+                self.submit_query("SELECT name FROM sqlite_master WHERE name = 'activities_fts'")
+            )
+            self.interval_indexed = bool(
+                self.submit_query("SELECT name FROM sqlite_master WHERE name = 'activity_intervals'")
+            )
+            return
+
+        self.pragmas = {
+            "synchronous": synchronous,
+            "wal_autocheckpoint": checkpoint_pages,
+        }
+        self.submit_query(f"PRAGMA journal_mode = {journal_mode}")
+        self.initialize_schema()
+
+    def reader(self) -> Database:
+        """
+        Get a read-only Database of the same file, for analytics (e.g.
+        plots). Its connections are memory-mapped and kept open, one per
+        thread, such that repeated queries are served from mapped pages
+        and a warm cache. In "wal" mode, it never blocks (nor is blocked
+        by) this Database.
+        """
+        reader = Database(self.db_path, read_only=True)
+        # Subscribers of the reader are notified of this Database's changes
+        reader.events = self.events
+        return reader
+
+    def initialize_schema(self) -> None:
+        """
+        Create (or update to SCHEMA_VERSION) all tables and indexes, and
+        populate any derived tables which are missing.
+        """
         self.initialize_database()
         self.add_missing_columns()
+        self.initialize_qualifiers()
+        self.initialize_content_hashes()
+        self.initialize_partitions()
+        self.initialize_rollups()
+        self.initialize_day_index()
+        self.initialize_qualifier_indexes()
+        self.initialize_search_index()
+        self.initialize_interval_index()
+        self.initialize_name_stats()
+        self.initialize_changes()
+        self.submit_query(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+
+    def cursor(self) -> Cursor:
+        """
+        Get a cursor context manager, which shares the connection of any
+        batch (or session) open in the current thread.
+        """
+        conn = getattr(self.local, "connection", None)
+        if conn is None and self.read_only:
+            # Read-only connections are cheap to keep, and costly to rebuild
+            conn = self.local.connection = connect(self.db_path, self.pragmas, read_only=True)
+            self.local.batch_depth = 0
+        if conn is None:
+            return Cursor(self.db_path, pragmas=self.pragmas, on_commit=self.finish_partition_writes)
+        return Cursor(
+            self.db_path,
+            connection=conn,
+            commit=self.local.batch_depth == 0,
+            on_commit=self.finish_partition_writes,
+        )
 
-    def submit_query(self, query_text) -> List[Any]:
+    @contextmanager
+    def session(self) -> Iterator[sqlite3.Connection]:
+        """
+        Reuse a single connection for all queries in the current thread
+        within this context, rather than connecting for every query.
+        Every query is still committed immediately.
+        """
+        if getattr(self.local, "connection", None) is not None:
+            yield self.local.connection
+            return
+
+        self.local.connection = connect(self.db_path, self.pragmas, read_only=self.read_only)
+        self.local.batch_depth = 0
+        try:
+            yield self.local.connection
+        finally:
+            self.local.connection.close()
+            self.local.connection = None
+
+    @contextmanager
+    def batch(self) -> Iterator[sqlite3.Connection]:
+        """
+        Commit all queries in the current thread within this context as a
+        single transaction, e.g. for bulk imports. This avoids paying for
+        a commit (and fsync) per insert.
+
+        Batches may be nested, in which case only the outermost commits.
+        If an exception is raised, the whole batch is rolled back.
+        The write-ahead log is checkpointed after the outermost batch.
+
+        Examples
+        --------
+        >>> with db.batch():
+        ...     for log in logs:
+        ...         db.insert_activitylog_if_unique(log)
+        """
+        with self.session() as conn:
+            if self.local.batch_depth == 0:
+                self.local.batch_changes = BulkImportDone()
+            self.local.batch_depth += 1
+            try:
+                yield conn
+            except BaseException:
+                self.local.batch_depth -= 1
+                if self.local.batch_depth == 0:
+                    conn.rollback()
+                    self.finish_partition_writes(False)
+                raise
+            self.local.batch_depth -= 1
+            if self.local.batch_depth == 0:
+                try:
+                    conn.commit()
+                except sqlite3.Error:
+                    self.finish_partition_writes(False)
+                    raise
+                self.finish_partition_writes(True)
+                self.checkpoint()
+                if self.local.batch_changes != BulkImportDone():
+                    self.events.publish(self.local.batch_changes)
+
+    def publish(self, event: Any) -> None:
+        """
+        Publish a change event, which must already be committed. Within a
+        batch, the events of individual logs are instead summarized by a
+        single BulkImportDone, published once the batch commits.
+        """
+        if getattr(self.local, "batch_depth", 0) == 0:
+            self.events.publish(event)
+            return
+
+        changes = self.local.batch_changes
+        if isinstance(event, LogInserted):
+            self.local.batch_changes = BulkImportDone(changes.inserted + 1, changes.deleted)
+        elif isinstance(event, LogsDeleted):
+            self.local.batch_changes = BulkImportDone(changes.inserted, changes.deleted + len(event.ids))
+        elif isinstance(event, BulkImportDone):
+            self.local.batch_changes = BulkImportDone(
+                changes.inserted + event.inserted, changes.deleted + event.deleted
+            )
+
+    def checkpoint(self, mode: str = "passive") -> None:
+        """
+        Copy the contents of the write-ahead log into the database file.
+
+        Parameters
+        ----------
+        mode : str {"passive", "full", "restart", "truncate"}
+            a "passive" checkpoint never waits for readers or writers
+        """
+        self.submit_query(f"PRAGMA wal_checkpoint({mode})")
+
+    def submit_query(self, query_text, params: Tuple | Dict[str, Any] = ()) -> List[Any]:
         """
         A helper function for fetching results of a query
 
@@ -91,6 +426,8 @@ class Database:
         ----------
         query_text : str
             A complete sqlite3 request
+        params : tuple | dict
+            the values of any placeholders in `query_text`
 
         Returns
         -------
@@ -101,12 +438,24 @@ class Database:
             to the selected columns
         """
 
-        with Cursor(self.db_path) as c:
-            c.execute(query_text)
+        with self.cursor() as c:
+            c.execute(query_text, params)
             contents = c.fetchall()
 
         return contents
 
+    def query(self) -> ActivityQuery:
+        """
+        Start a query of activity logs, to be filtered and fetched (see
+        ActivityQuery)
+
+        Examples
+        --------
+        >>> db.query().between_offsets(-7, 0).with_qualifiers("social").aggregate("total", "spoons")
+        12.5
+        """
+        return ActivityQuery(self)
+
     def get_logs_from_day(
         self,
         day_offset: int,
@@ -146,9 +495,8 @@ class Database:
         """
         Get all logs between day offsets [start, end).
 
-        This is a convenience wrapper of get_logs_between_datetimes,
-        avoiding usage of specific datetimes, when standard day boundaries
-        suffice.
+        Logs are matched by the (indexed) day index of their start, so each
+        log belongs to exactly one day.
 
         Note that the boundary time between adjacent days is not necessarily
         midnight, and is set by timeutils.DAY_BOUNDARY (currently 3am).
@@ -174,13 +522,21 @@ class Database:
             start=-1, end=1: all logs from yesterday and today
         """
 
-        start_datetime = timeutils.datetime_from_offset(start)
-        end_datetime = timeutils.datetime_from_offset(end)
-        logs = self.get_logs_between_datetimes(
-            start_datetime,
-            end_datetime,
-        )
-        return logs
+        colnames = list(self.LOG_COLNAMES)
+        with timeutils.clock.frozen():
+            params = (timeutils.day_index_from_offset(start), timeutils.day_index_from_offset(end))
+        with self.routed_cursor(params[0], params[1] - 1) as (c, activities):
+            c.execute(
+                f"""
+                SELECT {', '.join(colnames)}
+                FROM {activities}
+                WHERE day >= ? AND day < ?
+            """,
+                params,
+            )
+            contents = c.fetchall()
+
+        return [self.row_to_activitylog(colnames, entry) for entry in contents]
 
     def get_logs_between_datetimes(
         self,
@@ -188,14 +544,14 @@ class Database:
         end: datetime,
     ) -> List[ActivityLog]:
         """
-        Get all logs between the datetimes `start` and `end`.
+        Get all logs starting between the datetimes [`start`, `end`).
 
         Parameters
         ----------
         start : datetime
-            the lower limit date-time of desired range
+            the (inclusive) lower limit date-time of desired range
         end : datetime
-            the upper limit date-time of desired range
+            the (exclusive) upper limit date-time of desired range
 
         Returns
         -------
@@ -205,25 +561,108 @@ class Database:
             that row.
         """
 
-        colnames = ["id"] + list(self.ACTIVITIES_COLNAMES)
+        colnames = list(self.LOG_COLNAMES)
+
+        params = (start.strftime(self.DATETIME_FORMATSTRING), end.strftime(self.DATETIME_FORMATSTRING))
+        with self.routed_cursor(timeutils.day_index(start), timeutils.day_index(end)) as (c, activities):
+            c.execute(
+                f"""
+                SELECT {', '.join(colnames)}
+                FROM {activities}
+                WHERE start >= ? AND start < ?
+            """,
+                params,
+            )
+            contents = c.fetchall()
 
-        start_date_str = start.strftime(self.DATETIME_FORMATSTRING)
-        end_date_str = end.strftime(self.DATETIME_FORMATSTRING)
+        return [self.row_to_activitylog(colnames, entry) for entry in contents]
 
+    def get_logs_page(
+        self,
+        before: Optional[Tuple[datetime, int]] = None,
+        limit: int = 50,
+    ) -> List[ActivityLog]:
+        """
+        Get a page of logs, latest first, by keyset pagination.
+
+        Unlike an OFFSET, the cost of fetching a page doesn't grow with
+        the number of pages already fetched, and pages stay consistent when
+        logs are inserted or deleted between fetches.
+
+        Parameters
+        ----------
+        before : (datetime, int) | None
+            the start and id of the last log of the previous page, or None
+            for the first page
+        limit : int
+            the maximum number of logs in the page
+
+        Returns
+        -------
+        list(ActivityLog)
+            the logs, ordered by start and then id, descending
+        """
+        colnames = list(self.LOG_COLNAMES)
+        condition = ""
+        params: List[Any] = []
+        if before is not None:
+            condition = "WHERE (start, id) < (?, ?)"
+            params = [before[0].strftime(self.DATETIME_FORMATSTRING), before[1]]
+
+        params.append(limit)
         query_text = f"""
             SELECT {', '.join(colnames)}
             FROM activities
-            WHERE start BETWEEN "{start_date_str}" and "{end_date_str}"
+            {condition}
+            ORDER BY start DESC, id DESC
+            LIMIT ?
         """
+
+        with self.cursor() as c:
+            c.execute(query_text, params)
+            logs = [self.row_to_activitylog(colnames, entry) for entry in c.fetchall()]
+            c.execute(
+                "SELECT filename, last_day FROM partitions WHERE first_day <= COALESCE(?, first_day) ORDER BY year DESC",
+                (timeutils.day_index(before[0]) if before is not None else None,),
+            )
+            partitions = c.fetchall()
+
+        # Only pages reaching the days of partitions (see archive_year) are
+        # also fetched from them, newest first, each opened on its own
+        for filename, last_day in partitions:
+            if len(logs) == limit and timeutils.day_index(logs[-1].start) > last_day:
+                break
+            contents = self.submit_partition_query(filename, query_text, tuple(params))
+            logs += [self.row_to_activitylog(colnames, entry) for entry in contents]
+            logs = sorted(logs, key=lambda log: (log.start, log.id), reverse=True)[:limit]
+        return logs
+
+    def get_all_logs(self) -> List[ActivityLog]:
+        """Get every log in the database, including those of every partition (see archive_year)"""
+        colnames = list(self.LOG_COLNAMES)
+        query_text = f"SELECT {', '.join(colnames)} FROM activities"
         contents = self.submit_query(query_text)
+        for _, filename in self.submit_query("SELECT year, filename FROM partitions ORDER BY year"):
+            contents += self.submit_partition_query(filename, query_text)
+        return [self.row_to_activitylog(colnames, entry) for entry in contents]
 
-        logs = []
-        for entry in contents:
-            params = map(clean_param, entry)
-            log_pars = {k: v for k, v in zip(colnames, params) if k != "duration"}
-            logs.append(ActivityLog(**log_pars))  # type: ignore
+    @staticmethod
+    def row_to_activitylog(colnames: List[str], entry: tuple) -> ActivityLog:
+        """
+        Build an ActivityLog from a raw database row.
 
-        return logs
+        Parameters
+        ----------
+        colnames : list(str)
+            the names of the selected columns, in order
+        entry : tuple
+            the raw row, as returned by sqlite3
+        """
+        params = map(clean_param, entry)
+        log_pars = {k: v for k, v in zip(colnames, params) if k != "duration"}
+        if "qualifiers" in log_pars:
+            log_pars.update(qualifiers_from_bitmask(log_pars.pop("qualifiers")))
+        return ActivityLog(**log_pars)  # type: ignore
 
     def delete_entry(self, id: int) -> None:
         """
@@ -235,11 +674,125 @@ class Database:
             an id corresponding to the database entry to be deleted
         """
 
-        query_text = f"""
-            DELETE FROM activities
-            WHERE id = {id};
+        self.delete_entries([id])
+
+    def delete_entries(self, ids: List[int]) -> int:
         """
-        self.submit_query(query_text)
+        Delete every entry matching `ids` in a single transaction. Derived
+        tables are updated once for all deleted logs, and a single
+        LogsDeleted event is published.
+
+        Parameters
+        ----------
+        ids : list(int)
+            ids corresponding to the database entries to be deleted
+
+        Returns
+        -------
+        int
+            the number of deleted entries
+        """
+
+        colnames = list(self.LOG_COLNAMES)
+        logs: List[ActivityLog] = []
+        with self.cursor() as c:
+            # Stay within the limit on parameters of older sqlite3 versions
+            for i in range(0, len(ids), self.MAX_PARAMS):
+                chunk = list(ids[i : i + self.MAX_PARAMS])
+                placeholders = ", ".join("?" for _ in chunk)
+                c.execute(f"SELECT {', '.join(colnames)} FROM activities WHERE id IN ({placeholders})", chunk)
+                logs += [self.row_to_activitylog(colnames, entry) for entry in c.fetchall()]
+                c.execute(f"DELETE FROM activities WHERE id IN ({placeholders})", chunk)
+            missing = set(ids) - {log.id for log in logs}
+            if missing:
+                logs += self.delete_archived_entries(c, list(missing))
+            self.update_derived_tables(c, logs, sign=-1)
+
+        if logs:
+            self.publish(LogsDeleted([log.id for log in logs], logs))  # type: ignore
+        return len(logs)
+
+    def delete_archived_entries(self, c: SQLCursor, ids: List[int]) -> List[ActivityLog]:
+        """
+        Delete the entries matching `ids` from the partitions holding them
+        (see archive_year), without updating derived tables.
+
+        Only the partitions holding any of `ids` are attached, within the
+        transaction of `c`. Any beyond the limit on attached databases (see
+        MAX_ATTACHED) are instead written through their own connections,
+        which are only committed once the transaction of `c` commits (see
+        finish_partition_writes), and rolled back if it fails.
+
+        Returns
+        -------
+        list(ActivityLog)
+            the deleted logs
+        """
+        colnames = list(self.LOG_COLNAMES)
+        holders = []
+        for year, filename in self.get_partitions(c):
+            held: List[int] = []
+            for i in range(0, len(ids), self.MAX_PARAMS):
+                chunk = tuple(ids[i : i + self.MAX_PARAMS])
+                query_text = f"SELECT id FROM activities WHERE id IN ({', '.join('?' for _ in chunk)})"
+                held += [row[0] for row in self.submit_partition_query(filename, query_text, chunk)]
+            if held:
+                holders.append((year, filename, held))
+
+        logs: List[ActivityLog] = []
+
+        def delete(cursor: SQLCursor, table: str, year: int, held: List[int]) -> None:
+            for i in range(0, len(held), self.MAX_PARAMS):
+                chunk = held[i : i + self.MAX_PARAMS]
+                placeholders = ", ".join("?" for _ in chunk)
+                cursor.execute(f"SELECT {', '.join(colnames)}, content_hash FROM {table} WHERE id IN ({placeholders})", chunk)
+                entries = cursor.fetchall()
+                logs.extend(self.row_to_activitylog(colnames, entry[:-1]) for entry in entries)
+                cursor.execute(f"DELETE FROM {table} WHERE id IN ({placeholders})", chunk)
+                self.unindex_archived_logs(c, [(entry[0], entry[colnames.index("name")]) for entry in entries])
+                c.executemany("DELETE FROM archived_hashes WHERE content_hash = ?", [entry[-1:] for entry in entries])
+                c.execute("UPDATE partitions SET n_logs = n_logs - ? WHERE year = ?", (len(entries), year))
+
+        attached = self.attached_databases(c)
+        n_attachable = self.MAX_ATTACHED - len(attached)
+        attachable = [holder for holder in holders if f"y{holder[0]}" in attached]
+        for holder in holders:
+            if f"y{holder[0]}" not in attached and n_attachable > 0:
+                attachable.append(holder)
+                n_attachable -= 1
+        aliases = self.attach_partitions(c, [(year, filename) for year, filename, _ in attachable])
+        try:
+            for year, _, held in attachable:
+                delete(c, f"y{year}.activities", year, held)
+        finally:
+            self.detach_partitions(c, aliases)
+
+        for holder in holders:
+            if holder in attachable:
+                continue
+            year, filename, held = holder
+            conn = self.connect_partition(filename)
+            self.local.partition_writes = getattr(self.local, "partition_writes", []) + [conn]
+            delete(conn.cursor(), "activities", year, held)
+        return logs
+
+    def finish_partition_writes(self, committed: bool) -> None:
+        """
+        Commit, or roll back if the main transaction didn't commit, the
+        writes of the current thread to partitions which couldn't be
+        attached to it (see delete_archived_entries), and close their
+        connections.
+        """
+        conns = getattr(self.local, "partition_writes", [])
+        self.local.partition_writes = []
+        for conn in conns:
+            try:
+                if committed:
+                    conn.commit()
+                else:
+                    conn.rollback()
+            finally:
+                conn.close()
 
     def get_latest_endtime(self) -> datetime | None:
         """
@@ -285,37 +838,74 @@ class Database:
             start of day.
         """
 
-        datetime_str = timeutils.datetime_from_offset(day_offset).strftime(self.DATETIME_FORMATSTRING)
-
-        query_text = f"""
-            SELECT MIN (start) FROM activities
-            WHERE start >= "{datetime_str}"
-        """
-        contents = self.submit_query(query_text)
-        earliest_start = contents[0][0]
+        day = timeutils.day_index_from_offset(day_offset)
+        with self.routed_cursor(day) as (c, activities):
+            c.execute(f"SELECT MIN (start) FROM {activities} WHERE day >= ?", (day,))
+            earliest_start = c.fetchone()[0]
 
         if earliest_start:
             return datetime.strptime(earliest_start, self.DATETIME_FORMATSTRING)
 
         # If nothing in database, return start of target day
-        today_start = datetime.now().replace(hour=timeutils.DAY_BOUNDARY, minute=0, second=0, microsecond=0)
-        target_day_start = today_start + timedelta(days=day_offset)
-        return target_day_start
+        return timeutils.datetime_from_offset(day_offset)
 
     def initialize_database(self) -> None:
         # Dynamically generate column names
-        col_props = ", ".join([f"{col} text NOT NULL" for col in self.ACTIVITIES_COLNAMES])
+        col_props = ", ".join([f"{col} text NOT NULL" for col in self.PLAIN_COLNAMES])
 
         query_text = f"""
             CREATE TABLE if not exists activities(
                 id integer PRIMARY KEY,
-                {col_props}
+                {col_props},
+                qualifiers integer NOT NULL DEFAULT 0
         );
         """
         self.submit_query(query_text)
+        # Pages of logs are fetched in (start, id) order, see get_logs_page
+        self.submit_query("CREATE INDEX if not exists activities_start ON activities(start)")
+
+    def initialize_qualifiers(self) -> None:
+        """
+        Pack the qualifier columns of a database written by older versions
+        into the `qualifiers` bitmask column.
+
+        The qualifier columns are then dropped, if the sqlite3 library
+        supports it (3.35 and later). Otherwise they are kept, and still
+        written alongside the bitmask.
+        """
+        if "qualifiers" not in self.get_colnames():
+            packed = " | ".join(
+                f"(CASE WHEN {qual} = 'True' THEN {bit} ELSE 0 END)" for qual, bit in QUALIFIER_BITS.items()
+            )
+            with self.batch() as conn:
+                # sqlite3 doesn't implicitly begin a transaction before DDL,
+                # so begin one explicitly: if the column were added but not
+                # filled, the qualifiers would never be packed again
+                if not conn.in_transaction:
+                    conn.execute("BEGIN")
+                conn.execute("ALTER TABLE activities ADD qualifiers integer NOT NULL DEFAULT 0")
+                conn.execute(f"UPDATE activities SET qualifiers = {packed}")
+                if sqlite3.sqlite_version_info >= (3, 35, 0):
+                    for qual in QUALIFIERS:
+                        conn.execute(f"ALTER TABLE activities DROP COLUMN {qual}")
+        db_colnames = self.get_colnames()
+        self.legacy_qualifiers = all(qual in db_colnames for qual in QUALIFIERS)
+
+    def initialize_qualifier_indexes(self) -> None:
+        """
+        Create a partial index of the days of the logs with each qualifier.
+        Each holds only the logs with its qualifier, such that queries of
+        a qualifier (see ActivityQuery.with_qualifiers) read no other logs.
+        """
+        with self.cursor() as c:
+            for qual, bit in QUALIFIER_BITS.items():
+                c.execute(
+                    f"CREATE INDEX if not exists activities_{qual} ON activities(day)"
+                    f" WHERE {self.QUALIFIER_SQL.format(bit=bit)}"
+                )
 
     def get_colnames(self) -> List[str]:
-        with Cursor(self.db_path) as c:
+        with self.cursor() as c:
             c.execute("SELECT * from activities limit 1")
             c.fetchall()
             description = c.description
@@ -328,6 +918,9 @@ class Database:
         db_colnames = self.get_colnames()
 
         for colname in self.ACTIVITIES_COLNAMES:
+            # Qualifiers already packed into a bitmask aren't restored
+            if colname in QUALIFIERS and "qualifiers" in db_colnames:
+                continue
             if colname not in db_colnames:
                 self.submit_query(
                     f"""
@@ -340,12 +933,26 @@ class Database:
         """
         Export the entire activities database as a csv file.
         """
-        # Request entire contents of database
+        # Request entire contents of database, with a column per qualifier
+        # such that the csv can be imported by older versions
         # filename = os.path.join(self.EXTERNALSTORAGE, 'spoon-output.csv')
-        with Cursor(self.db_path) as c:
-            c.execute("SELECT * FROM activities")
+        columns = [
+            (
+                f"(CASE WHEN {self.QUALIFIER_SQL.format(bit=QUALIFIER_BITS[col])} THEN 'True' ELSE 'False' END) AS {col}"
+                if col in QUALIFIERS
+                else col
+            )
+            for col in ("id",) + self.ACTIVITIES_COLNAMES + ("content_hash", "day")
+        ]
+        query_text = f"SELECT {', '.join(columns)} FROM activities"
+        with self.cursor() as c:
+            c.execute(query_text)
             contents = c.fetchall()
             description = c.description
+            c.execute("SELECT year, filename FROM partitions ORDER BY year")
+            partitions = c.fetchall()
+        for _, partition_filename in partitions:
+            contents += self.submit_partition_query(partition_filename, query_text)
 
         # Construct the csv file header from the request's description
         SEP = ","
@@ -360,41 +967,1407 @@ class Database:
         with open(filename, "w") as fp:
             fp.write(text)
 
-    def insert_activitylog(self, log: ActivityLog) -> None:
+    def insert_activitylog(self, log: ActivityLog) -> bool:
+        """
+        Insert an activity log, unless an identical log (i.e. one with the
+        same content hash) already exists.
+
+        Returns
+        -------
+        bool
+            whether the log was inserted
+        """
+        return self.insert_activitylogs([log]) == 1
+
+    def insert_row(self, c: SQLCursor, log: ActivityLog, id: Optional[int] = None) -> bool:
+        """
+        Insert the row of an activity log (without updating derived
+        tables), unless an identical log already exists.
+
+        Parameters
+        ----------
+        c : SQLCursor
+            the cursor to insert with
+        log : ActivityLog
+            the log to insert
+        id : int | None
+            the id of the row, or None for the next free rowid
+
+        Returns
+        -------
+        bool
+            whether the log was inserted
+        """
+        content_hash = log.get_content_hash()
         # Get the table columns that are also activity log attributes
-        valid_cols = [c for c in self.ACTIVITIES_COLNAMES if hasattr(log, c)]
+        valid_cols = [col for col in self.PLAIN_COLNAMES if hasattr(log, col)]
+        if self.legacy_qualifiers:
+            valid_cols += QUALIFIERS
 
         # Get the corresponding values of the valid column names
-        values = [str(getattr(log, c)) for c in valid_cols]
+        values: List[Any] = [str(getattr(log, col)) for col in valid_cols]
+        values += [qualifier_bitmask(log), content_hash, timeutils.day_index(log.start)]
+        if id is not None:
+            valid_cols.insert(0, "id")
+            values.insert(0, id)
 
         query_text = f"""
-            INSERT INTO activities(
-                    {','.join(valid_cols)}
+            INSERT OR IGNORE INTO activities(
+                    {','.join(valid_cols)}, qualifiers, content_hash, day
                 )
-                VALUES(
-                    "{'", "'.join(values)}"
+                VALUES({', '.join('?' for _ in values)});
+        """
+        c.execute(query_text, values)
+        return c.rowcount == 1
+
+    def insert_activitylog_if_unique(self, log: ActivityLog) -> bool:
+        """
+        Insert an activity log, unless an identical log already exists.
+
+        Duplicates are found by the unique index of content hashes, so
+        this costs the same regardless of the size of the database.
+
+        Returns
+        -------
+        bool
+            whether the log was inserted
+        """
+        return self.insert_activitylog(log)
+
+    def insert_activitylogs(self, logs: List[ActivityLog]) -> int:
+        """
+        Insert many activity logs in a single transaction, skipping
+        duplicates of existing logs. Derived tables are updated once
+        for all inserted logs.
+
+        Returns
+        -------
+        int
+            the number of logs inserted
+        """
+        with self.cursor() as c:
+            pending = logs
+            next_id = None
+            c.execute("SELECT MAX(max_id) FROM partitions")
+            archived_max_id = c.fetchone()[0]
+            if archived_max_id is not None:
+                # Skip duplicates of archived logs (see archive_year), and
+                # never reuse their ids
+                archived = self.get_archived_hashes(c, [log.get_content_hash() for log in logs])
+                pending = [log for log in logs if log.get_content_hash() not in archived]
+                c.execute("SELECT MAX(id) FROM activities")
+                next_id = max(c.fetchone()[0] or 0, archived_max_id) + 1
+
+            inserted = []
+            for log in pending:
+                if self.insert_row(c, log, next_id):
+                    inserted.append(log)
+                    if next_id is not None:
+                        next_id += 1
+            self.update_derived_tables(c, inserted, sign=1)
+
+        if len(logs) == 1 and inserted:
+            self.publish(LogInserted(inserted[0]))
+        elif inserted:
+            self.publish(BulkImportDone(inserted=len(inserted)))
+        return len(inserted)
+
+    def initialize_content_hashes(self) -> None:
+        """
+        Add a uniquely indexed column of content hashes to the activities
+        table, backfilling the hash of any rows without one.
+
+        If the database already holds duplicate rows, only the first of
+        each is given a hash, as the unique index would otherwise be violated.
+        """
+        if "content_hash" not in self.get_colnames():
+            self.submit_query("ALTER TABLE activities ADD content_hash text")
+        self.submit_query("CREATE UNIQUE INDEX if not exists activities_content_hash ON activities(content_hash)")
+
+        colnames = list(self.LOG_COLNAMES)
+        contents = self.submit_query(
+            f"SELECT {', '.join(colnames)} FROM activities WHERE content_hash IS NULL ORDER BY id"
+        )
+        if not contents:
+            return
+
+        hashes = [(self.row_to_activitylog(colnames, entry).get_content_hash(), entry[0]) for entry in contents]
+        with self.batch() as conn:
+            conn.executemany("UPDATE OR IGNORE activities SET content_hash = ? WHERE id = ?", hashes)
+
+    def update_derived_tables(self, c: SQLCursor, logs: List[ActivityLog], sign: int = 1) -> None:
+        """
+        Keep every table derived from the activities table up to date with
+        the insertion (`sign`=1) or deletion (`sign`=-1) of `logs`.
+
+        Parameters
+        ----------
+        c : sqlite3.Cursor
+            a cursor within the transaction that inserts or deletes `logs`
+        logs : list(ActivityLog)
+            the inserted or deleted activity logs
+        sign : int {1, -1}
+            whether `logs` were inserted or deleted
+        """
+        if not logs:
+            return
+        self.update_rollups(c, logs, sign)
+        self.update_name_stats(c, logs, sign)
+        self.record_changes(c, logs, sign)
+
+    def initialize_rollups(self) -> None:
+        """
+        Create the table of precomputed rollups, rebuilding it from
+        the activities table if it is empty.
+
+        There is one row per period for each level in
+        timeutils.PERIOD_LEVELS, holding the spoons and hours of the total
+        and of every qualifier, e.g. `total_spoons`, `rest_hours`.
+        """
+        col_props = ", ".join(
+            [f"{series}_{ymode} real NOT NULL DEFAULT 0" for series in self.ROLLUP_SERIES for ymode in self.ROLLUP_YMODES]
+        )
+        self.submit_query(
+            f"""
+            CREATE TABLE if not exists rollups(
+                level text NOT NULL,
+                period text NOT NULL,
+                n_logs integer NOT NULL DEFAULT 0,
+                {col_props},
+                PRIMARY KEY (level, period)
+            );
+        """
+        )
+
+        n_rollups = self.submit_query("SELECT COUNT(*) FROM rollups")[0][0]
+        n_activities = self.submit_query("SELECT COUNT(*) FROM activities")[0][0]
+        if n_rollups == 0 and n_activities > 0:
+            self.rebuild_rollups()
+
+    @classmethod
+    def rollup_contributions(cls, log: ActivityLog) -> Dict[str, float]:
+        """Get the values an activity log adds to each rollup column"""
+        contributions = {f"total_{ymode}": getattr(log, ymode) for ymode in cls.ROLLUP_YMODES}
+        for qual in QUALIFIERS:
+            for ymode in cls.ROLLUP_YMODES:
+                contributions[f"{qual}_{ymode}"] = getattr(log, ymode) if getattr(log, qual) else 0.0
+        return contributions
+
+    def update_rollups(self, c: SQLCursor, logs: List[ActivityLog], sign: int = 1) -> None:
+        """
+        Incrementally add (`sign`=1) or remove (`sign`=-1) the
+        contributions of activity logs to the rollups of every level.
+
+        Contributions are summed per period first, such that each period
+        is only updated once.
+
+        Parameters
+        ----------
+        c : sqlite3.Cursor
+            a cursor within the transaction that inserts or deletes `logs`
+        logs : list(ActivityLog)
+            the inserted or deleted activity logs
+        sign : int {1, -1}
+            whether to add or remove the contributions
+        """
+        totals: Dict[tuple, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        for log in logs:
+            day = timeutils.day_of(log.start)
+            contributions = self.rollup_contributions(log)
+            for level in timeutils.PERIOD_LEVELS:
+                key = (level, timeutils.period_start(day, level).strftime(self.DATE_FORMATSTRING))
+                totals[key]["n_logs"] += sign
+                for col, value in contributions.items():
+                    totals[key][col] += sign * value
+
+        for (level, period), row in totals.items():
+            colnames = list(row.keys())
+            updates = ", ".join([f"{col} = {col} + excluded.{col}" for col in colnames])
+            c.execute(
+                f"""
+                INSERT INTO rollups(level, period, {', '.join(colnames)})
+                VALUES(?, ?, {', '.join('?' for _ in colnames)})
+                ON CONFLICT(level, period) DO UPDATE SET {updates};
+            """,
+                [level, period] + list(row.values()),
+            )
+        # Drop emptied periods, rather than keep rows of rounding residue
+        if sign < 0:
+            c.execute("DELETE FROM rollups WHERE n_logs <= 0")
+
+    def rebuild_rollups(self) -> None:
+        """Recompute all rollups from scratch from the activities table"""
+        logs = self.get_all_logs()
+        with self.cursor() as c:
+            c.execute("DELETE FROM rollups")
+            self.update_rollups(c, logs, sign=1)
+
+    def get_rollups(self, level: str, start: date, end: date) -> Dict[str, Dict[str, Dict[date, float]]]:
+        """
+        Get the precomputed rollups of `level` for periods that start
+        between `start` and `end` (inclusive).
+
+        Parameters
+        ----------
+        level : str {"day", "week", "month", "year"}
+            the resolution of the rollups
+        start : date
+            the lower limit of the range of periods
+        end : date
+            the upper limit of the range of periods
+
+        Returns
+        -------
+        dict(str: dict(str: dict(date: float)))
+            Nested dict with structure [ymode, series, period, value], where
+            ymode is "spoons" or "hours", and series is "total" or a qualifier.
+            Periods without logs are absent.
+        """
+        colnames = [f"{series}_{ymode}" for ymode in self.ROLLUP_YMODES for series in self.ROLLUP_SERIES]
+        with self.cursor() as c:
+            c.execute(
+                f"""
+                SELECT period, {', '.join(colnames)} FROM rollups
+                WHERE level = ? AND period BETWEEN ? AND ?
+            """,
+                (level, start.strftime(self.DATE_FORMATSTRING), end.strftime(self.DATE_FORMATSTRING)),
+            )
+            contents = c.fetchall()
+
+        rollups: Dict[str, Dict[str, Dict[date, float]]] = {
+            ymode: {series: {} for series in self.ROLLUP_SERIES} for ymode in self.ROLLUP_YMODES
+        }
+        for period_str, *values in contents:
+            period = datetime.strptime(period_str, self.DATE_FORMATSTRING).date()
+            for col, value in zip(colnames, values):
+                series, ymode = col.rsplit("_", 1)
+                rollups[ymode][series][period] = value
+        return rollups
+
+    def get_earliest_period(self, level: str) -> Optional[date]:
+        """Get the first date of the earliest period with logs, if any"""
+        with self.cursor() as c:
+            c.execute("SELECT MIN(period) FROM rollups WHERE level = ?", (level,))
+            earliest = c.fetchone()[0]
+        if earliest is None:
+            return None
+        return datetime.strptime(earliest, self.DATE_FORMATSTRING).date()
+
+    def initialize_day_index(self) -> None:
+        """
+        Add an indexed column holding the day index (see timeutils.day_index)
+        of each activity's start, backfilling rows without one.
+
+        The day boundary the column was computed with is recorded in the
+        meta table. If timeutils.DAY_BOUNDARY has since changed, the day
+        index is recomputed.
+        """
+        if "day" not in self.get_colnames():
+            self.submit_query("ALTER TABLE activities ADD day integer")
+        self.submit_query("CREATE INDEX if not exists activities_day ON activities(day)")
+        self.submit_query("CREATE TABLE if not exists meta(key text PRIMARY KEY, value text NOT NULL)")
+
+        boundary = self.get_meta("day_boundary")
+        if boundary is not None and int(boundary) != timeutils.DAY_BOUNDARY:
+            self.recompute_day_index()
+            return
+
+        with self.batch():
+            self.submit_query(
+                f"UPDATE activities SET day = {self.DAY_INDEX_SQL.format(boundary=timeutils.DAY_BOUNDARY)}"
+                " WHERE day IS NULL"
+            )
+            if boundary is None:
+                self.set_meta("day_boundary", str(timeutils.DAY_BOUNDARY))
+
+    def recompute_day_index(self) -> None:
+        """
+        Recompute the day index of every activity, including those of every
+        partition (see archive_year), and the rollups, which also depend on
+        the day boundary, for the current timeutils.DAY_BOUNDARY.
+        """
+        update_text = f"UPDATE activities SET day = {self.DAY_INDEX_SQL.format(boundary=timeutils.DAY_BOUNDARY)}"
+        with self.batch():
+            self.submit_query(update_text)
+            for year, filename in self.submit_query("SELECT year, filename FROM partitions"):
+                conn = self.connect_partition(filename)
+                try:
+                    conn.execute(update_text)
+                    days = conn.execute("SELECT MIN(day), MAX(day) FROM activities").fetchone()
+                    conn.commit()
+                finally:
+                    conn.close()
+                if days[0] is not None:
+                    self.submit_query("UPDATE partitions SET first_day = ?, last_day = ? WHERE year = ?", days + (year,))
+            self.set_meta("day_boundary", str(timeutils.DAY_BOUNDARY))
+            self.rebuild_rollups()
+
+    def get_meta(self, key: str) -> Optional[str]:
+        """Get a value of the meta table, or None if it is unset"""
+        contents = self.submit_query("SELECT value FROM meta WHERE key = ?", (key,))
+        return contents[0][0] if contents else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        """Set a value of the meta table"""
+        self.submit_query(
+            "INSERT INTO meta(key, value) VALUES(?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value),
+        )
+
+    def get_daily_totals(self, start: int, end: int) -> Dict[int, float]:
+        """
+        Get the total spoons spent on each day between day offsets
+        [start, end), omitting days without logs.
+
+        Returns
+        -------
+        dict(int: float)
+            the total spoons, keyed by day offset
+        """
+        with timeutils.clock.frozen():
+            today = timeutils.day_index_from_offset(0)
+        with self.routed_cursor(today + start, today + end - 1) as (c, activities):
+            c.execute(
+                f"""
+                SELECT day, SUM({self.SPOONS_SQL})
+                FROM {activities}
+                WHERE day >= ? AND day < ?
+                GROUP BY day
+            """,
+                (today + start, today + end),
+            )
+            contents = c.fetchall()
+        return {day - today: spoons for day, spoons in contents}
+
+    def daily_breakdown(self, start: int, end: int) -> Dict[str, Dict[str, Dict[int, float]]]:
+        """
+        Get the spoons and hours of every day between day offsets
+        [start, end), in total and for each qualifier, in one query.
+
+        Returns
+        -------
+        dict(str: dict(str: dict(int: float)))
+            Nested dict with structure [ymode, series, day offset, value],
+            where ymode is "spoons" or "hours", and series is "total" or a
+            qualifier (as for get_rollups). Days without logs are 0.
+        """
+        expressions = {"spoons": self.SPOONS_SQL, "hours": self.HOURS_SQL}
+        columns = []
+        for ymode in self.ROLLUP_YMODES:
+            columns.append(f"TOTAL({expressions[ymode]})")
+            columns += [
+                f"TOTAL(CASE WHEN {self.QUALIFIER_SQL.format(bit=QUALIFIER_BITS[qual])} THEN {expressions[ymode]} END)"
+                for qual in QUALIFIERS
+            ]
+        with timeutils.clock.frozen():
+            today = timeutils.day_index_from_offset(0)
+        with self.routed_cursor(today + start, today + end - 1) as (c, activities):
+            c.execute(
+                f"""
+                SELECT day, {', '.join(columns)}
+                FROM {activities}
+                WHERE day >= ? AND day < ?
+                GROUP BY day
+            """,
+                (today + start, today + end),
+            )
+            contents = c.fetchall()
+
+        breakdown: Dict[str, Dict[str, Dict[int, float]]] = {
+            ymode: {series: dict.fromkeys(range(start, end), 0.0) for series in self.ROLLUP_SERIES}
+            for ymode in self.ROLLUP_YMODES
+        }
+        for day, *values in contents:
+            for i, ymode in enumerate(self.ROLLUP_YMODES):
+                series_values = values[i * len(self.ROLLUP_SERIES) : (i + 1) * len(self.ROLLUP_SERIES)]
+                for series, value in zip(self.ROLLUP_SERIES, series_values):
+                    breakdown[ymode][series][day - today] = value
+        return breakdown
+
+    def get_spoons_by_qualifier(self, start: int, end: int) -> Dict[str, float]:
+        """
+        Get the total spoons spent between day offsets [start, end), on
+        all logs and on the logs of each qualifier, in one aggregate query.
+
+        Returns
+        -------
+        dict(str: float)
+            the total spoons, keyed by "total" and each qualifier
+        """
+        columns = [f"TOTAL({self.SPOONS_SQL})"] + [
+            f"TOTAL(CASE WHEN {self.QUALIFIER_SQL.format(bit=bit)} THEN {self.SPOONS_SQL} END)"
+            for bit in QUALIFIER_BITS.values()
+        ]
+        with timeutils.clock.frozen():
+            params = (timeutils.day_index_from_offset(start), timeutils.day_index_from_offset(end))
+        with self.routed_cursor(params[0], params[1] - 1) as (c, activities):
+            c.execute(f"SELECT {', '.join(columns)} FROM {activities} WHERE day >= ? AND day < ?", params)
+            contents = c.fetchall()
+        return dict(zip(["total"] + list(QUALIFIER_BITS), contents[0]))
+
+    def initialize_search_index(self) -> None:
+        """
+        Create a trigram full-text index over activity names, kept in sync
+        with the activities table by triggers.
+
+        If the sqlite3 library lacks FTS5 (or the trigram tokenizer),
+        searches fall back to a LIKE scan of the activities table.
+        """
+        existing = self.submit_query("SELECT name FROM sqlite_master WHERE name = 'activities_fts'")
+        try:
+            self.submit_query(
+                """
+                CREATE VIRTUAL TABLE if not exists activities_fts USING fts5(
+                    name,
+                    content='activities',
+                    content_rowid='id',
+                    tokenize='trigram'
                 );
+            """
+            )
+        except sqlite3.OperationalError:
+            self.search_indexed = False
+            return
+        self.search_indexed = True
+
+        with self.cursor() as c:
+            c.executescript(
+                """
+                CREATE TRIGGER if not exists activities_fts_insert
+                AFTER INSERT ON activities BEGIN
+                    INSERT INTO activities_fts(rowid, name) VALUES (new.id, new.name);
+                END;
+                CREATE TRIGGER if not exists activities_fts_delete
+                AFTER DELETE ON activities BEGIN
+                    INSERT INTO activities_fts(activities_fts, rowid, name)
+                    VALUES ('delete', old.id, old.name);
+                END;
+                CREATE TRIGGER if not exists activities_fts_update
+                AFTER UPDATE OF name ON activities BEGIN
+                    INSERT INTO activities_fts(activities_fts, rowid, name)
+                    VALUES ('delete', old.id, old.name);
+                    INSERT INTO activities_fts(rowid, name) VALUES (new.id, new.name);
+                END;
+            """
+            )
+            # Index all existing activities when the index is first created
+            if not existing:
+                c.execute("INSERT INTO activities_fts(activities_fts) VALUES ('rebuild')")
+
+    def search_condition(
+        self,
+        query: str,
+        date_range: Optional[Tuple[datetime, datetime]] = None,
+    ) -> Tuple[str, List[Any]]:
         """
-        self.submit_query(query_text)
+        Build the WHERE clause (and its parameters) that matches activities
+        whose name contains `query`, optionally within `date_range`.
+        """
+        if self.search_indexed and len(query) >= self.SEARCH_MIN_LENGTH:
+            # Quote the query as an FTS5 string, i.e. a substring match
+            fts_query = '"' + query.replace('"', '""') + '"'
+            conditions = ["id IN (SELECT rowid FROM activities_fts WHERE activities_fts MATCH ?)"]
+            params: List[Any] = [fts_query]
+        else:
+            escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            conditions = ["name LIKE ? ESCAPE '\\'"]
+            params = [f"%{escaped}%"]
+
+        if date_range is not None:
+            conditions.append("start >= ? AND start < ?")
+            params += [dati.strftime(self.DATETIME_FORMATSTRING) for dati in date_range]
+
+        return " AND ".join(conditions), params
+
+    @staticmethod
+    def days_of_range(date_range: Optional[Tuple[datetime, datetime]]) -> Tuple[Optional[int], Optional[int]]:
+        """Get the first and last day index of the logs starting within [start, end), or None for no range"""
+        if date_range is None:
+            return None, None
+        return timeutils.day_index(date_range[0]), timeutils.day_index(date_range[1])
+
+    def search_activities(
+        self,
+        query: str,
+        limit: int = 100,
+        date_range: Optional[Tuple[datetime, datetime]] = None,
+    ) -> List[ActivityLog]:
+        """
+        Find logs whose activity name contains `query` (case-insensitive),
+        most recent first.
 
-    def insert_activitylog_if_unique(self, log: ActivityLog) -> None:
+        Parameters
+        ----------
+        query : str
+            the text to search for within activity names
+        limit : int
+            the maximum number of logs returned
+        date_range : (datetime, datetime) | None
+            if provided, only logs starting within [start, end)
+
+        Returns
+        -------
+        list(ActivityLog)
+            the matching logs, sorted by descending start time
         """
-        Perhaps a better way is to add all logs, then remove duplicates
+        colnames = list(self.LOG_COLNAMES)
+        condition, params = self.search_condition(query, date_range)
+        with self.routed_cursor(*self.days_of_range(date_range)) as (c, activities):
+            c.execute(
+                f"""
+                SELECT {', '.join(colnames)} FROM {activities}
+                WHERE {condition}
+                ORDER BY start DESC
+                LIMIT ?
+            """,
+                params + [limit],
+            )
+            contents = c.fetchall()
+
+        return [self.row_to_activitylog(colnames, entry) for entry in contents]
+
+    def search_activity_totals(
+        self,
+        query: str,
+        date_range: Optional[Tuple[datetime, datetime]] = None,
+    ) -> List[Tuple[str, int, float]]:
         """
-        valid_cols = [c for c in self.ACTIVITIES_COLNAMES if hasattr(log, c)]
+        Summarise all logs whose activity name contains `query`, grouped
+        by name.
 
-        # Use column names to dynamically generate equality checks
-        equality_checks = [f'{col}="{getattr(log, col)}"' for col in valid_cols]
+        Returns
+        -------
+        list((str, int, float))
+            the name, number of logs and total spoons of each matching
+            activity name, sorted by descending total spoons
+        """
+        condition, params = self.search_condition(query, date_range)
+        with self.routed_cursor(*self.days_of_range(date_range)) as (c, activities):
+            c.execute(
+                f"""
+                SELECT name, COUNT(*), TOTAL({self.SPOONS_SQL}) AS spoons FROM {activities}
+                WHERE {condition}
+                GROUP BY name
+                ORDER BY spoons DESC
+            """,
+                params,
+            )
+            contents = c.fetchall()
+        return contents
+
+    def initialize_interval_index(self) -> None:
+        """
+        Create an R*Tree index of the time interval of every activity, in
+        whole minutes, kept in sync with the activities table by triggers.
+
+        If the sqlite3 library lacks the R*Tree module, overlap queries
+        fall back to the index of start times.
+        """
+        existing = self.submit_query("SELECT name FROM sqlite_master WHERE name = 'activity_intervals'")
+        try:
+            self.submit_query(
+                "CREATE VIRTUAL TABLE if not exists activity_intervals USING rtree_i32(id, start_min, end_min)"
+            )
+        except sqlite3.OperationalError:
+            self.interval_indexed = False
+            return
+        self.interval_indexed = True
+
+        # Intervals are rounded outwards to whole minutes (and a log ending
+        # before it starts is indexed as its reverse, as R*Trees require)
+        start_min = self.MINUTES_SQL.format(column="new.start")
+        end_min = self.MINUTES_SQL.format(column="new.end")
+        with self.cursor() as c:
+            c.executescript(
+                f"""
+                CREATE TRIGGER if not exists activity_intervals_insert
+                AFTER INSERT ON activities BEGIN
+                    INSERT INTO activity_intervals(id, start_min, end_min)
+                    VALUES (new.id, MIN({start_min}, {end_min}), MAX({start_min}, {end_min}) + 1);
+                END;
+                CREATE TRIGGER if not exists activity_intervals_delete
+                AFTER DELETE ON activities BEGIN
+                    DELETE FROM activity_intervals WHERE id = old.id;
+                END;
+            """
+            )
+            # Index all existing activities when the index is first created
+            if not existing:
+                start_min, end_min = (self.MINUTES_SQL.format(column=column) for column in ("start", "end"))
+                c.execute(
+                    f"""
+                    INSERT INTO activity_intervals(id, start_min, end_min)
+                    SELECT id, MIN({start_min}, {end_min}), MAX({start_min}, {end_min}) + 1 FROM activities
+                """
+                )
+
+    @staticmethod
+    def minutes(dati: datetime) -> int:
+        """Get the whole minutes since 1970-01-01 of a datetime (see MINUTES_SQL)"""
+        return (dati - datetime(1970, 1, 1)) // timedelta(minutes=1)
+
+    def find_overlapping(
+        self,
+        start: datetime,
+        end: datetime,
+        exclude_id: Optional[int] = None,
+    ) -> List[ActivityLog]:
+        """
+        Find the logs whose time interval overlaps [start, end), e.g. to
+        warn before inserting a log over existing logs. Logs merely touching
+        the interval (e.g. ending at `start`) don't overlap it.
+
+        Parameters
+        ----------
+        start : datetime
+            the start of the interval
+        end : datetime
+            the end of the interval
+        exclude_id : int | None
+            the id of a log to ignore, e.g. the log being checked itself
+
+        Returns
+        -------
+        list(ActivityLog)
+            the overlapping logs, sorted by start time
+        """
+        conditions = ["start < ? AND end > ?"]
+        params: List[Any] = [end.strftime(self.DATETIME_FORMATSTRING), start.strftime(self.DATETIME_FORMATSTRING)]
+        # Overlapping logs start by `end`, but may start long before `start`
+        first_day = None
+        if self.interval_indexed:
+            # Find candidates by their (whole minute) intervals, then check exactly
+            candidates = (self.minutes(end) + 1, self.minutes(start))
+            earliest = self.submit_query(
+                "SELECT MIN(start_min) FROM activity_intervals WHERE start_min <= ? AND end_min >= ?", candidates
+            )[0][0]
+            if earliest is None:
+                return []
+            first_day = timeutils.day_index(datetime(1970, 1, 1) + timedelta(minutes=earliest))
+            conditions.append("id IN (SELECT id FROM activity_intervals WHERE start_min <= ? AND end_min >= ?)")
+            params += candidates
+        if exclude_id is not None:
+            conditions.append("id != ?")
+            params.append(exclude_id)
+
+        colnames = list(self.LOG_COLNAMES)
+        with self.routed_cursor(first_day, timeutils.day_index(end)) as (c, activities):
+            c.execute(
+                f"SELECT {', '.join(colnames)} FROM {activities} WHERE {' AND '.join(conditions)} ORDER BY start",
+                params,
+            )
+            contents = c.fetchall()
+        return [self.row_to_activitylog(colnames, entry) for entry in contents]
+
+    def logs_at(self, moment: datetime) -> List[ActivityLog]:
+        """
+        Find the logs in progress at `moment`, i.e. "what was I doing at
+        `moment`?"
 
-        # Check to see if this activity is already in the database
+        Returns
+        -------
+        list(ActivityLog)
+            the logs starting at or before, and ending after, `moment`
+        """
+        return self.find_overlapping(moment, moment + timedelta(seconds=1))
+
+    def overlap_report(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> List[Tuple[ActivityLog, ActivityLog]]:
+        """
+        Find every pair of overlapping logs in the whole history, or only
+        those overlapping [start, end) if given, e.g. the span of an import.
+
+        Logs are swept in order of start time, keeping a heap of the logs
+        still in progress, such that this costs O(n log n + overlaps)
+        rather than comparing every pair of logs.
+
+        Parameters
+        ----------
+        start, end : datetime | None
+            if both are given, only the logs overlapping [start, end) (see
+            find_overlapping) are read and compared
+
+        Returns
+        -------
+        list((ActivityLog, ActivityLog))
+            the overlapping pairs, each ordered by start time
+        """
+        in_progress: List[Tuple[datetime, int, ActivityLog]] = []
+        overlaps = []
+        if start is not None and end is not None:
+            logs = sorted(self.find_overlapping(start, end), key=lambda log: (log.start, log.id))
+        else:
+            logs = self.query().order_by("start", "id").logs()
+        for log in logs:
+            while in_progress and in_progress[0][0] <= log.start:
+                heapq.heappop(in_progress)
+            overlaps += [(other, log) for _, _, other in in_progress]
+            heapq.heappush(in_progress, (log.end, log.id, log))  # type: ignore
+        return overlaps
+
+    def initialize_name_stats(self) -> None:
+        """
+        Create the table of per-name statistics, rebuilding it from the
+        activities table if it is empty.
+
+        Histograms (of durations and loads) are stored as json objects,
+        such that the statistics can be updated as logs are deleted.
+        """
+        qual_props = ", ".join([f"{qual} integer NOT NULL DEFAULT 0" for qual in QUALIFIERS])
+        with self.cursor() as c:
+            c.execute(
+                f"""
+                CREATE TABLE if not exists activity_names(
+                    name text PRIMARY KEY,
+                    count integer NOT NULL DEFAULT 0,
+                    last_used text,
+                    durations text NOT NULL DEFAULT '{{}}',
+                    cogloads text NOT NULL DEFAULT '{{}}',
+                    physloads text NOT NULL DEFAULT '{{}}',
+                    {qual_props}
+                );
+            """
+            )
+            # Allows the last use of a name to be found after a deletion
+            c.execute("CREATE INDEX if not exists activities_name ON activities(name, start)")
+            c.execute("SELECT COUNT(*) FROM activity_names")
+            n_names = c.fetchone()[0]
+
+        if n_names == 0:
+            logs = self.get_all_logs()
+            with self.cursor() as c:
+                self.update_name_stats(c, logs, sign=1)
+
+    @staticmethod
+    def update_histogram(histogram_json: str, values: List[Any], sign: int) -> str:
+        """Increment (or decrement) the counts of `values` in a json histogram"""
+        histogram = json.loads(histogram_json)
+        for value in values:
+            key = str(value)
+            histogram[key] = histogram.get(key, 0) + sign
+            if histogram[key] <= 0:
+                del histogram[key]
+        return json.dumps(histogram)
+
+    def update_name_stats(self, c: SQLCursor, logs: List[ActivityLog], sign: int = 1) -> None:
+        """
+        Incrementally add (`sign`=1) or remove (`sign`=-1) activity logs
+        from the statistics of their names.
+        """
+        logs_by_name: Dict[str, List[ActivityLog]] = defaultdict(list)
+        for log in logs:
+            logs_by_name[log.name].append(log)
+
+        for name, name_logs in logs_by_name.items():
+            c.execute(
+                "SELECT count, last_used, durations, cogloads, physloads FROM activity_names WHERE name = ?",
+                (name,),
+            )
+            row = c.fetchone()
+            if row is None:
+                if sign < 0:
+                    continue
+                row = (0, None, "{}", "{}", "{}")
+            count, last_used, durations, cogloads, physloads = row
+
+            count += sign * len(name_logs)
+            if count <= 0:
+                c.execute("DELETE FROM activity_names WHERE name = ?", (name,))
+                continue
+
+            starts = [log.start.strftime(self.DATETIME_FORMATSTRING) for log in name_logs]
+            if sign > 0:
+                last_used = max(starts + ([last_used] if last_used else []))
+            elif last_used in starts:
+                c.execute("SELECT MAX(start) FROM activities WHERE name = ?", (name,))
+                last_used = c.fetchone()[0]
+
+            values = [
+                count,
+                last_used,
+                self.update_histogram(durations, [round(log.duration.total_seconds() / 60) for log in name_logs], sign),
+                self.update_histogram(cogloads, [float(log.cogload) for log in name_logs], sign),
+                self.update_histogram(physloads, [float(log.physload) for log in name_logs], sign),
+            ]
+            qual_values = [sign * sum(bool(getattr(log, qual)) for log in name_logs) for qual in QUALIFIERS]
+            c.execute(
+                f"""
+                INSERT INTO activity_names(
+                    name, count, last_used, durations, cogloads, physloads, {', '.join(QUALIFIERS)}
+                )
+                VALUES(?, ?, ?, ?, ?, ?, {', '.join('?' for _ in QUALIFIERS)})
+                ON CONFLICT(name) DO UPDATE SET
+                    count = excluded.count,
+                    last_used = excluded.last_used,
+                    durations = excluded.durations,
+                    cogloads = excluded.cogloads,
+                    physloads = excluded.physloads,
+                    {', '.join(f'{qual} = {qual} + excluded.{qual}' for qual in QUALIFIERS)};
+            """,
+                [name] + values + qual_values,
+            )
+
+    def get_name_stats(self, name: Optional[str] = None) -> List[NameStats]:
+        """
+        Get the statistics of every activity name, or only of `name`
+
+        Parameters
+        ----------
+        name : str | None
+            if provided, the single activity name of interest
+
+        Returns
+        -------
+        list(NameStats)
+            the statistics of each activity name
+        """
         query_text = f"""
-            SELECT EXISTS(
-                SELECT * from activities WHERE
-                    {" AND ".join(equality_checks)}
+            SELECT name, count, last_used, durations, cogloads, physloads, {', '.join(QUALIFIERS)}
+            FROM activity_names
+        """
+        params: List[Any] = []
+        if name is not None:
+            query_text += " WHERE name = ?"
+            params.append(name)
+
+        with self.cursor() as c:
+            c.execute(query_text, params)
+            contents = c.fetchall()
+
+        stats = []
+        for name, count, last_used, durations, cogloads, physloads, *qual_counts in contents:
+            stats.append(
+                NameStats(
+                    name=name,
+                    count=count,
+                    last_used=datetime.strptime(last_used, self.DATETIME_FORMATSTRING) if last_used else None,
+                    durations={int(k): v for k, v in json.loads(durations).items()},
+                    cogloads={float(k): v for k, v in json.loads(cogloads).items()},
+                    physloads={float(k): v for k, v in json.loads(physloads).items()},
+                    qualifiers=dict(zip(QUALIFIERS, qual_counts)),
+                )
+            )
+        return stats
+
+    def initialize_changes(self) -> None:
+        """
+        Create the append-only change log, recording every insert and
+        delete with a monotonic sequence number, for incremental syncing
+        between devices (see get_changes and apply_changes).
+
+        When first created, an insert is recorded for every existing log,
+        such that a sync from sequence 0 transfers the whole history.
+        """
+        existing = self.submit_query("SELECT name FROM sqlite_master WHERE name = 'changes'")
+        self.submit_query(
+            """
+            CREATE TABLE if not exists changes(
+                seq integer PRIMARY KEY AUTOINCREMENT,
+                op text NOT NULL,
+                content_hash text NOT NULL,
+                payload text
             );
         """
-        contents = self.submit_query(query_text)
-        if contents[0][0] > 0:
+        )
+        if existing:
+            return
+
+        colnames = list(self.LOG_COLNAMES)
+        with self.batch() as conn:
+            rows = conn.execute(
+                f"SELECT content_hash, {', '.join(colnames)} FROM activities"
+                " WHERE content_hash IS NOT NULL ORDER BY id"
+            )
+            conn.executemany(
+                "INSERT INTO changes(op, content_hash, payload) VALUES('insert', ?, ?)",
+                ((row[0], self.change_payload(self.row_to_activitylog(colnames, row[1:]))) for row in rows),
+            )
+
+    def record_changes(self, c: SQLCursor, logs: List[ActivityLog], sign: int = 1) -> None:
+        """
+        Append the insertion (`sign`=1) or deletion (`sign`=-1) of `logs`
+        to the change log. Inserts carry the stored column values of the
+        log, deletes only its content hash.
+        """
+        rows = []
+        for log in logs:
+            content_hash = log.get_content_hash()
+            if sign > 0:
+                rows.append(("insert", content_hash, self.change_payload(log)))
+                continue
+            # A duplicate (without a hash) of a remaining log was deleted
+            c.execute("SELECT 1 FROM activities WHERE content_hash = ?", (content_hash,))
+            if c.fetchone() is None:
+                rows.append(("delete", content_hash, None))
+        c.executemany("INSERT INTO changes(op, content_hash, payload) VALUES(?, ?, ?)", rows)
+
+    @classmethod
+    def change_payload(cls, log: ActivityLog) -> str:
+        """Get the payload of the change inserting a log: its column values, as json"""
+        return json.dumps({col: str(getattr(log, col)) for col in cls.ACTIVITIES_COLNAMES})
+
+    def latest_change_seq(self) -> int:
+        """Get the sequence number of the latest change, or 0 if none"""
+        return self.submit_query("SELECT MAX(seq) FROM changes")[0][0] or 0
+
+    def get_changes(self, since: int = 0) -> List[Dict[str, Any]]:
+        """
+        Get every change recorded after sequence number `since`, in order.
+
+        Returns
+        -------
+        list(dict(str: Any))
+            json-serializable changes, with keys "seq", "op" ("insert" or
+            "delete"), "content_hash" and, for inserts, "log" (the stored
+            column values of the log)
+        """
+        contents = self.submit_query(
+            "SELECT seq, op, content_hash, payload FROM changes WHERE seq > ? ORDER BY seq",
+            (since,),
+        )
+        changes = []
+        for seq, op, content_hash, payload in contents:
+            change: Dict[str, Any] = {"seq": seq, "op": op, "content_hash": content_hash}
+            if payload is not None:
+                change["log"] = json.loads(payload)
+            changes.append(change)
+        return changes
+
+    def apply_changes(self, changes: List[Dict[str, Any]]) -> int:
+        """
+        Apply changes exported by another database (see get_changes), in
+        order and in a single transaction.
+
+        Only the last change of each content hash is applied, such that a
+        log inserted and later deleted by the other database isn't inserted
+        and deleted again here. Applying is idempotent: logs already present
+        aren't inserted again, and deletes of absent logs are ignored. Only
+        changes that had an effect are recorded in this database's own
+        change log.
+
+        Returns
+        -------
+        int
+            the number of changes that had an effect
+        """
+        colnames = list(self.LOG_COLNAMES)
+        latest = {change["content_hash"]: i for i, change in enumerate(changes)}
+        applied = 0
+        with self.batch():
+            pending: List[ActivityLog] = []
+            for change in (changes[i] for i in sorted(latest.values())):
+                if change["op"] == "insert":
+                    values = change["log"]
+                    pending.append(self.row_to_activitylog(list(values), tuple(values.values())))
+                    continue
+                if change["op"] != "delete":
+                    raise ValueError(f"Unknown change op: {change['op']}")
+
+                applied += self.insert_activitylogs(pending)
+                pending = []
+                with self.cursor() as c:
+                    c.execute(
+                        f"SELECT {', '.join(colnames)} FROM activities WHERE content_hash = ?",
+                        (change["content_hash"],),
+                    )
+                    entry = c.fetchone()
+                    if entry is not None:
+                        c.execute("DELETE FROM activities WHERE id = ?", (entry[0],))
+                        logs = [self.row_to_activitylog(colnames, entry)]
+                    else:
+                        logs = self.delete_archived_entries(c, self.find_archived_ids(c, [change["content_hash"]]))
+                    if not logs:
+                        continue
+                    self.update_derived_tables(c, logs, sign=-1)
+                self.publish(LogsDeleted([log.id for log in logs], logs))  # type: ignore
+                applied += 1
+            applied += self.insert_activitylogs(pending)
+        return applied
+
+    def initialize_partitions(self) -> None:
+        """
+        Create the table of year partitions (see archive_year), and the
+        table of the content hashes of archived logs, which keeps logs of
+        archived years from being inserted again, e.g. by an import.
+        """
+        with self.cursor() as c:
+            c.execute(
+                """
+                CREATE TABLE if not exists partitions(
+                    year integer PRIMARY KEY,
+                    filename text NOT NULL,
+                    first_day integer NOT NULL,
+                    last_day integer NOT NULL,
+                    n_logs integer NOT NULL DEFAULT 0,
+                    max_id integer NOT NULL DEFAULT 0
+                );
+            """
+            )
+            c.execute("CREATE TABLE if not exists archived_hashes(content_hash text PRIMARY KEY) WITHOUT ROWID")
+
+    def get_archived_hashes(self, c: SQLCursor, content_hashes: List[str]) -> Set[str]:
+        """Get those of `content_hashes` which are hashes of archived logs (see archive_year)"""
+        archived: Set[str] = set()
+        # Stay within the limit on parameters of older sqlite3 versions
+        for i in range(0, len(content_hashes), self.MAX_PARAMS):
+            chunk = content_hashes[i : i + self.MAX_PARAMS]
+            placeholders = ", ".join("?" for _ in chunk)
+            c.execute(f"SELECT content_hash FROM archived_hashes WHERE content_hash IN ({placeholders})", chunk)
+            archived.update(row[0] for row in c.fetchall())
+        return archived
+
+    def find_archived_ids(self, c: SQLCursor, content_hashes: List[str]) -> List[int]:
+        """Get the ids of the archived logs (see archive_year) with any of `content_hashes`"""
+        archived = list(self.get_archived_hashes(c, content_hashes))
+        if not archived:
+            return []
+        ids = []
+        for _, filename in self.get_partitions(c):
+            for i in range(0, len(archived), self.MAX_PARAMS):
+                chunk = tuple(archived[i : i + self.MAX_PARAMS])
+                query_text = f"SELECT id FROM activities WHERE content_hash IN ({', '.join('?' for _ in chunk)})"
+                ids += [row[0] for row in self.submit_partition_query(filename, query_text, chunk)]
+        return ids
+
+    def initialize_partition(self, path: str) -> None:
+        """Create the activities table (and its indexes) of a partition file, if missing"""
+        col_props = ", ".join([f"{col} text NOT NULL" for col in self.PLAIN_COLNAMES])
+        conn = connect(path)
+        try:
+            conn.execute(
+                f"""
+                CREATE TABLE if not exists activities(
+                    id integer PRIMARY KEY,
+                    {col_props},
+                    qualifiers integer NOT NULL DEFAULT 0,
+                    content_hash text,
+                    day integer
+                );
+            """
+            )
+            conn.execute("CREATE INDEX if not exists activities_start ON activities(start)")
+            conn.execute("CREATE INDEX if not exists activities_day ON activities(day)")
+            conn.execute("CREATE UNIQUE INDEX if not exists activities_content_hash ON activities(content_hash)")
+            conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def partition_path(self, filename: str) -> str:
+        """Get the path of a partition file, which is kept next to the database file"""
+        return os.path.join(os.path.dirname(os.path.abspath(self.db_path)), filename)
+
+    def partition_uri(self, filename: str, read_only: bool = False) -> str:
+        """
+        Get the uri of a partition file, opened read-only or read-write.
+        Unlike its path, the uri fails to open a missing partition, rather
+        than creating it empty.
+        """
+        return f"{Path(self.partition_path(filename)).as_uri()}?mode={'ro' if read_only else 'rw'}"
+
+    def connect_partition(self, filename: str, read_only: bool = False) -> sqlite3.Connection:
+        """
+        Open a connection to a partition file
+
+        Raises
+        ------
+        sqlite3.OperationalError
+            if the partition file is missing
+        """
+        try:
+            return sqlite3.connect(self.partition_uri(filename, read_only), uri=True)
+        except sqlite3.OperationalError as e:
+            raise sqlite3.OperationalError(f"Can't open partition {self.partition_path(filename)}: {e}") from e
+
+    def archive_year(self, year: int) -> int:
+        """
+        Move the logs starting in `year` out of the activities table, into
+        a partition file of that year next to the database file (e.g.
+        spooncalc-2021.db), such that queries of other years neither scan
+        nor index them.
+
+        Range queries (e.g. get_logs_between_offsets, daily_breakdown or
+        an ActivityQuery between offsets) attach only the partitions of the
+        days they cover (see activities_source), so the partitions of cold
+        years stay closed. Archived logs keep their ids, which are never
+        reused, as well as their rollups, name statistics, and rows of the
+        search and interval indexes, such that searches and overlap checks
+        still find them. Logs of an archived year may still be inserted:
+        they're kept in the activities table until the year is archived
+        again.
+
+        The partition is written before the activities table, such that an
+        interrupted archive leaves at worst an unrecorded partition, whose
+        logs are skipped when the year is next archived.
+
+        Must not be called within a batch.
+
+        Parameters
+        ----------
+        year : int
+            a year before the current year
+
+        Returns
+        -------
+        int
+            the number of logs moved into the partition
+        """
+        if year >= timeutils.clock.now().year:
+            raise ValueError(f"Only past years can be archived, not {year}")
+        filename = self.PARTITION_FILENAME.format(stem=Path(self.db_path).stem, year=year)
+        path = self.partition_path(filename)
+        self.initialize_partition(path)
+
+        bounds = tuple(datetime(y, 1, 1).strftime(self.DATETIME_FORMATSTRING) for y in (year, year + 1))
+        cols = ", ".join(self.PARTITION_COLNAMES)
+        with self.session() as conn:
+            c = conn.cursor()
+            aliases = self.attach_partitions(c, [(year, filename)])
+            try:
+                c.execute(
+                    f"INSERT OR IGNORE INTO y{year}.activities({cols})"
+                    f" SELECT {cols} FROM main.activities WHERE start >= ? AND start < ?",
+                    bounds,
+                )
+                c.execute(
+                    "INSERT OR IGNORE INTO archived_hashes(content_hash) SELECT content_hash FROM main.activities"
+                    " WHERE start >= ? AND start < ? AND content_hash IS NOT NULL",
+                    bounds,
+                )
+                c.execute("SELECT id, name, start, end FROM main.activities WHERE start >= ? AND start < ?", bounds)
+                indexed = c.fetchall()
+                c.execute("DELETE FROM main.activities WHERE start >= ? AND start < ?", bounds)
+                archived = c.rowcount
+                # Restore the index rows removed by the delete triggers
+                self.index_archived_logs(c, indexed)
+                c.execute(f"SELECT COUNT(*), MIN(day), MAX(day), MAX(id) FROM y{year}.activities")
+                n_logs, first_day, last_day, max_id = c.fetchone()
+                if n_logs:
+                    c.execute(
+                        """
+                        INSERT INTO partitions(year, filename, first_day, last_day, n_logs, max_id)
+                        VALUES(?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(year) DO UPDATE SET
+                            first_day = excluded.first_day,
+                            last_day = excluded.last_day,
+                            n_logs = excluded.n_logs,
+                            max_id = excluded.max_id
+                    """,
+                        (year, filename, first_day, last_day, n_logs, max_id),
+                    )
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                self.detach_partitions(c, aliases)
+
+        if not n_logs:
+            os.remove(path)
+        return archived
+
+    def index_archived_logs(self, c: SQLCursor, rows: List[Tuple[int, str, str, str]]) -> None:
+        """
+        Add the rows of the search and interval indexes of archived logs,
+        given the id, name, start and end of each.
+
+        The indexes of the activities table (see initialize_search_index and
+        initialize_interval_index) keep the rows of archived logs, such that
+        searches and overlap checks still find them, although their triggers
+        only follow the activities table.
+        """
+        if self.search_indexed:
+            c.executemany("INSERT INTO activities_fts(rowid, name) VALUES(?, ?)", [row[:2] for row in rows])
+        if self.interval_indexed:
+            intervals = []
+            for id, _, start, end in rows:
+                minutes = sorted(self.minutes(datetime.strptime(dati, self.DATETIME_FORMATSTRING)) for dati in (start, end))
+                intervals.append((id, minutes[0], minutes[1] + 1))
+            c.executemany("INSERT INTO activity_intervals(id, start_min, end_min) VALUES(?, ?, ?)", intervals)
+
+    def unindex_archived_logs(self, c: SQLCursor, rows: List[Tuple[int, str]]) -> None:
+        """Remove the rows of the search and interval indexes of archived logs, given the id and name of each"""
+        if self.search_indexed:
+            c.executemany("INSERT INTO activities_fts(activities_fts, rowid, name) VALUES('delete', ?, ?)", rows)
+        if self.interval_indexed:
+            c.executemany("DELETE FROM activity_intervals WHERE id = ?", [row[:1] for row in rows])
+
+    def get_partitions(
+        self,
+        c: SQLCursor,
+        first_day: Optional[int] = None,
+        last_day: Optional[int] = None,
+    ) -> List[Tuple[int, str]]:
+        """
+        Get the year and filename of each partition holding logs of the
+        days [first_day, last_day], oldest first. Either limit may be None,
+        i.e. unbounded.
+        """
+        c.execute(
+            "SELECT year, filename FROM partitions"
+            " WHERE last_day >= COALESCE(?, last_day) AND first_day <= COALESCE(?, first_day)"
+            " ORDER BY year",
+            (first_day, last_day),
+        )
+        return c.fetchall()
+
+    @staticmethod
+    def attached_databases(c: SQLCursor) -> Set[str]:
+        """Get the aliases of the databases attached to the connection of a cursor"""
+        c.execute("PRAGMA database_list")
+        return {row[1] for row in c.fetchall()} - {"main", "temp"}
+
+    def attach_partitions(self, c: SQLCursor, partitions: List[Tuple[int, str]]) -> List[str]:
+        """
+        Attach partitions to the connection of a cursor, each as "y<year>",
+        returning the aliases of those that weren't already attached
+
+        Raises
+        ------
+        sqlite3.OperationalError
+            if a partition file is missing
+        """
+        attached = self.attached_databases(c)
+        aliases = []
+        for year, filename in partitions:
+            alias = f"y{year}"
+            if alias in attached:
+                continue
+            try:
+                c.execute(f"ATTACH DATABASE ? AS {alias}", (self.partition_uri(filename, self.read_only),))
+            except sqlite3.OperationalError as e:
+                raise sqlite3.OperationalError(f"Can't attach partition {self.partition_path(filename)}: {e}") from e
+            aliases.append(alias)
+        return aliases
+
+    @staticmethod
+    def detach_partitions(c: SQLCursor, aliases: List[str]) -> None:
+        """
+        Detach partitions from the connection of a cursor. Databases can't
+        be detached within a transaction, so these are instead left
+        attached until the connection is closed.
+        """
+        if c.connection.in_transaction:
             return
+        for alias in aliases:
+            c.execute(f"DETACH DATABASE {alias}")
 
-        self.insert_activitylog(log)
+    @contextmanager
+    def activities_source(
+        self,
+        c: SQLCursor,
+        first_day: Optional[int] = None,
+        last_day: Optional[int] = None,
+    ) -> Iterator[str]:
+        """
+        Get the SQL table expression of the logs of the days [first_day,
+        last_day] (either of which may be None, i.e. unbounded), to select
+        from in place of the activities table.
+
+        If no partition (see archive_year) holds logs of those days, this
+        is just the activities table, so queries of recent days never open
+        a partition. Otherwise, the overlapping partitions are attached for
+        the duration of this context, and combined with the activities table
+        by UNION ALL. Conditions on the combined logs are pushed down into
+        each part, using its indexes.
+
+        Partitions beyond the limit on attached databases (see MAX_ATTACHED)
+        are instead read in turn, into a temporary table dropped at the end
+        of this context (see load_partitions).
+        """
+        partitions = self.get_partitions(c, first_day, last_day)
+        if not partitions:
+            yield "activities"
+            return
+
+        attached = self.attached_databases(c)
+        unattached = [(year, filename) for year, filename in partitions if f"y{year}" not in attached]
+        n_attachable = max(0, self.MAX_ATTACHED - len(attached))
+        overflow = unattached[n_attachable:]
+        aliases = self.attach_partitions(c, unattached[:n_attachable])
+        cols = ", ".join(self.PARTITION_COLNAMES)
+        selects = [f"SELECT {cols} FROM main.activities"]
+        selects += [f"SELECT {cols} FROM y{year}.activities" for year, filename in partitions if (year, filename) not in overflow]
+        table = None
+        try:
+            if overflow:
+                table = self.load_partitions(c, overflow, first_day, last_day)
+                selects.append(f"SELECT {cols} FROM temp.{table}")
+            yield f"({' UNION ALL '.join(selects)}) AS activities"
+        finally:
+            if table is not None:
+                c.execute(f"DROP TABLE temp.{table}")
+            if overflow and self.read_only:
+                c.execute("PRAGMA query_only = 1")
+            self.detach_partitions(c, aliases)
+
+    def load_partitions(
+        self,
+        c: SQLCursor,
+        partitions: List[Tuple[int, str]],
+        first_day: Optional[int] = None,
+        last_day: Optional[int] = None,
+    ) -> str:
+        """
+        Copy the logs of the days [first_day, last_day] (either of which may
+        be None, i.e. unbounded) of partitions into a new temporary table of
+        the connection of a cursor, reading each partition file in turn
+        rather than attaching it. The table must be dropped once used.
+
+        Returns
+        -------
+        str
+            the name of the temporary table
+        """
+        table = f"partition_logs_{next(self.temp_table_ids)}"
+        if self.read_only:
+            # Read-only connections can't be written to regardless, but
+            # query_only also forbids temporary tables
+            c.execute("PRAGMA query_only = 0")
+        cols = ", ".join(self.PARTITION_COLNAMES)
+        c.execute(f"CREATE TEMP TABLE {table} AS SELECT {cols} FROM main.activities WHERE 0")
+        # Commit the copy unless already within a transaction, which would
+        # otherwise keep partitions from being detached
+        in_transaction = c.connection.in_transaction
+        if not in_transaction:
+            c.execute("BEGIN")
+        for _, filename in partitions:
+            contents = self.submit_partition_query(
+                filename,
+                f"SELECT {cols} FROM activities WHERE day >= COALESCE(?, day) AND day <= COALESCE(?, day)",
+                (first_day, last_day),
+            )
+            c.executemany(f"INSERT INTO temp.{table} VALUES({', '.join('?' for _ in self.PARTITION_COLNAMES)})", contents)
+        if not in_transaction:
+            c.connection.commit()
+        return table
+
+    @contextmanager
+    def routed_cursor(
+        self,
+        first_day: Optional[int] = None,
+        last_day: Optional[int] = None,
+    ) -> Iterator[Tuple[SQLCursor, str]]:
+        """
+        Get a cursor, and the SQL table expression of the logs of the days
+        [first_day, last_day] (see activities_source)
+
+        Examples
+        --------
+        >>> with db.routed_cursor(first_day, last_day) as (c, activities):
+        ...     c.execute(f"SELECT COUNT(*) FROM {activities} WHERE day >= ? AND day <= ?", (first_day, last_day))
+        """
+        with self.cursor() as c:
+            with self.activities_source(c, first_day, last_day) as activities:
+                yield c, activities
+
+    def submit_partition_query(self, filename: str, query_text: str, params: Tuple = ()) -> List[Any]:
+        """Fetch the results of a query of a partition file, opened read-only"""
+        conn = self.connect_partition(filename, read_only=True)
+        try:
+            return conn.execute(query_text, params).fetchall()
+        finally:
+            conn.close()
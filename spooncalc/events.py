@@ -0,0 +1,100 @@
+"""
+Typed change events published by Database, such that screens and caches
+can apply small deltas rather than rerunning whole queries.
+
+Events are published after the change is committed, synchronously in the
+thread that made the change.
+"""
+
+from __future__ import annotations
+
+from collections import defaultdict
+from dataclasses import (
+    dataclass,
+    field,
+)
+from typing import (
+    Callable,
+    Dict,
+    List,
+    Type,
+)
+
+from spooncalc.models.activitylog import ActivityLog
+
+
+@dataclass(frozen=True)
+class LogInserted:
+    """A single activity log was inserted"""
+
+    log: ActivityLog
+
+
+@dataclass(frozen=True)
+class LogsDeleted:
+    """
+    Activity logs were deleted
+
+    Attributes
+    ----------
+    ids : list(int)
+        the ids of the deleted logs
+    logs : list(ActivityLog)
+        the deleted logs, as they were stored
+    """
+
+    ids: List[int]
+    logs: List[ActivityLog] = field(default_factory=list)
+
+
+@dataclass(frozen=True)
+class BulkImportDone:
+    """
+    Many logs were changed at once, e.g. by an import, sync, restore or
+    any batch, which suppresses the events of individual logs. Consumers
+    should refresh everything they cache.
+
+    Attributes
+    ----------
+    inserted : int
+        the number of inserted logs
+    deleted : int
+        the number of deleted logs
+    """
+
+    inserted: int = 0
+    deleted: int = 0
+
+
+Event = object  # any of the event classes above
+Callback = Callable[[Event], None]
+
+
+class EventBus:
+    """
+    Delivers published events to the callbacks subscribed to their type.
+
+    Examples
+    --------
+    >>> bus = EventBus()
+    >>> bus.subscribe(LogInserted, lambda event: print(event.log.name))
+    >>> bus.publish(LogInserted(log))
+    walk
+    """
+
+    def __init__(self) -> None:
+        self.subscribers: Dict[Type, List[Callback]] = defaultdict(list)
+
+    def subscribe(self, event_type: Type, callback: Callback) -> None:
+        """Call `callback` with every published event of `event_type`"""
+        self.subscribers[event_type].append(callback)
+
+    def unsubscribe(self, event_type: Type, callback: Callback) -> None:
+        """Stop calling `callback` with events of `event_type`"""
+        if callback in self.subscribers[event_type]:
+            self.subscribers[event_type].remove(callback)
+
+    def publish(self, event: Event) -> None:
+        """Call every callback subscribed to the type of `event`"""
+        for callback in list(self.subscribers[type(event)]):
+            callback(event)
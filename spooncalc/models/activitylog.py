@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import hashlib
 from dataclasses import dataclass
 from datetime import (
     datetime,
@@ -7,6 +8,7 @@ from datetime import (
 )
 from typing import (
     Any,
+    Dict,
     Optional,
     Union,
 )
@@ -33,15 +35,34 @@ QUALIFIERS = [
     "exercise",
     "misc",
 ]
+# The bit of each qualifier in a qualifier bitmask
+QUALIFIER_BITS = {qual: 1 << bit for bit, qual in enumerate(QUALIFIERS)}
+
+
+def qualifier_bitmask(log: ActivityLog) -> int:
+    """Pack the qualifiers of an activity log into an integer, one bit per
+    qualifier in the order of QUALIFIERS"""
+    mask = 0
+    for qual, bit in QUALIFIER_BITS.items():
+        if getattr(log, qual):
+            mask |= bit
+    return mask
+
+
+def qualifiers_from_bitmask(mask: int) -> Dict[str, bool]:
+    """Unpack a qualifier bitmask (see `qualifier_bitmask`)"""
+    return {qual: bool(mask >> bit & 1) for bit, qual in enumerate(QUALIFIERS)}
 
 
 def clean_param(param: Any) -> Union[datetime, bool, float, str]:
     if not isinstance(param, str):
         return param
-    try:
-        return datetime.strptime(param, timeutils.DATETIME_FORMATSTRING)
-    except ValueError:
-        pass
+    # Only attempt (slow) datetime parsing on strings that could be datetimes
+    if param[:1].isdigit() and ":" in param:
+        try:
+            return datetime.strptime(param, timeutils.DATETIME_FORMATSTRING)
+        except ValueError:
+            pass
 
     # Handle booleans
     if param.lower() == "true":
@@ -89,7 +110,7 @@ class ActivityLog:
 
     def is_everything_today(self) -> bool:
         """Check if start and end datetimes are today"""
-        return self.start.date() == self.end.date() == datetime.now().date()
+        return self.start.date() == self.end.date() == timeutils.clock.now().date()
 
     def get_spoons(self) -> float:
         """
@@ -102,6 +123,24 @@ class ActivityLog:
 
         return self.hours * (self.cogload + augmented_physload)
 
+    def get_content_hash(self) -> str:
+        """
+        Calculate a hash of the canonical values of every field but `id`.
+
+        Logs describing the same activity hash identically, regardless of
+        how their values were stored or parsed (e.g. "1" and 1.0).
+        """
+        canonical = [
+            self.start.strftime(timeutils.DATETIME_FORMATSTRING),
+            self.end.strftime(timeutils.DATETIME_FORMATSTRING),
+            str(self.name).strip(),
+            repr(float(self.cogload)),
+            repr(float(self.physload)),
+            repr(float(self.energy)),
+        ]
+        canonical += ["1" if getattr(self, qual) else "0" for qual in QUALIFIERS]
+        return hashlib.sha1("\x1f".join(canonical).encode("utf-8")).hexdigest()
+
     @property
     def spoons(self) -> float:
         return self.get_spoons()
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Set,
+    Tuple,
+)
+
+
+class BinStats:
+    """
+    Running mean and variance of a sample per time bin, e.g. of the
+    cumulative spoons of a day at each 15 minutes.
+
+    Samples are accumulated by Welford's algorithm, which is numerically
+    stable, and can be removed again, such that the statistics of a
+    rolling window are kept without revisiting every sample.
+
+    Attributes
+    ----------
+    n : int
+        the number of accumulated samples (of every bin)
+    means : list(float)
+        the mean of each bin
+    m2s : list(float)
+        the sum of squared deviations from the mean of each bin
+    """
+
+    def __init__(self, n_bins: int) -> None:
+        self.n = 0
+        self.means = [0.0] * n_bins
+        self.m2s = [0.0] * n_bins
+
+    def add(self, samples: List[float]) -> None:
+        """Accumulate a sample of every bin"""
+        self.n += 1
+        for i, x in enumerate(samples):
+            delta = x - self.means[i]
+            self.means[i] += delta / self.n
+            self.m2s[i] += delta * (x - self.means[i])
+
+    def remove(self, samples: List[float]) -> None:
+        """Remove a previously accumulated sample of every bin"""
+        if self.n <= 1:
+            self.n = 0
+            self.means = [0.0] * len(self.means)
+            self.m2s = [0.0] * len(self.m2s)
+            return
+        self.n -= 1
+        for i, x in enumerate(samples):
+            delta = x - self.means[i]
+            self.means[i] -= delta / self.n
+            # Clamp rounding errors, as m2 can't be negative
+            self.m2s[i] = max(0.0, self.m2s[i] - delta * (x - self.means[i]))
+
+    def stdevs(self) -> List[float]:
+        """Get the (population) standard deviation of each bin"""
+        if self.n == 0:
+            return [0.0] * len(self.m2s)
+        return [(m2 / self.n) ** 0.5 for m2 in self.m2s]
+
+    def band(self) -> Tuple[List[float], List[float], List[float]]:
+        """
+        Get the mean of each bin, and one standard deviation below and
+        above it
+        """
+        stdevs = self.stdevs()
+        below = [mean - stdev for mean, stdev in zip(self.means, stdevs)]
+        above = [mean + stdev for mean, stdev in zip(self.means, stdevs)]
+        return list(self.means), below, above
+
+
+class RollingBinStats:
+    """
+    The BinStats of the samples of a rolling window of days.
+
+    Each day's samples are kept, such that a day can be removed once it
+    leaves the window, or once its logs change (see `invalidate`). Moving
+    the window (see `update`) then only samples the days that are new to
+    it, or changed.
+
+    Attributes
+    ----------
+    stats : BinStats
+        the statistics of the days in the window
+    samples : dict(int: list(float))
+        the samples of each day in the window, keyed by day index
+    dirty : set(int)
+        the days in the window whose samples must be recalculated
+    """
+
+    def __init__(self, n_bins: int) -> None:
+        self.stats = BinStats(n_bins)
+        self.samples: Dict[int, List[float]] = {}
+        self.dirty: Set[int] = set()
+
+    def invalidate(self, days: Iterable[int]) -> None:
+        """Mark the samples of days (by day index) as stale"""
+        self.dirty.update(day for day in days if day in self.samples)
+
+    def invalidate_all(self) -> None:
+        """Mark the samples of every day as stale"""
+        self.dirty.update(self.samples)
+
+    def update(self, days: Iterable[int], sample: Callable[[int], List[float]]) -> int:
+        """
+        Move the window to `days`, removing the days no longer in it and
+        the stale days, then adding the samples of the missing days.
+
+        Parameters
+        ----------
+        days : iterable(int)
+            the day indexes of the window
+        sample : callable
+            gets the samples of a day, given its day index
+
+        Returns
+        -------
+        int
+            the number of days sampled
+        """
+        days = set(days)
+        for day in [day for day in self.samples if day not in days or day in self.dirty]:
+            self.stats.remove(self.samples.pop(day))
+        self.dirty.clear()
+
+        missing = sorted(day for day in days if day not in self.samples)
+        for day in missing:
+            self.samples[day] = sample(day)
+            self.stats.add(self.samples[day])
+        return len(missing)
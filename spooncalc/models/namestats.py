@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import bisect
+from dataclasses import (
+    dataclass,
+    field,
+)
+from datetime import (
+    datetime,
+    timedelta,
+)
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    Optional,
+)
+
+from spooncalc.models.activitylog import QUALIFIERS
+
+
+def most_common(counts: Dict[float, int], default: float = 1.0) -> float:
+    """Get the most frequent value of a histogram, favouring lower values in a tie"""
+    if not counts:
+        return default
+    return max(sorted(counts), key=lambda value: counts[value])
+
+
+@dataclass
+class NameStats:
+    """
+    Statistics of every logged activity sharing a name.
+
+    Attributes
+    ----------
+    name : str
+        the activity name
+    count : int
+        the number of logs with this name
+    last_used : datetime
+        the start time of the most recent log with this name
+    durations : dict(int: int)
+        histogram of log durations, in minutes
+    cogloads : dict(float: int)
+        histogram of cognitive loads
+    physloads : dict(float: int)
+        histogram of physical loads
+    qualifiers : dict(str: int)
+        the number of logs flagged with each qualifier
+    """
+
+    name: str
+    count: int = 0
+    last_used: Optional[datetime] = None
+    durations: Dict[int, int] = field(default_factory=dict)
+    cogloads: Dict[float, int] = field(default_factory=dict)
+    physloads: Dict[float, int] = field(default_factory=dict)
+    qualifiers: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def median_duration(self) -> timedelta:
+        """The (lower) median duration of all logs with this name"""
+        if not self.durations:
+            return timedelta(hours=1)
+        target = (self.count + 1) // 2
+        seen = 0
+        for minutes in sorted(self.durations):
+            seen += self.durations[minutes]
+            if seen >= target:
+                break
+        return timedelta(minutes=minutes)
+
+    @property
+    def cogload(self) -> float:
+        """The most common cognitive load"""
+        return most_common(self.cogloads)
+
+    @property
+    def physload(self) -> float:
+        """The most common physical load"""
+        return most_common(self.physloads)
+
+    def qualifier_frequency(self, qual: str) -> float:
+        """The fraction of logs flagged with qualifier `qual`"""
+        if self.count == 0:
+            return 0.0
+        return self.qualifiers.get(qual, 0) / self.count
+
+    def typical_qualifiers(self, threshold: float = 0.5) -> List[str]:
+        """The qualifiers flagged in at least `threshold` of logs"""
+        return [qual for qual in QUALIFIERS if self.qualifier_frequency(qual) >= threshold]
+
+
+class NameIndex:
+    """
+    An in-memory prefix index of activity names, for autocompletion
+    without querying the database on every keypress.
+
+    Names are matched case-insensitively, and completions are ranked by
+    how often, then how recently, they were used.
+    """
+
+    def __init__(self, stats: Iterable[NameStats] = ()) -> None:
+        self.stats: Dict[str, NameStats] = {}
+        self.keys: List[str] = []  # sorted lowercase names
+        self.names_by_key: Dict[str, List[str]] = {}
+        for name_stats in stats:
+            self.update(name_stats)
+
+    def update(self, name_stats: NameStats) -> None:
+        """Add or replace the statistics of a name"""
+        name = name_stats.name
+        if name not in self.stats:
+            key = name.lower()
+            if key not in self.names_by_key:
+                bisect.insort(self.keys, key)
+                self.names_by_key[key] = []
+            self.names_by_key[key].append(name)
+        self.stats[name] = name_stats
+
+    def remove(self, name: str) -> None:
+        """Forget a name, e.g. once its last log is deleted"""
+        if name not in self.stats:
+            return
+        del self.stats[name]
+        key = name.lower()
+        self.names_by_key[key].remove(name)
+        if not self.names_by_key[key]:
+            del self.names_by_key[key]
+            del self.keys[bisect.bisect_left(self.keys, key)]
+
+    def complete(self, prefix: str, limit: int = 3) -> List[NameStats]:
+        """
+        Get the statistics of up to `limit` names starting with `prefix`,
+        most used first.
+        """
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self.keys, prefix)
+        matches = []
+        for key in self.keys[start:]:
+            if not key.startswith(prefix):
+                break
+            matches += [self.stats[name] for name in self.names_by_key[key]]
+
+        matches.sort(key=lambda s: (s.count, s.last_used or datetime.min), reverse=True)
+        return matches[:limit]
@@ -0,0 +1,167 @@
+"""
+A collection of helper functions for preparing data for plots
+"""
+
+from __future__ import annotations
+
+from typing import (
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+Point = Tuple[float, float]
+
+# Default budget of plotted points per horizontal pixel of a graph
+POINTS_PER_PIXEL = 0.5
+# Fewer points than this are never worth downsampling
+MIN_POINTS = 16
+
+
+def point_budget(width: float, points_per_pixel: float = POINTS_PER_PIXEL) -> int:
+    """
+    Get the maximum number of points worth plotting on a graph
+    `width` pixels wide.
+
+    Parameters
+    ----------
+    width : float
+        the width of the graph, in pixels
+    points_per_pixel : float
+        the number of points allowed per pixel
+    """
+    return max(MIN_POINTS, int(width * points_per_pixel))
+
+
+def lttb(points: Sequence[Point], threshold: int) -> List[Point]:
+    """
+    Downsample a series with the Largest-Triangle-Three-Buckets algorithm.
+
+    The points between the first and last are split into `threshold` - 2
+    buckets. From each bucket, the point forming the largest triangle with
+    the previously selected point and the average of the next bucket is
+    kept. This preserves peaks, troughs and steps in the shape of the series.
+
+    Parameters
+    ----------
+    points : list((float, float))
+        the (x, y) points of the series, sorted by x
+    threshold : int
+        the maximum number of points to keep
+
+    Returns
+    -------
+    list((float, float))
+        at most `threshold` points of the original series, including the
+        first and last
+
+    Examples
+    --------
+    >>> lttb([(0, 0), (1, 5), (2, 0), (3, 0), (4, 0)], 3)
+    [(0, 0), (1, 5), (4, 0)]
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0  # index of the previously selected point
+    for i in range(threshold - 2):
+        # Average point of the next bucket (the last point for the last bucket)
+        avg_start = int((i + 1) * bucket_size) + 1
+        avg_end = min(int((i + 2) * bucket_size) + 1, n)
+        avg_x = 0.0
+        avg_y = 0.0
+        for x, y in points[avg_start:avg_end]:
+            avg_x += x
+            avg_y += y
+        avg_x /= avg_end - avg_start
+        avg_y /= avg_end - avg_start
+
+        # Select the point of this bucket with the largest triangle area
+        ax, ay = points[a]
+        max_area = -1.0
+        for j in range(int(i * bucket_size) + 1, int((i + 1) * bucket_size) + 1):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                a = j
+        sampled.append(points[a])
+
+    sampled.append(points[-1])
+    return sampled
+
+
+def downsample(
+    points: Sequence[Point],
+    width: float,
+    points_per_pixel: Optional[float] = POINTS_PER_PIXEL,
+) -> List[Point]:
+    """
+    Downsample points to the budget of a graph `width` pixels wide.
+
+    If `points_per_pixel` is None, all points are kept.
+    """
+    points = list(points)
+    if points_per_pixel is None:
+        return points
+    return lttb(points, point_budget(width, points_per_pixel))
+
+
+def simplify(xs: Sequence[float], series: Sequence[Sequence[float]], tolerance: float) -> List[int]:
+    """
+    Simplify series sharing x values with the Ramer-Douglas-Peucker
+    algorithm, to within a vertical error of `tolerance`.
+
+    A stretch of points is replaced by the chord between its ends, unless
+    the point furthest (vertically) from the chord, in any of the series,
+    is further than `tolerance`, in which case the stretch is split at that
+    point. Unlike LTTB, the number of kept points adapts to the shape of
+    the series: flat or straight stretches collapse to their ends.
+
+    Parameters
+    ----------
+    xs : list(float)
+        the x values shared by every series, sorted
+    series : list(list(float))
+        the y values of each series
+    tolerance : float
+        the maximum vertical distance of a removed point from the
+        simplified series
+
+    Returns
+    -------
+    list(int)
+        the sorted indexes of the kept points, including the first and last
+
+    Examples
+    --------
+    >>> simplify([0, 1, 2, 3, 4], [[0, 1, 2, 2, 2]], 0.1)
+    [0, 2, 4]
+    """
+    n = len(xs)
+    if n < 3:
+        return list(range(n))
+
+    keep = {0, n - 1}
+    stretches = [(0, n - 1)]
+    while stretches:
+        first, last = stretches.pop()
+        dx = xs[last] - xs[first]
+        max_error = 0.0
+        split = first
+        for i in range(first + 1, last):
+            # Position along the chord (a vertical jump has no run)
+            fraction = (xs[i] - xs[first]) / dx if dx else 0.5
+            for ys in series:
+                error = abs(ys[i] - (ys[first] + fraction * (ys[last] - ys[first])))
+                if error > max_error:
+                    max_error = error
+                    split = i
+        if max_error > tolerance:
+            keep.add(split)
+            stretches += [(first, split), (split, last)]
+    return sorted(keep)
@@ -0,0 +1,328 @@
+"""
+Compose filtered queries of activity logs, compiled to parameterised SQL.
+
+Filters (date ranges, qualifiers, names, loads and durations) become WHERE
+conditions, such that sqlite3 can use its indexes (e.g. of day indexes and
+start times) and only matching rows, and only the requested columns, are
+ever read into Python. Date ranges also limit the year partitions (see
+Database.archive_year) that are read.
+
+Examples
+--------
+>>> query = db.query().between_offsets(-7, 0).with_qualifiers("social")
+>>> query.in_range("hours", low=1).columns("day", "spoons")
+{'day': [19640, 19642], 'spoons': [3.5, 2.0]}
+>>> query.aggregate("total", "spoons")
+5.5
+"""
+
+from __future__ import annotations
+
+from copy import copy
+from datetime import datetime
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+from spooncalc import timeutils
+from spooncalc.models.activitylog import (
+    QUALIFIER_BITS,
+    ActivityLog,
+)
+
+if TYPE_CHECKING:
+    from spooncalc.dbtools import Database
+
+# Columns fetched column-wise, i.e. a list of values per column name
+Columns = Dict[str, List[Any]]
+
+# Columns whose (text) values are compared and returned as numbers
+NUMERIC_COLUMNS = ("cogload", "physload", "energy")
+# Columns whose values are returned as datetimes
+DATETIME_COLUMNS = ("start", "end")
+AGGREGATE_FUNCTIONS = ("count", "sum", "total", "min", "max", "avg")
+
+
+class ActivityQuery:
+    """
+    A filtered query of the activities table of a database.
+
+    Each filter returns a new query, so a query can be shared and refined
+    without affecting other queries built from it. Nothing is read from
+    the database until the query is fetched, as logs, rows, columns or
+    an aggregate.
+
+    Any column can be projected, filtered or aggregated by name, be it a
+    stored column (e.g. "name", "cogload", "day"), a qualifier (as 0 or 1)
+    or a derived "hours" or "spoons" column.
+
+    Attributes
+    ----------
+    db : Database
+        a reference to the database wrapper being queried
+    conditions : list(str)
+        the conditions of the WHERE clause, all of which must hold
+    params : list
+        the values of the placeholders of `conditions`, in order
+    ordering : list(str)
+        the terms of the ORDER BY clause
+    limit_count : int | None
+        the maximum number of fetched rows
+    days : (int | None, int | None)
+        the first and last day index of the matching logs, as far as the
+        filters tell, or None if unbounded
+    """
+
+    def __init__(self, db: Database) -> None:
+        self.db = db
+        self.conditions: List[str] = []
+        self.params: List[Any] = []
+        self.ordering: List[str] = []
+        self.limit_count: Optional[int] = None
+        self.days: Tuple[Optional[int], Optional[int]] = (None, None)
+
+    def column_sql(self, column: str) -> str:
+        """
+        Get the SQL expression of a column
+
+        Raises
+        ------
+        ValueError
+            if `column` isn't an activities column
+        """
+        if column == "hours":
+            return self.db.HOURS_SQL
+        if column == "spoons":
+            return self.db.SPOONS_SQL
+        if column in QUALIFIER_BITS:
+            return f"({self.qualifier_sql(column)} != 0)"
+        if column in NUMERIC_COLUMNS:
+            return f"CAST({column} AS REAL)"
+        if column in self.db.LOG_COLNAMES or column == "day":
+            return column
+        raise ValueError(f"Unknown column: {column}")
+
+    def where(self, condition: str, *params: Any) -> ActivityQuery:
+        """Get a copy of this query, additionally filtered by an SQL condition"""
+        query = copy(self)
+        query.conditions = self.conditions + [condition]
+        query.params = self.params + list(params)
+        return query
+
+    def within_days(self, first: int, last: int) -> ActivityQuery:
+        """
+        Get a copy of this query, noting that its logs are of the day
+        indexes [first, last]. This adds no condition.
+        """
+        query = copy(self)
+        query.days = (
+            first if self.days[0] is None else max(first, self.days[0]),
+            last if self.days[1] is None else min(last, self.days[1]),
+        )
+        return query
+
+    def between_offsets(self, start: int, end: int) -> ActivityQuery:
+        """Filter logs of the days between day offsets [start, end)"""
+        with timeutils.clock.frozen():
+            params = (timeutils.day_index_from_offset(start), timeutils.day_index_from_offset(end))
+        return self.where("day >= ? AND day < ?", *params).within_days(params[0], params[1] - 1)
+
+    def between(self, start: datetime, end: datetime) -> ActivityQuery:
+        """Filter logs starting between the datetimes [start, end)"""
+        query = self.where(
+            "start >= ? AND start < ?",
+            start.strftime(self.db.DATETIME_FORMATSTRING),
+            end.strftime(self.db.DATETIME_FORMATSTRING),
+        )
+        return query.within_days(timeutils.day_index(start), timeutils.day_index(end))
+
+    def with_qualifiers(self, *qualifiers: str) -> ActivityQuery:
+        """Filter logs with all of `qualifiers`"""
+        query = self
+        for qual in qualifiers:
+            query = query.where(self.qualifier_sql(qual))
+        return query
+
+    def without_qualifiers(self, *qualifiers: str) -> ActivityQuery:
+        """Filter logs with none of `qualifiers`"""
+        query = self
+        for qual in qualifiers:
+            query = query.where(f"NOT {self.qualifier_sql(qual)}")
+        return query
+
+    def qualifier_sql(self, qual: str) -> str:
+        """
+        Get the SQL condition of logs having a qualifier. The bit is inlined
+        (rather than a parameter) such that the partial index of the
+        qualifier's logs can be used.
+        """
+        if qual not in QUALIFIER_BITS:
+            raise ValueError(f"Unknown qualifier: {qual}")
+        return self.db.QUALIFIER_SQL.format(bit=QUALIFIER_BITS[qual])
+
+    def name_contains(self, text: str) -> ActivityQuery:
+        """Filter logs whose name contains `text` (see Database.search_condition)"""
+        condition, params = self.db.search_condition(text)
+        return self.where(condition, *params)
+
+    def name_like(self, pattern: str) -> ActivityQuery:
+        """Filter logs whose name matches an SQL LIKE pattern, e.g. "walk%" """
+        return self.where("name LIKE ?", pattern)
+
+    def names(self, *names: str) -> ActivityQuery:
+        """Filter logs named any of `names`"""
+        return self.where(f"name IN ({', '.join('?' for _ in names)})", *names)
+
+    def in_range(
+        self,
+        column: str,
+        low: Optional[float] = None,
+        high: Optional[float] = None,
+    ) -> ActivityQuery:
+        """
+        Filter logs whose value of a numeric column lies within [low, high]
+
+        Parameters
+        ----------
+        column : str
+            e.g. "cogload", "physload", "hours" or "spoons"
+        low : float | None
+            the (inclusive) lower limit, if any
+        high : float | None
+            the (inclusive) upper limit, if any
+        """
+        query = self
+        if low is not None:
+            query = query.where(f"{self.column_sql(column)} >= ?", low)
+        if high is not None:
+            query = query.where(f"{self.column_sql(column)} <= ?", high)
+        return query
+
+    def order_by(self, *columns: str, descending: bool = False) -> ActivityQuery:
+        """Get a copy of this query, additionally ordered by `columns`"""
+        query = copy(self)
+        direction = "DESC" if descending else "ASC"
+        query.ordering = self.ordering + [f"{self.column_sql(column)} {direction}" for column in columns]
+        return query
+
+    def limit(self, count: int) -> ActivityQuery:
+        """Get a copy of this query, fetching at most `count` rows"""
+        query = copy(self)
+        query.limit_count = count
+        return query
+
+    def compile(
+        self,
+        columns: List[str],
+        group_by: Optional[str] = None,
+        source: str = "activities",
+    ) -> Tuple[str, List[Any]]:
+        """
+        Compile the query to SQL
+
+        Parameters
+        ----------
+        columns : list(str)
+            the SQL expressions of the selected columns
+        group_by : str | None
+            the SQL expression rows are grouped by, if any
+        source : str
+            the SQL table expression of the logs (see
+            Database.activities_source)
+
+        Returns
+        -------
+        (str, list)
+            the query text and the values of its placeholders
+        """
+        query_text = f"SELECT {', '.join(columns)} FROM {source}"
+        params = list(self.params)
+        if self.conditions:
+            query_text += " WHERE " + " AND ".join(f"({condition})" for condition in self.conditions)
+        if group_by is not None:
+            query_text += f" GROUP BY {group_by}"
+        if self.ordering:
+            query_text += " ORDER BY " + ", ".join(self.ordering)
+        if self.limit_count is not None:
+            query_text += " LIMIT ?"
+            params.append(self.limit_count)
+        return query_text, params
+
+    def fetch(self, columns: List[str], group_by: Optional[str] = None) -> List[Tuple[Any, ...]]:
+        """Compile and run the query, reading only the partitions of its days"""
+        with self.db.routed_cursor(*self.days) as (c, activities):
+            query_text, params = self.compile(columns, group_by, activities)
+            c.execute(query_text, params)
+            return c.fetchall()
+
+    def rows(self, *columns: str) -> List[Tuple[Any, ...]]:
+        """
+        Fetch the values of `columns` of each matching log.
+
+        Qualifiers are returned as 0 or 1, loads, hours and spoons as
+        floats, and start and end times as datetimes.
+        """
+        contents = self.fetch([self.column_sql(column) for column in columns])
+
+        datetime_positions = [i for i, column in enumerate(columns) if column in DATETIME_COLUMNS]
+        if not datetime_positions:
+            return contents
+        rows = []
+        for entry in contents:
+            row = list(entry)
+            for i in datetime_positions:
+                row[i] = datetime.strptime(row[i], self.db.DATETIME_FORMATSTRING)
+            rows.append(tuple(row))
+        return rows
+
+    def columns(self, *columns: str) -> Columns:
+        """Fetch the values of `columns` of the matching logs, column-wise (see `rows`)"""
+        rows = self.rows(*columns)
+        if not rows:
+            return {column: [] for column in columns}
+        return {column: list(values) for column, values in zip(columns, zip(*rows))}
+
+    def logs(self) -> List[ActivityLog]:
+        """Fetch the matching logs"""
+        colnames = list(self.db.LOG_COLNAMES)
+        contents = self.fetch(colnames)
+        return [self.db.row_to_activitylog(colnames, entry) for entry in contents]
+
+    def aggregate(
+        self,
+        function: str,
+        column: str = "id",
+        group_by: Optional[str] = None,
+    ) -> Any:
+        """
+        Aggregate a column of the matching logs.
+
+        Parameters
+        ----------
+        function : str {"count", "sum", "total", "min", "max", "avg"}
+            the SQL aggregate function. Unlike "sum", "total" is 0.0
+            (rather than None) when no logs match.
+        column : str
+            the aggregated column
+        group_by : str | None
+            the column logs are grouped by, if any
+
+        Returns
+        -------
+        Any | dict
+            the aggregate, or if grouped, the aggregate of each group keyed
+            by its value of `group_by`
+        """
+        if function not in AGGREGATE_FUNCTIONS:
+            raise ValueError(f"Unknown aggregate function: {function}")
+        expression = f"{function.upper()}({self.column_sql(column)})"
+        if group_by is None:
+            return self.fetch([expression])[0][0]
+
+        key = self.column_sql(group_by)
+        return dict(self.fetch([key, expression], group_by=key))
@@ -6,14 +6,28 @@ from datetime import (
     timedelta,
 )
 from pathlib import Path
+from typing import (
+    Optional,
+    Tuple,
+)
 
 from kivy.lang import Builder
 from kivy.properties import StringProperty
+from kivy.uix.button import Button
 from kivy.uix.screenmanager import Screen
 
 from spooncalc import timeutils
 from spooncalc.dbtools import Database
+from spooncalc.events import (
+    BulkImportDone,
+    LogInserted,
+    LogsDeleted,
+)
 from spooncalc.models.activitylog import ActivityLog
+from spooncalc.models.namestats import (
+    NameIndex,
+    NameStats,
+)
 
 Builder.load_file(os.path.join(Path(__file__).parent.absolute(), "inputscreen.kv"))
 
@@ -36,6 +50,13 @@ class InputScreen(Screen):
         the physical load of activity (from 0 to 2 spoons per hour)
     energ : float
         the current energy level of user (0, 1, or 2)
+    name_index : NameIndex
+        statistics of all previously logged activity names, kept up to
+        date by database events, used to suggest (and prefill) activities
+        as the name is typed
+    confirmed_times : (datetime, datetime) | None
+        the start and end times for which an overlap with existing logs
+        was warned of, such that saving again confirms the overlap
     """
 
     title = StringProperty()
@@ -54,10 +75,34 @@ class InputScreen(Screen):
         "physload_boost",
         "misc",
     )
+    # Toggle ids of each load value
+    COGLOAD_TOGGLES = {0.0: "cog_vlow", 0.5: "cog_low", 1.0: "cog_mid", 1.5: "cog_high", 2.0: "cog_vhigh"}
+    PHYSLOAD_TOGGLES = {0.0: "phys_vlow", 0.5: "phys_low", 1.0: "phys_mid", 1.5: "phys_high", 2.0: "phys_vhigh"}
+    # Maximum number of suggested activity names
+    N_SUGGESTIONS = 3
 
     def __init__(self, db, **kwargs) -> None:
         super().__init__(**kwargs)
         self.db: Database = db
+        self.name_index = NameIndex(self.db.get_name_stats())
+        self.confirmed_times: Optional[Tuple[datetime, datetime]] = None
+        self.db.events.subscribe(LogInserted, self.on_logs_changed)
+        self.db.events.subscribe(LogsDeleted, self.on_logs_changed)
+        self.db.events.subscribe(BulkImportDone, self.on_logs_changed)
+
+    def on_logs_changed(self, event: LogInserted | LogsDeleted | BulkImportDone) -> None:
+        """Refresh the statistics of the names of changed logs"""
+        if isinstance(event, BulkImportDone):
+            self.name_index = NameIndex(self.db.get_name_stats())
+            return
+
+        logs = [event.log] if isinstance(event, LogInserted) else event.logs
+        for name in {log.name for log in logs}:
+            stats = self.db.get_name_stats(name)
+            if not stats:
+                self.name_index.remove(name)
+            for name_stats in stats:
+                self.name_index.update(name_stats)
 
     def on_pre_enter(self) -> None:
         """
@@ -70,6 +115,7 @@ class InputScreen(Screen):
         # Initialize activitylog
         start, end = self.get_default_times()
         self.activitylog = ActivityLog(start=start, end=end)
+        self.confirmed_times = None
 
         # Initialize screen display
         self.title = "Log Activity"
@@ -86,6 +132,48 @@ class InputScreen(Screen):
         for qual_id in self.QUALIFIERS:
             self.ids[qual_id].state = "normal"
 
+        self.ids.suggestions.clear_widgets()
+
+    def on_name_text(self, text: str) -> None:
+        """
+        Suggest previously logged activities whose names start with the
+        typed `text`, served from the in-memory name index.
+        """
+        self.ids.suggestions.clear_widgets()
+        if not text or not hasattr(self, "activitylog") or text == self.activitylog.name:
+            return
+
+        for name_stats in self.name_index.complete(text, limit=self.N_SUGGESTIONS):
+            if name_stats.name == text:
+                continue
+            button = Button(text=name_stats.name, font_size=self.ids.activity_name.font_size * 0.6)
+            button.bind(on_release=lambda _, stats=name_stats: self.prefill(stats))
+            self.ids.suggestions.add_widget(button)
+
+    def prefill(self, name_stats: NameStats) -> None:
+        """
+        Prefill the name, loads, qualifiers and duration from the typical
+        values of a previously logged activity. The end time is kept.
+        """
+        self.activitylog.name = name_stats.name
+        self.ids.activity_name.text = name_stats.name
+
+        for toggles, load in [
+            (self.COGLOAD_TOGGLES, name_stats.cogload),
+            (self.PHYSLOAD_TOGGLES, name_stats.physload),
+        ]:
+            toggle_id = toggles.get(load)
+            if toggle_id is not None and self.ids[toggle_id].state == "normal":
+                self.ids[toggle_id]._do_press()
+
+        typical_qualifiers = name_stats.typical_qualifiers()
+        for qual_id in self.QUALIFIERS:
+            qual = "boost" if qual_id == "physload_boost" else qual_id
+            self.ids[qual_id].state = "down" if qual in typical_qualifiers else "normal"
+
+        self.activitylog.start = self.activitylog.end - name_stats.median_duration
+        self.update_time_displays()
+
     def get_default_times(self) -> tuple[datetime, datetime]:
         """
         Initialize default end and start times.
@@ -187,8 +275,20 @@ class InputScreen(Screen):
     def on_save_press(self) -> None:
         """
         Handle press of "Save" button
+
+        If the activity overlaps existing logs, the first press only warns
+        of the overlap, and a second press (with the same times) saves.
         """
 
+        times = (self.activitylog.start, self.activitylog.end)
+        if times != self.confirmed_times:
+            overlapping = self.db.find_overlapping(*times)
+            if overlapping:
+                self.confirmed_times = times
+                others = f" (+{len(overlapping) - 1})" if len(overlapping) > 1 else ""
+                self.title = f"Overlaps {overlapping[0].name}{others}! Save again?"
+                return
+
         successful = self.insert_into_database()
         if successful:
             self.manager.switch_screen("menuscreen")
@@ -7,10 +7,20 @@ from kivy.uix.label import Label
 from spooncalc.models.activitylog import ActivityLog
 
 
+def timetext(activitylog: ActivityLog, show_date: bool = False) -> str:
+    """Generate text for the time label of a log, e.g. 9:00-10:00"""
+
+    start = activitylog.start.strftime("%H:%M")
+    end = activitylog.end.strftime("%H:%M")
+    if show_date:
+        return f"{activitylog.start.strftime('%d.%m.%y')} {start}-{end}"
+    return f"{start}-{end}"
+
+
 class EntryBox(BoxLayout):
     """
-    A class that serves as a display widget for activity logs in
-    the StackedLogsLayout.
+    A class that serves as a display widget for activity logs, e.g. in
+    the SearchScreen.
 
     Attributes
     ----------
@@ -19,7 +29,7 @@ class EntryBox(BoxLayout):
         displays
     """
 
-    def __init__(self, activitylog: ActivityLog, **kwargs) -> None:
+    def __init__(self, activitylog: ActivityLog, show_date: bool = False, **kwargs) -> None:
         """
         Initialize the EntryBox with the data from a database entry
         corresponding to a logged activity.
@@ -32,14 +42,16 @@ class EntryBox(BoxLayout):
 
         Each EntryBox also has a CheckBox as the final element. All the
         CheckBoxes are assigned to the same group, which allows for
-        a specific EntryBox to be selected, and thereby acted upon,
-        e.g. StackedLogsLayout.delete_entry
+        a specific EntryBox to be selected, and thereby acted upon.
 
         Parameters
         ----------
         activitylog: ActivityLog
             An activity log built from the contents of a database entry.
             This activity log must have a unique id
+        show_date: bool
+            Include the date in the time label, e.g. for logs spanning
+            many days
         """
 
         super().__init__(
@@ -51,6 +63,7 @@ class EntryBox(BoxLayout):
             raise UserWarning("Require an id generated from database")
         self.activitylog = activitylog
         self.db_id = activitylog.id
+        self.show_date = show_date
         self.orientation = "horizontal"
 
         time_label = Label(text=self.get_timetext(), size_hint=(0.2, 1))
@@ -73,6 +86,4 @@ class EntryBox(BoxLayout):
     def get_timetext(self) -> str:
         """Generate text for the time label, e.g. 9:00-10:00"""
 
-        start = self.activitylog.start.strftime("%H:%M")
-        end = self.activitylog.end.strftime("%H:%M")
-        return f"{start}-{end}"
+        return timetext(self.activitylog, self.show_date)
@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+from datetime import (
+    date,
+    datetime,
+)
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+from kivy.clock import Clock
+from kivy.properties import (
+    BooleanProperty,
+    NumericProperty,
+    StringProperty,
+)
+from kivy.uix.behaviors import ButtonBehavior
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.label import Label
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+
+from spooncalc import timeutils
+from spooncalc.dbtools import Database
+from spooncalc.events import (
+    BulkImportDone,
+    LogInserted,
+    LogsDeleted,
+)
+from spooncalc.models.activitylog import ActivityLog
+
+from .entrybox import timetext
+
+
+class LogRow(RecycleDataViewBehavior, BoxLayout):
+    """
+    A recycled row displaying an activity log, laid out in kivy lang.
+
+    Its properties are set from an item of LogsList.data, so a row holds
+    no state of its own: scrolling reuses the same few rows for every log.
+    """
+
+    log_id = NumericProperty(0)
+    time_text = StringProperty()
+    activity_name = StringProperty()
+    cogload = StringProperty()
+    physload = StringProperty()
+    spoons = StringProperty()
+    selected = BooleanProperty(False)
+
+    def refresh_view_attrs(self, rv: LogsList, index: int, data: Dict[str, Any]) -> None:
+        """Remember which item of the data this row currently displays"""
+        self.rv = rv
+        self.index = index
+        super().refresh_view_attrs(rv, index, data)
+
+    def on_checkbox_active(self, active: bool) -> None:
+        """Store the selection in the data, which outlives this row"""
+        if getattr(self, "rv", None) is not None:
+            self.rv.select(self.index, active)
+
+
+class DayHeader(RecycleDataViewBehavior, ButtonBehavior, Label):
+    """A recycled row heading the logs of a day, selecting them all on release"""
+
+    def refresh_view_attrs(self, rv: LogsList, index: int, data: Dict[str, Any]) -> None:
+        """Remember which item of the data this row currently displays"""
+        self.rv = rv
+        self.index = index
+        super().refresh_view_attrs(rv, index, data)
+
+    def on_release(self) -> None:
+        """Toggle the selection of every log of this day"""
+        if getattr(self, "rv", None) is not None:
+            self.rv.select_day(self.index)
+
+
+class LogsList(RecycleView):
+    """
+    A virtualised list of all activity logs, latest first, grouped by day.
+
+    Logs are fetched a page at a time by keyset pagination, and further
+    pages are fetched as the list is scrolled towards its end.
+
+    Attributes
+    ----------
+    page_size : int
+        the number of logs fetched per page
+    load_threshold : float
+        the scroll position (1 is the top, 0 the bottom) below which the
+        next page is fetched
+    stale : bool
+        whether the displayed logs must be refetched, e.g. after an import
+    """
+
+    page_size = 50
+    load_threshold = 0.2
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.key: Optional[Tuple[datetime, int]] = None
+        self.last_day: Optional[date] = None
+        self.exhausted = False
+        self.stale = True
+
+    def pass_db_reference(self, db: Database) -> None:
+        """Provide this class with reference to object wrapping database"""
+        self.db = db
+        self.db.events.subscribe(LogInserted, self.on_logs_changed)
+        self.db.events.subscribe(BulkImportDone, self.on_logs_changed)
+        self.db.events.subscribe(LogsDeleted, self.on_logs_deleted)
+
+    def on_logs_changed(self, event: LogInserted | BulkImportDone) -> None:
+        """Refetch the logs when next shown"""
+        self.stale = True
+
+    def on_logs_deleted(self, event: LogsDeleted) -> None:
+        """
+        Remove the rows of deleted logs, and any emptied day headers. The
+        header of the last loaded day is kept while further pages remain,
+        as they may hold more logs of that day, which are fetched at once.
+        """
+        deleted = set(event.ids)
+        data = [item for item in self.data if item.get("log_id") not in deleted]
+        self.data = [
+            item
+            for i, item in enumerate(data)
+            if item["viewclass"] != "DayHeader"
+            or (i + 1 < len(data) and data[i + 1]["viewclass"] != "DayHeader")
+            or (i + 1 == len(data) and not self.exhausted)
+        ]
+        if not self.data:
+            self.last_day = None
+        elif self.data[-1]["viewclass"] == "DayHeader":
+            self.load_page()
+
+    def update(self) -> None:
+        """Fetch the first page of logs, if the displayed logs are stale"""
+        if not self.stale:
+            return
+        self.stale = False
+        self.key = None
+        self.last_day = None
+        self.exhausted = False
+        self.data = []
+        self.scroll_y = 1
+        self.load_page()
+
+    def load_page(self) -> None:
+        """Fetch the next page of logs, appending them to the list"""
+        if self.exhausted:
+            return
+        logs = self.db.get_logs_page(before=self.key, limit=self.page_size)
+        self.exhausted = len(logs) < self.page_size
+        if not logs:
+            return
+        self.key = (logs[-1].start, logs[-1].id)
+
+        rows: List[Dict[str, Any]] = []
+        for log in logs:
+            day = timeutils.day_of(log.start)
+            if day != self.last_day:
+                rows.append({"viewclass": "DayHeader", "text": day.strftime("%A %d.%m.%Y")})
+                self.last_day = day
+            rows.append(self.log_row(log))
+
+        # Keep the visible rows in place as the content grows beneath them
+        scrolled = (1 - self.scroll_y) * max(0, self.children[0].height - self.height) if self.children else 0
+        self.data.extend(rows)
+        Clock.schedule_once(lambda dt: self.restore_scroll(scrolled))
+
+    def restore_scroll(self, scrolled: float) -> None:
+        """Scroll such that the content top is `scrolled` pixels above the view top"""
+        scrollable = self.children[0].height - self.height if self.children else 0
+        if scrollable > 0:
+            self.scroll_y = max(0.0, 1 - scrolled / scrollable)
+
+    @staticmethod
+    def log_row(log: ActivityLog) -> Dict[str, Any]:
+        """Get the data item displaying an activity log"""
+        return {
+            "viewclass": "LogRow",
+            "log_id": log.id,
+            "time_text": timetext(log),
+            "activity_name": str(log.name),
+            "cogload": f"{log.cogload:.1f}",
+            "physload": f"{log.physload:.1f}",
+            "spoons": f"{log.spoons:.1f}",
+            "selected": False,
+        }
+
+    def on_scroll_y(self, instance: LogsList, scroll_y: float) -> None:
+        """Fetch the next page when scrolled close to the end"""
+        if self.data and scroll_y <= self.load_threshold:
+            self.load_page()
+
+    def select(self, index: int, selected: bool) -> None:
+        """(De)select the log of a row"""
+        if index >= len(self.data) or self.data[index].get("selected") == selected:
+            return
+        self.data[index]["selected"] = selected
+        self.refresh_from_data()
+
+    def select_day(self, index: int) -> None:
+        """
+        Select every log of the day headed by the row at `index`, or
+        deselect them all if they are all selected already.
+        """
+        day_items = []
+        for item in self.data[index + 1 :]:
+            if item["viewclass"] == "DayHeader":
+                break
+            day_items.append(item)
+        selected = not all(item["selected"] for item in day_items)
+        for item in day_items:
+            item["selected"] = selected
+        self.refresh_from_data()
+
+    def selected_ids(self) -> List[int]:
+        """Get the ids of the selected logs"""
+        return [item["log_id"] for item in self.data if item.get("selected")]
+
+    def delete_selected(self) -> None:
+        """
+        Delete every selected log from the database, in a single
+        transaction. Their rows are removed by the resulting event.
+        """
+        self.db.delete_entries(self.selected_ids())
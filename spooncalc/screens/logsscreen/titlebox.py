@@ -6,7 +6,7 @@ from kivy.uix.label import Label
 
 class TitleBox(BoxLayout):
     """
-    A simple class that serves as a header "row" in the StackedLogsLayout
+    A simple class that serves as a header "row" of lists of logs
     """
 
     def __init__(self, **kwargs) -> None:
@@ -1,6 +1,9 @@
 import os
 from pathlib import Path
-from typing import Callable
+from typing import (
+    Callable,
+    Optional,
+)
 
 from kivy.lang import Builder
 from kivy.properties import StringProperty
@@ -15,6 +18,13 @@ from spooncalc import (
     timeutils,
 )
 from spooncalc.dbtools import Database
+from spooncalc.models.activitylog import ActivityLog
+from spooncalc.models.binstats import RollingBinStats
+from spooncalc.events import (
+    BulkImportDone,
+    LogInserted,
+    LogsDeleted,
+)
 
 Builder.load_file(os.path.join(Path(__file__).parent.absolute(), "menuscreen.kv"))
 
@@ -27,28 +37,105 @@ class MenuScreen(Screen):
     ----------
     spoons_spent_display : StringProperty
         label showing total spoons spent today over the average daily total
+    backup_display : StringProperty
+        label of the backup button, showing the progress of a backup
     plot_initialized : bool
         A flag indicating initialization status of the home screen plot
+    today_stale : bool
+        whether today's logs changed such that today's curve and total
+        must be refetched, rather than updated from database events
+    history_stale : bool
+        whether logs of the past fortnight changed, such that the mean and
+        spread (and average total) must be recalculated
+    bin_stats : RollingBinStats
+        the statistics of the past fortnight's cumulative spoons, updated
+        incrementally, i.e. only for days that changed or are new to it
     """
 
     spoons_spent_display = StringProperty()
+    backup_display = StringProperty("Back up logs")
     plot_initialized = False
 
-    def __init__(self, export_callback: Callable, db: Database, **kwargs) -> None:
+    def __init__(self, export_callback: Callable, backup_callback: Callable, db: Database, **kwargs) -> None:
 
         super().__init__(**kwargs)
         self.export_callback = export_callback
+        self.backup_callback = backup_callback
+        self.backup_running = False
         self.db = db
+        self.today_index = timeutils.day_index_from_offset(0)
+        self.today_stale = True
+        self.history_stale = True
+        self.spoons_today = 0.0
+        self.spoons_average = 0.0
+        self.bin_stats = RollingBinStats(len(analyser.bin_times()))
         # TODO: find out why this must be executed after super().__init__
         self.init_plot()
 
+        self.db.events.subscribe(LogInserted, self.on_log_inserted)
+        self.db.events.subscribe(LogsDeleted, self.on_logs_deleted)
+        self.db.events.subscribe(BulkImportDone, self.on_bulk_import_done)
+
     def on_pre_enter(self) -> None:
         """
-        Methods to execute right before switching to this window
+        Methods to execute right before switching to this window.
+        Only data made stale by database changes (or a new day) is refetched.
         """
 
+        today_index = timeutils.day_index_from_offset(0)
+        if today_index != self.today_index:
+            self.today_index = today_index
+            self.today_stale = self.history_stale = True
+
+        if self.history_stale:
+            self.update_mean_and_spread()
+            self.spoons_average = analyser.fetch_average_spoons_per_day(self.db, -14, 0)
+            self.history_stale = False
+        if self.today_stale:
+            self.spoons_today = analyser.fetch_daily_total(self.db, 0)
+            self.update_plot()
+            self.today_stale = False
+        self.update_spoons_spent_display()
+
+    def day_offset_of(self, log: ActivityLog) -> int:
+        """Get the day offset (from the cached today) of a log"""
+        return timeutils.day_index(log.start) - self.today_index
+
+    def on_log_inserted(self, event: LogInserted) -> None:
+        """
+        Append a log inserted today to today's curve, if it ends after
+        every other log. Otherwise, mark the affected data as stale.
+        """
+        day_offset = self.day_offset_of(event.log)
+        if -14 <= day_offset < 0:
+            self.history_stale = True
+            self.bin_stats.invalidate([self.today_index + day_offset])
+        if day_offset != 0 or self.today_stale:
+            return
+
+        points = list(self.today.points)
+        x = timeutils.hours_between(timeutils.date_midnight_from_offset(0), event.log.end)
+        if len(points) < 2 or x < points[-1][0]:
+            self.today_stale = True
+            return
+        self.spoons_today += event.log.spoons
+        self.today.points = points + [(x, points[-1][1] + event.log.spoons)]
         self.update_spoons_spent_display()
-        self.update_plot()
+
+    def on_logs_deleted(self, event: LogsDeleted) -> None:
+        """Mark the data of the days of deleted logs as stale"""
+        for log in event.logs:
+            day_offset = self.day_offset_of(log)
+            if day_offset == 0:
+                self.today_stale = True
+            elif -14 <= day_offset < 0:
+                self.history_stale = True
+                self.bin_stats.invalidate([self.today_index + day_offset])
+
+    def on_bulk_import_done(self, event: BulkImportDone) -> None:
+        """Mark all data as stale"""
+        self.today_stale = self.history_stale = True
+        self.bin_stats.invalidate_all()
 
     def update_spoons_spent_display(self) -> None:
         """
@@ -56,15 +143,31 @@ class MenuScreen(Screen):
         averaged over past fortnight
         """
 
-        spoons_today = analyser.fetch_daily_total(self.db, 0)
-        spoons_average = analyser.fetch_average_spoons_per_day(self.db, -14, 0)
-        self.spoons_spent_display = f"{spoons_today:.0f} / {spoons_average:.0f}"
+        self.spoons_spent_display = f"{self.spoons_today:.0f} / {self.spoons_average:.0f}"
 
     def export_database(self) -> None:
         """Export the entire activities database as a csv file."""
 
         self.export_callback()
 
+    def backup_database(self) -> None:
+        """
+        Back up the database in the background, showing the progress on
+        the backup button.
+        """
+        if self.backup_running:
+            return
+        self.backup_running = True
+
+        def on_progress(fraction: float) -> None:
+            self.backup_display = f"Backing up... {fraction:.0%}"
+
+        def on_done(path: Optional[str]) -> None:
+            self.backup_running = False
+            self.backup_display = "Back up logs" if path is not None else "Backup failed, retry"
+
+        self.backup_callback(on_progress, on_done)
+
     def init_plot(self) -> None:
         """
         Initialize the home screen plot.
@@ -72,10 +175,11 @@ class MenuScreen(Screen):
         This plot shows the cumulative spoon expenditure for the current day,
         and the mean (+/- 1 standard deviation) of the last 14 days.
 
-        Note that in this method the only ploints plotted is that for the mean
-        and standard deviation offsets (mean, below, above). The points for
-        today are plotted in .update_plot(). Done this way, the mean (+/- std)
-        must only be calculated once per day.
+        Note that in this method no points are plotted. The points of the
+        mean and standard deviation offsets (mean, below, above) are
+        plotted in .update_mean_and_spread(), and those for today in
+        .update_plot(). Done this way, the mean (+/- std) must only be
+        recalculated when the past fortnight's logs change.
         """
 
         self.graph = Graph(
@@ -103,13 +207,6 @@ class MenuScreen(Screen):
         self.below = LinePlot(color=[1, 0, 0, 0.8], line_width=1.5)
         self.above = LinePlot(color=[1, 0, 0, 0.8], line_width=1.5)
 
-        # Get the mean (plus and minus 1 standard deviation) of past 14 days
-        # and provide points to LinePlot objects
-        xs, mean, below, above = analyser.get_mean_and_spread(self.db)
-        self.mean.points = zip(xs, mean)
-        self.below.points = zip(xs, below)
-        self.above.points = zip(xs, above)
-
         self.graph.add_plot(self.mean)
         self.graph.add_plot(self.below)
         self.graph.add_plot(self.above)
@@ -131,12 +228,12 @@ class MenuScreen(Screen):
         """
         Update the mean and standard deviation plots
 
-        This method is only ever activated when the database is updated
-        via an "import". Note that this method could be getting called from
-        kivy lang.
+        This is only called when logs of the past fortnight have changed,
+        or a new day has begun, and only the days that changed (or closed)
+        since the previous update are fetched.
         """
 
-        xs, mean, below, above = analyser.get_mean_and_spread(db=self.db)
+        xs, mean, below, above = analyser.update_mean_and_spread(db=self.db, stats=self.bin_stats)
         self.mean.points = zip(xs, mean)
         self.below.points = zip(xs, below)
         self.above.points = zip(xs, above)
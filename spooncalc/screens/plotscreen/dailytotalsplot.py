@@ -4,6 +4,9 @@ from enum import Enum
 from typing import (
     Dict,
     List,
+    Optional,
+    Set,
+    Tuple,
 )
 
 from kivy import utils
@@ -12,11 +15,17 @@ from kivy_garden.graph import (
     LinePlot,
 )
 
+from spooncalc import (
+    plotutils,
+    timeutils,
+)
 from spooncalc.dbtools import Database
-from spooncalc.models.activitylog import (
-    QUALIFIERS,
-    ActivityLog,
+from spooncalc.events import (
+    BulkImportDone,
+    LogInserted,
+    LogsDeleted,
 )
+from spooncalc.models.activitylog import QUALIFIERS
 
 # Manual color cycle for plots
 # 12 distinct colors generated by https://mokole.com/palette.html
@@ -39,6 +48,16 @@ COLORS = [
 class PlotMode(Enum):
     WEEK = "week"
     MONTH = "month"
+    YEAR = "year"
+    ALL = "all"
+
+
+# Modes whose x values are offsets of weeks or months (rather than days),
+# plotted from precomputed rollups, with the rollup level of each
+ROLLUP_LEVELS = {
+    PlotMode.YEAR: "week",
+    PlotMode.ALL: "month",
+}
 
 
 class YMode(Enum):
@@ -52,8 +71,10 @@ class DailyTotalsPlot:
     by PlotScreen
     """
 
-    def __init__(self, db: Database):
+    def __init__(self, db: Database, points_per_pixel: Optional[float] = plotutils.POINTS_PER_PIXEL):
         self.db = db
+        # Budget of plotted points per pixel of graph width (None plots all)
+        self.points_per_pixel = points_per_pixel
         self.mode = PlotMode.WEEK
         self.ymode = YMode.SPOONS
         self.week_xmax = 0
@@ -81,10 +102,15 @@ class DailyTotalsPlot:
         for qual, color in zip(["total", "averaged"] + QUALIFIERS, COLORS):
             self.plots[qual] = LinePlot(color=utils.get_color_from_hex(color), line_width=1.5)
 
+        # Full resolution points of each plot, downsampled to the graph width
+        self.raw_points: Dict[str, List[Tuple[float, float]]] = {}
+        self.graph.bind(width=self.update_plot_points)
+
         # By default, only the total is shown
         self.graph.add_plot(self.plots["total"])
 
-        self.logs_by_day: Dict[int, List[ActivityLog]] = {}
+        # Day offsets whose totals are in `data`
+        self.cached_days: Set[int] = set()
 
         # Nested data dict with structure [Ymode, qual+, day_offset, value]
         self.data: Dict[YMode, Dict[str, Dict[int, float]]] = {
@@ -92,40 +118,95 @@ class DailyTotalsPlot:
             YMode.HOURS: {q: defaultdict(float) for q in QUALIFIERS + ["total", "averaged"]},
         }
 
+        # Data plotted in rollup modes, with the same structure as `data`,
+        # but keyed by week or month offset. Refetched on every update.
+        self.rollup_data: Dict[YMode, Dict[str, Dict[int, float]]] = {}
+
         self.active = {q: q not in QUALIFIERS for q in QUALIFIERS + ["total"]}
 
+        # Day offsets of the cache are relative to this day index
+        self.cache_day_index = timeutils.day_index_from_offset(0)
+        self.db.events.subscribe(LogInserted, self.on_logs_changed)
+        self.db.events.subscribe(LogsDeleted, self.on_logs_changed)
+        self.db.events.subscribe(BulkImportDone, self.on_logs_changed)
+
         self.update_plot()
 
+    def on_logs_changed(self, event: LogInserted | LogsDeleted | BulkImportDone) -> None:
+        """Forget the cached data of the days of changed logs"""
+        if isinstance(event, BulkImportDone):
+            self.forget_days(list(self.cached_days))
+            return
+        logs = [event.log] if isinstance(event, LogInserted) else event.logs
+        self.forget_days([timeutils.day_index(log.start) - self.cache_day_index for log in logs])
+
+    def forget_days(self, day_offsets: List[int]) -> None:
+        """Forget the cached totals of days, to be refetched"""
+        for day_offset in day_offsets:
+            self.cached_days.discard(day_offset)
+            for ymode in YMode:
+                for values in self.data[ymode].values():
+                    values.pop(day_offset, None)
+
     def update_data(self) -> None:
-        for day_offset in range(self.xmin, self.xmax + 1):
-            # Fetch missing logs from database
-            if day_offset not in self.logs_by_day.keys():
-                self.logs_by_day[day_offset] = self.db.get_logs_from_day(day_offset)
-
-                # Collate data into points? Dicts?
-                self.data[YMode.HOURS]["total"][day_offset] = sum([log.hours for log in self.logs_by_day[day_offset]])
-                self.data[YMode.SPOONS]["total"][day_offset] = sum([log.spoons for log in self.logs_by_day[day_offset]])
-
-                # Collate data into nested dictionary
-                for log in self.logs_by_day[day_offset]:
-                    # Get all qualifiers
-                    for qual in QUALIFIERS:
-                        if getattr(log, qual):
-                            for ymode in YMode:
-                                self.data[ymode][qual][day_offset] += getattr(log, ymode.value)
+        if self.mode in ROLLUP_LEVELS:
+            self.update_rollup_data()
+            return
+
+        # Cached day offsets are stale once a new day has begun
+        today_index = timeutils.day_index_from_offset(0)
+        if today_index != self.cache_day_index:
+            self.forget_days(list(self.cached_days))
+            self.cache_day_index = today_index
+
+        missing = [day_offset for day_offset in range(self.xmin, self.xmax + 1) if day_offset not in self.cached_days]
+        if not missing:
+            return
+
+        # Fetch every series of all missing days in one aggregate query
+        breakdown = self.db.daily_breakdown(missing[0], missing[-1] + 1)
+        for ymode in YMode:
+            for series, values in breakdown[ymode.value].items():
+                for day_offset in missing:
+                    self.data[ymode][series][day_offset] = values[day_offset]
+        self.cached_days.update(missing)
+
+    def update_rollup_data(self) -> None:
+        """
+        Fetch the weekly or monthly totals in the x range from the
+        precomputed rollups, rather than from individual logs.
+        """
+        level = ROLLUP_LEVELS[self.mode]
+        today = timeutils.datetime_from_offset(0).date()
+        rollups = self.db.get_rollups(
+            level,
+            timeutils.period_from_offset(self.xmin, level, today),
+            timeutils.period_from_offset(self.xmax, level, today),
+        )
+
+        self.rollup_data = {
+            ymode: {q: defaultdict(float) for q in QUALIFIERS + ["total", "averaged"]} for ymode in YMode
+        }
+        for ymode in YMode:
+            for qual, values in rollups[ymode.value].items():
+                for period, value in values.items():
+                    x = timeutils.period_offset(period, level, today)
+                    self.rollup_data[ymode][qual][x] = value
 
     def update_plot(self) -> None:
         # Update daily totals line plot
-        self.update_data()
+        with timeutils.clock.frozen():
+            self.update_data()
         self.graph.xmin = self.xmin
         self.graph.xmax = self.xmax
 
-        for qual, plot in self.plots.items():
-            points = [(x, self.data[self.ymode][qual][x]) for x in range(self.xmin, self.xmax + 1)]
-            self.plots[qual].points = points
+        data = self.rollup_data if self.mode in ROLLUP_LEVELS else self.data
+        for qual in self.plots:
+            self.raw_points[qual] = [(x, data[self.ymode][qual][x]) for x in range(self.xmin, self.xmax + 1)]
+        self.update_plot_points()
 
         # ensure a minimum ymax of 11.
-        self.graph.ymax = 1.1 * max(self.data[self.ymode]["total"].values())
+        self.graph.ymax = 1.1 * max(data[self.ymode]["total"].values())
         self.graph.ymax = max(11.0, self.graph.ymax)
 
         # # Update averaging line plot
@@ -139,6 +220,11 @@ class DailyTotalsPlot:
         # av_xs = xs[1:-1]
         # self.average_plot.points = zip(av_xs, av_ys)
 
+    def update_plot_points(self, *args) -> None:
+        """Downsample the full resolution points to the graph width"""
+        for qual, points in self.raw_points.items():
+            self.plots[qual].points = plotutils.downsample(points, self.graph.width, self.points_per_pixel)
+
     def apply_qual_mask(self, qual_mask):
         for qual, flag in qual_mask.items():
             # If qual flagged, ensure it's plot is in graph
@@ -156,12 +242,16 @@ class DailyTotalsPlot:
             self.shift_x_range(-1)
         if self.mode == PlotMode.MONTH:
             self.shift_x_range(-7)
+        if self.mode == PlotMode.YEAR:
+            self.shift_x_range(-4)
 
     def shift_right(self) -> None:
         if self.mode == PlotMode.WEEK:
             self.shift_x_range(1)
         if self.mode == PlotMode.MONTH:
             self.shift_x_range(7)
+        if self.mode == PlotMode.YEAR:
+            self.shift_x_range(4)
 
     def shift_x_range(self, shift_size):
         self.xmin += shift_size
@@ -179,6 +269,10 @@ class DailyTotalsPlot:
         if mode == self.mode:
             return
 
+        # Day windows restart from the current week when leaving a rollup mode
+        if self.mode in ROLLUP_LEVELS and mode not in ROLLUP_LEVELS:
+            self.xmax = self.week_xmax + 7 if mode == PlotMode.WEEK else self.week_xmax
+
         self.mode = mode
         if mode == PlotMode.WEEK:
             self.xmax = self.xmax - 7  # focus window on second last week
@@ -190,5 +284,19 @@ class DailyTotalsPlot:
             self.xmax = (math.ceil(self.xmax / 7) + 1) * 7
             self.xmin = self.xmax - 28
             self.graph.x_ticks_major = 7
+        elif mode == PlotMode.YEAR:
+            # x values are week offsets, i.e. this week is 0
+            self.xmax = 0
+            self.xmin = -51
+            self.graph.x_ticks_major = 4
+        elif mode == PlotMode.ALL:
+            # x values are month offsets, spanning back to the first log
+            today = timeutils.datetime_from_offset(0).date()
+            earliest = self.db.get_earliest_period("month")
+            self.xmax = 0
+            self.xmin = -11
+            if earliest is not None:
+                self.xmin = min(self.xmin, timeutils.period_offset(earliest, "month", today))
+            self.graph.x_ticks_major = 12
 
         self.update_plot()
@@ -1,3 +1,9 @@
+from typing import (
+    List,
+    Optional,
+    Tuple,
+)
+
 from kivy_garden.graph import (
     Graph,
     LinePlot,
@@ -5,6 +11,7 @@ from kivy_garden.graph import (
 
 from spooncalc import (
     analyser,
+    plotutils,
     timeutils,
 )
 from spooncalc.dbtools import Database
@@ -12,8 +19,11 @@ from spooncalc.dbtools import Database
 
 class HourlyCumulative:
 
-    def __init__(self, db: Database) -> None:
+    def __init__(self, db: Database, points_per_pixel: Optional[float] = plotutils.POINTS_PER_PIXEL) -> None:
         self.db = db
+        # Budget of plotted points per pixel of graph width (None plots all)
+        self.points_per_pixel = points_per_pixel
+        self.raw_points: List[Tuple[float, float]] = []
         self.xmin = timeutils.DAY_BOUNDARY
         self.xmax = timeutils.DAY_BOUNDARY + 24
         self.ymax_persistent = 30
@@ -37,6 +47,7 @@ class HourlyCumulative:
 
         self.plot = LinePlot(color=[1, 1, 0, 1], line_width=1.5)
         self.graph.add_plot(self.plot)
+        self.graph.bind(width=self.update_plot_points)
 
     def update_data(self):
         xs, ys = analyser.fetch_cumulative_time_spoons(
@@ -48,9 +59,14 @@ class HourlyCumulative:
             xs.append(self.graph.xmax)
             ys.append(ys[-1])
 
-        self.plot.points = list(zip(xs, ys))
+        self.raw_points = list(zip(xs, ys))
+        self.update_plot_points()
         # self.update_daily_title()
 
+    def update_plot_points(self, *args) -> None:
+        """Downsample the full resolution points to the graph width"""
+        self.plot.points = plotutils.downsample(self.raw_points, self.graph.width, self.points_per_pixel)
+
     def update_plot(self):
         self.update_data()
 
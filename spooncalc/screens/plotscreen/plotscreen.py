@@ -1,10 +1,6 @@
 from __future__ import annotations
 
 import os
-from datetime import (
-    datetime,
-    timedelta,
-)
 from pathlib import Path
 
 from kivy.lang import Builder
@@ -12,6 +8,7 @@ from kivy.properties import StringProperty
 from kivy.uix.screenmanager import Screen
 from kivy.uix.togglebutton import ToggleButtonBehavior
 
+from spooncalc import timeutils
 from spooncalc.dbtools import Database
 from spooncalc.models.activitylog import QUALIFIERS
 
@@ -42,11 +39,12 @@ class PlotScreen(Screen):
         The range of days (a plot's x range)
     end : int
         The ending day (a plot's x max) in terms of offset from today
-    mode : str ("daily" | "weekly" | "monthly")
+    mode : str ("daily" | "weekly" | "monthly" | "yearly" | "all time")
         Sets the plotting mode from a defined set. "daily" is a single day,
         shows cumulative spoons spent over hours. "weekly" (or "monthly")
         show the total spoons spent each day, over days with a span of
-        7 (or 28)
+        7 (or 28). "yearly" (or "all time") show the total spoons spent
+        each week (or month), over a year (or since the first log)
     day_offset : int
         For "daily" plots, sets the day desired
     plot_title : StringProperty
@@ -94,24 +92,43 @@ class PlotScreen(Screen):
         """
         Set the current mode to weekly, updating key attributes as required
         """
-        self.ids.graph.remove_widget(self.current_plot.graph)
-        self.daily_totals_plot.set_mode(PlotMode.WEEK)
-        self.current_plot = self.daily_totals_plot
-        self.plot_title = "Weekly"
-        self.ids.graph.add_widget(self.current_plot.graph)
-
-        # Hours plotting disabled for hourlycumulative plot, so reactivate here
-        self.ids.hours_plt.disabled = False
+        self.set_daily_totals_mode(PlotMode.WEEK, "Weekly")
 
     def set_monthly(self) -> None:
         """
         Set the current mode to monthly, updating key attributes as required
         """
-        self.daily_totals_plot.set_mode(PlotMode.MONTH)
-        self.ids.graph.remove_widget(self.current_plot.graph)
+        self.set_daily_totals_mode(PlotMode.MONTH, "Monthly")
 
+    def set_yearly(self) -> None:
+        """
+        Set the current mode to yearly (weekly totals over a year),
+        updating key attributes as required
+        """
+        self.set_daily_totals_mode(PlotMode.YEAR, "Yearly")
+
+    def set_alltime(self) -> None:
+        """
+        Set the current mode to all-time (monthly totals since the first
+        log), updating key attributes as required
+        """
+        self.set_daily_totals_mode(PlotMode.ALL, "All time")
+
+    def set_daily_totals_mode(self, mode: PlotMode, title: str) -> None:
+        """
+        Show the totals plot in the provided mode
+
+        Parameters
+        ----------
+        mode : PlotMode
+            the span and resolution of the totals plot
+        title : str
+            the title displayed above the plot
+        """
+        self.ids.graph.remove_widget(self.current_plot.graph)
+        self.daily_totals_plot.set_mode(mode)
         self.current_plot = self.daily_totals_plot
-        self.plot_title = "Monthly"
+        self.plot_title = title
         self.ids.graph.add_widget(self.current_plot.graph)
 
         # Hours plotting disabled for hourlycumulative plot, so reactivate here
@@ -129,7 +146,7 @@ class PlotScreen(Screen):
 
         self.current_plot = self.hourly_cumulative
         assert isinstance(self.current_plot, HourlyCumulative)
-        date = datetime.now().date() + timedelta(days=self.current_plot.day_offset)
+        date = timeutils.date_midnight_from_offset(self.current_plot.day_offset).date()
         self.plot_title = date.strftime("%A %d.%m")
         self.ids.graph.add_widget(self.current_plot.graph)
 
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+from kivy.clock import Clock
+from kivy.lang import Builder
+from kivy.properties import StringProperty
+from kivy.uix.label import Label
+from kivy.uix.screenmanager import Screen
+
+from spooncalc.dbtools import Database
+from spooncalc.screens.logsscreen.entrybox import EntryBox
+from spooncalc.screens.logsscreen.titlebox import TitleBox
+
+Builder.load_file(os.path.join(Path(__file__).parent.absolute(), "searchscreen.kv"))
+
+
+class SearchScreen(Screen):
+    """
+    A window for searching the history of logs by activity name.
+
+    Matching logs are listed most recent first, beneath a summary of
+    the number of logs and total spoons of each matching activity name.
+
+    Attributes
+    ----------
+    summary : StringProperty
+        a description of the number of results shown
+    """
+
+    summary = StringProperty("")
+
+    # Seconds without typing before the search is run
+    SEARCH_DELAY = 0.3
+    # Maximum number of individual logs listed
+    RESULTS_LIMIT = 100
+
+    def __init__(self, db: Database, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.db = db
+        self.search_event = None
+
+    def on_query_text(self, text: str) -> None:
+        """
+        Schedule a search for `text`, replacing any pending search, such
+        that the database is only queried once typing pauses.
+        """
+        if self.search_event is not None:
+            self.search_event.cancel()
+        self.search_event = Clock.schedule_once(lambda dt: self.search(text), self.SEARCH_DELAY)
+
+    def search(self, query: str) -> None:
+        """Fill the results with the logs (and totals) matching `query`"""
+        self.ids.results.clear_widgets()
+        self.ids.totals.clear_widgets()
+        query = query.strip()
+        if not query:
+            self.summary = ""
+            return
+
+        for name, count, spoons in self.db.search_activity_totals(query):
+            self.ids.totals.add_widget(
+                Label(
+                    text=f"{name}: {count} logs, {spoons:.1f} spoons",
+                    size_hint=(1, None),
+                    height="30dp",
+                )
+            )
+
+        logs = self.db.search_activities(query, limit=self.RESULTS_LIMIT)
+        self.ids.results.add_widget(TitleBox())
+        for activitylog in logs:
+            self.ids.results.add_widget(EntryBox(activitylog, show_date=True))
+
+        self.summary = f"Most recent {len(logs)} matching logs"
@@ -0,0 +1,605 @@
+"""
+A local HTTP service answering json queries of the activities database,
+for dashboards and other clients, without the kivy app.
+
+Run it from the repository root, e.g.
+    python -m spooncalc.service --db spooncalc.db --port 8765
+
+Endpoints
+---------
+GET     /logs?start=2024-01-01&end=2024-02-01
+        the logs starting between the datetimes [start, end), streamed as
+        a json array
+POST    /logs
+        insert a log, or a list of logs, given as json (see log_from_json)
+DELETE  /logs?ids=1,2,3
+        delete logs by id
+GET     /daily-totals?start=-30&end=0
+        the total spoons of each day between day offsets [start, end)
+GET     /mean-spread?start=-14&end=0&mode=grid&tolerance=0
+        the mean and spread of cumulative daily spoons (see
+        analyser.get_mean_and_spread)
+GET     /export
+        every log as csv (see Database.export_database), streamed
+GET     /stats
+        the number and timing of the requests of each endpoint
+
+Requests are read with asyncio streams (HTTP/1.1, with keep-alive), while
+every database query runs on a bounded pool of threads, such that the
+event loop keeps answering requests while queries run. Ranges of logs are
+fetched a page at a time and sent as chunks, so the memory used by a
+request doesn't grow with its range.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from functools import partial
+from http import HTTPStatus
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+from urllib.parse import (
+    parse_qsl,
+    urlsplit,
+)
+
+from spooncalc import (
+    analyser,
+    timeutils,
+)
+from spooncalc.dbtools import Database
+from spooncalc.models.activitylog import (
+    QUALIFIERS,
+    ActivityLog,
+)
+from spooncalc.query import ActivityQuery
+
+# The largest accepted request body, in bytes
+MAX_BODY_BYTES = 1024 * 1024
+# Seconds an idle keep-alive connection is kept open
+KEEP_ALIVE_SECONDS = 15
+# Number of logs fetched (and sent) per chunk of a streamed range
+PAGE_SIZE = 500
+# Bytes of an export sent per chunk
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPError(Exception):
+    """Raised by a handler to answer a request with an error status"""
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+@dataclass
+class Request:
+    """
+    A parsed HTTP request.
+
+    Attributes
+    ----------
+    method : str
+        e.g. "GET"
+    path : str
+        the path of the target, without its query string
+    args : dict(str: str)
+        the arguments of the query string
+    headers : dict(str: str)
+        the headers, keyed by lower case name
+    body : bytes
+        the body, empty unless a Content-Length was given
+    version : str
+        e.g. "HTTP/1.1"
+    """
+
+    method: str
+    path: str
+    args: Dict[str, str]
+    headers: Dict[str, str]
+    body: bytes = b""
+    version: str = "HTTP/1.1"
+
+    @property
+    def keep_alive(self) -> bool:
+        """Whether the connection is kept open after the response"""
+        return self.version == "HTTP/1.1" and self.headers.get("connection", "").lower() != "close"
+
+    def arg(self, name: str, convert: Callable[[str], Any] = str, default: Any = None) -> Any:
+        """
+        Get a query string argument, converted by `convert`
+
+        Raises
+        ------
+        HTTPError
+            if the argument is missing (and has no default) or invalid
+        """
+        if name not in self.args:
+            if default is None:
+                raise HTTPError(400, f"Missing argument: {name}")
+            return default
+        try:
+            return convert(self.args[name])
+        except ValueError as e:
+            raise HTTPError(400, f"Invalid argument {name}: {e}") from e
+
+    def json(self) -> Any:
+        """Get the body, decoded as json"""
+        try:
+            return json.loads(self.body)
+        except ValueError as e:
+            raise HTTPError(400, f"Invalid json body: {e}") from e
+
+
+@dataclass
+class Response:
+    """
+    An HTTP response, whose body is either complete or streamed as chunks.
+
+    Attributes
+    ----------
+    status : int
+        the status code
+    body : bytes | async iterator of bytes
+        the body, or the chunks of a streamed body
+    content_type : str
+        the media type of the body
+    """
+
+    status: int = 200
+    body: Union[bytes, AsyncIterator[bytes]] = b""
+    content_type: str = "application/json"
+
+
+def json_response(value: Any, status: int = 200) -> Response:
+    """Get a response of a json-serializable value"""
+    return Response(status, json.dumps(value).encode("utf-8"))
+
+
+@dataclass
+class RouteStats:
+    """
+    The timing of the requests of an endpoint, from reading a request to
+    sending the last byte of its response.
+
+    Attributes
+    ----------
+    count : int
+        the number of answered requests
+    errors : int
+        the number of requests answered with an error status
+    total : float
+        the summed duration of every request, in seconds
+    longest : float
+        the longest duration of a request, in seconds
+    """
+
+    count: int = 0
+    errors: int = 0
+    total: float = 0.0
+    longest: float = 0.0
+
+    def add(self, seconds: float, status: int) -> None:
+        """Record a request lasting `seconds`"""
+        self.count += 1
+        self.errors += int(status >= 400)
+        self.total += seconds
+        self.longest = max(self.longest, seconds)
+
+    def summary(self) -> Dict[str, Any]:
+        """Get the json-serializable statistics, in milliseconds"""
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_ms": 1000 * self.total / self.count if self.count else 0.0,
+            "max_ms": 1000 * self.longest,
+        }
+
+
+def parse_datetime(text: str) -> datetime:
+    """Parse an ISO 8601 date or datetime, e.g. "2024-01-31" or "2024-01-31 08:00:00" """
+    return datetime.fromisoformat(text)
+
+
+def log_to_json(log: ActivityLog) -> Dict[str, Any]:
+    """Get the json-serializable values of an activity log, including its spoons"""
+    values: Dict[str, Any] = {
+        "id": log.id,
+        "start": log.start.strftime(timeutils.DATETIME_FORMATSTRING),
+        "end": log.end.strftime(timeutils.DATETIME_FORMATSTRING),
+        "name": str(log.name),
+        "cogload": float(log.cogload),
+        "physload": float(log.physload),
+        "energy": float(log.energy),
+    }
+    values.update({qual: bool(getattr(log, qual)) for qual in QUALIFIERS})
+    values["spoons"] = log.spoons
+    return values
+
+
+def log_from_json(values: Dict[str, Any]) -> ActivityLog:
+    """
+    Build an activity log from json values, as of log_to_json. Only
+    "start" and "end" are required, and any "id" or "spoons" is ignored.
+
+    Raises
+    ------
+    HTTPError
+        if the values don't describe a valid log
+    """
+    try:
+        log = ActivityLog(start=parse_datetime(values["start"]), end=parse_datetime(values["end"]))
+        for attr in ("cogload", "physload", "energy"):
+            if attr in values:
+                setattr(log, attr, float(values[attr]))
+        if "name" in values:
+            log.name = str(values["name"])
+        for qual in QUALIFIERS:
+            setattr(log, qual, bool(values.get(qual, False)))
+    except KeyError as e:
+        raise HTTPError(400, f"Missing log value: {e}") from e
+    except (TypeError, ValueError) as e:
+        raise HTTPError(400, f"Invalid log value: {e}") from e
+    if log.end <= log.start:
+        raise HTTPError(400, "A log must end after it starts")
+    return log
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Request]:
+    """
+    Read an HTTP request from a connection
+
+    Returns
+    -------
+    Request | None
+        the request, or None if the connection was closed
+
+    Raises
+    ------
+    HTTPError
+        if the request is malformed or its body too large
+    """
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, target, version = line.decode("latin-1").split()
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+
+    headers: Dict[str, str] = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HTTPError(400, "Invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, f"Request bodies are limited to {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b""
+
+    url = urlsplit(target)
+    return Request(method.upper(), url.path, dict(parse_qsl(url.query)), headers, body, version)
+
+
+class Service:
+    """
+    Answers HTTP requests of a database, running queries on a thread pool.
+
+    At most `max_pending` queries are submitted to the pool at once:
+    further requests wait for a free slot (without blocking the event
+    loop), such that a burst of requests can't queue unbounded work.
+
+    Attributes
+    ----------
+    db : Database
+        the database wrapper that inserts and deletes logs
+    reader : Database
+        the read-only wrapper that answers queries (see Database.reader)
+    executor : ThreadPoolExecutor
+        the threads that run database queries
+    max_pending : int
+        the maximum number of queries submitted to the pool at once
+    page_size : int
+        the number of logs fetched per chunk of a streamed range
+    stats : dict(str: RouteStats)
+        the timing of the requests of each endpoint, e.g. "GET /logs"
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        workers: int = 4,
+        max_pending: Optional[int] = None,
+        page_size: int = PAGE_SIZE,
+    ) -> None:
+        self.db = db
+        self.reader = db.reader()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="spooncalc-service")
+        self.max_pending = max_pending or 4 * workers
+        self.page_size = page_size
+        self.stats: Dict[str, RouteStats] = {}
+        self.slots: Optional[asyncio.Semaphore] = None
+        self.routes: Dict[Tuple[str, str], Callable[[Request], Any]] = {
+            ("GET", "/logs"): self.get_logs,
+            ("POST", "/logs"): self.post_logs,
+            ("DELETE", "/logs"): self.delete_logs,
+            ("GET", "/daily-totals"): self.get_daily_totals,
+            ("GET", "/mean-spread"): self.get_mean_spread,
+            ("GET", "/export"): self.get_export,
+            ("GET", "/stats"): self.get_stats,
+        }
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765) -> asyncio.AbstractServer:
+        """Start accepting connections, returning the (serving) server"""
+        self.slots = asyncio.Semaphore(self.max_pending)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    def close(self) -> None:
+        """Stop the query threads, once their current queries finish"""
+        self.executor.shutdown(wait=True)
+
+    async def run(self, func: Callable, *args: Any) -> Any:
+        """Run a (blocking) function on the thread pool, once a slot is free"""
+        assert self.slots is not None, "The service must be started first"
+        async with self.slots:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, partial(func, *args))
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answer the requests of a connection until it is closed"""
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(read_request(reader), KEEP_ALIVE_SECONDS)
+                except HTTPError as e:
+                    await self.write(writer, json_response({"error": e.message}, e.status), keep_alive=False)
+                    break
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+                    break
+                if request is None:
+                    break
+
+                t0 = time.perf_counter()
+                response = await self.dispatch(request)
+                await self.write(writer, response, request.keep_alive, request.version, t0)
+                if (request.method, request.path) in self.routes:
+                    route = f"{request.method} {request.path}"
+                    self.stats.setdefault(route, RouteStats()).add(time.perf_counter() - t0, response.status)
+                if not request.keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        except Exception:
+            # e.g. a query failing while a response is streamed, after its
+            # status was sent. The connection is closed without the last
+            # chunk, such that the client sees the response is incomplete.
+            logger.exception("Error answering a request")
+        finally:
+            writer.close()
+
+    async def dispatch(self, request: Request) -> Response:
+        """Answer a request by its route's handler, or with an error"""
+        handler = self.routes.get((request.method, request.path))
+        if handler is None:
+            if any(path == request.path for _, path in self.routes):
+                return json_response({"error": f"{request.method} not allowed"}, 405)
+            return json_response({"error": f"Not found: {request.path}"}, 404)
+        try:
+            return await handler(request)
+        except HTTPError as e:
+            return json_response({"error": e.message}, e.status)
+        except ValueError as e:
+            return json_response({"error": str(e)}, 400)
+        except (OSError, sqlite3.Error) as e:
+            return json_response({"error": str(e)}, 500)
+        except Exception:
+            logger.exception(f"Error answering {request.method} {request.path}")
+            return json_response({"error": "Internal server error"}, 500)
+
+    async def write(
+        self,
+        writer: asyncio.StreamWriter,
+        response: Response,
+        keep_alive: bool,
+        version: str = "HTTP/1.1",
+        t0: Optional[float] = None,
+    ) -> None:
+        """
+        Send a response. A streamed body is sent chunked (or, to HTTP/1.0
+        clients, until the connection closes), awaiting the client between
+        chunks such that a slow client slows the stream rather than
+        buffering it.
+        """
+        streamed = not isinstance(response.body, bytes)
+        chunked = streamed and version == "HTTP/1.1"
+        headers = [
+            f"HTTP/1.1 {response.status} {HTTPStatus(response.status).phrase}",
+            f"Content-Type: {response.content_type}",
+            f"Connection: {'keep-alive' if keep_alive and (chunked or not streamed) else 'close'}",
+        ]
+        if isinstance(response.body, bytes):
+            headers.append(f"Content-Length: {len(response.body)}")
+            if t0 is not None:
+                headers.append(f"Server-Timing: app;dur={1000 * (time.perf_counter() - t0):.2f}")
+        elif chunked:
+            headers.append("Transfer-Encoding: chunked")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1"))
+
+        if isinstance(response.body, bytes):
+            writer.write(response.body)
+        else:
+            async for chunk in response.body:
+                if not chunk:
+                    continue
+                writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk) if chunked else chunk)
+                await writer.drain()
+            if chunked:
+                writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    def fetch_page(self, query: ActivityQuery, after: Optional[Tuple[datetime, int]]) -> Tuple[bytes, Optional[Tuple]]:
+        """
+        Fetch the page of logs of `query` following the log with (start,
+        id) `after`, by keyset pagination.
+
+        Returns
+        -------
+        bytes, (datetime, int) | None
+            the comma separated json logs, and the key of the page's last
+            log, or None if this is the last page
+        """
+        if after is not None:
+            query = query.where(
+                "(start, id) > (?, ?)",
+                after[0].strftime(self.db.DATETIME_FORMATSTRING),
+                after[1],
+            )
+        logs = query.logs()
+        text = ",".join(json.dumps(log_to_json(log)) for log in logs)
+        key = (logs[-1].start, logs[-1].id) if len(logs) == self.page_size else None
+        return text.encode("utf-8"), key
+
+    async def get_logs(self, request: Request) -> Response:
+        """Stream the logs starting between the datetimes [start, end), in order"""
+        start = request.arg("start", parse_datetime)
+        end = request.arg("end", parse_datetime)
+        query = self.reader.query().between(start, end).order_by("start", "id").limit(self.page_size)
+
+        async def chunks() -> AsyncIterator[bytes]:
+            yield b"["
+            page, key = await self.run(self.fetch_page, query, None)
+            yield page
+            while key is not None:
+                page, key = await self.run(self.fetch_page, query, key)
+                yield b"," + page if page else page
+            yield b"]"
+
+        return Response(body=chunks())
+
+    async def post_logs(self, request: Request) -> Response:
+        """Insert a log, or a list of logs, skipping duplicates"""
+        values = request.json()
+        if isinstance(values, dict):
+            values = [values]
+        if not isinstance(values, list) or not all(isinstance(value, dict) for value in values):
+            raise HTTPError(400, "Expected a log or a list of logs")
+        logs = [log_from_json(value) for value in values]
+        inserted = await self.run(self.db.insert_activitylogs, logs)
+        return json_response({"inserted": inserted}, 201 if inserted else 200)
+
+    async def delete_logs(self, request: Request) -> Response:
+        """Delete the logs of the comma separated `ids`"""
+        ids = request.arg("ids", lambda text: [int(id) for id in text.split(",") if id])
+        deleted = await self.run(self.db.delete_entries, ids)
+        return json_response({"deleted": deleted})
+
+    def daily_totals(self, start: int, end: int) -> List[Dict[str, Any]]:
+        """Get the date and total spoons of each day with logs between day offsets [start, end)"""
+        with timeutils.clock.frozen():
+            totals = self.reader.get_daily_totals(start, end)
+            return [
+                {
+                    "offset": offset,
+                    "date": timeutils.date_midnight_from_offset(offset).strftime(timeutils.DATE_FORMATSTRING),
+                    "spoons": spoons,
+                }
+                for offset, spoons in sorted(totals.items())
+            ]
+
+    async def get_daily_totals(self, request: Request) -> Response:
+        """Answer the total spoons of each day between day offsets [start, end)"""
+        start = request.arg("start", int, -30)
+        end = request.arg("end", int, 0)
+        return json_response({"totals": await self.run(self.daily_totals, start, end)})
+
+    async def get_mean_spread(self, request: Request) -> Response:
+        """Answer the mean and spread of cumulative spoons of the days between day offsets [start, end)"""
+        start = request.arg("start", int, -14)
+        end = request.arg("end", int, 0)
+        mode = request.arg("mode", str, "grid")
+        tolerance = request.arg("tolerance", float, 0.0)
+        times, means, below, above = await self.run(
+            analyser.get_mean_and_spread, self.reader, start, end, mode, tolerance
+        )
+        return json_response({"times": times, "mean": means, "below": below, "above": above})
+
+    async def get_export(self, request: Request) -> Response:
+        """Stream every log as csv, exported to (and then read from) a temporary file"""
+        fd, path = tempfile.mkstemp(suffix=".csv")
+        os.close(fd)
+        try:
+            await self.run(self.reader.export_database, path)
+        except BaseException:
+            os.remove(path)
+            raise
+
+        async def chunks() -> AsyncIterator[bytes]:
+            try:
+                with open(path, "rb") as fp:
+                    while True:
+                        chunk = await self.run(fp.read, EXPORT_CHUNK_BYTES)
+                        if not chunk:
+                            break
+                        yield chunk
+            finally:
+                os.remove(path)
+
+        return Response(body=chunks(), content_type="text/csv")
+
+    async def get_stats(self, request: Request) -> Response:
+        """Answer the timing of the requests of each endpoint"""
+        return json_response({route: stats.summary() for route, stats in sorted(self.stats.items())})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve a SpoonCalc database over HTTP")
+    parser.add_argument("--db", default="spooncalc.db", help="path of the database")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=4, help="number of query threads")
+    args = parser.parse_args()
+
+    service = Service(Database(args.db), workers=args.workers)
+
+    async def serve() -> None:
+        server = await service.start(args.host, args.port)
+        print(f"Serving {args.db} on http://{args.host}:{args.port}")
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Export and import the activities database as a compact binary snapshot.
+
+Unlike a csv export, a snapshot is loaded without parsing any text: the
+file is memory-mapped and its fixed-width columns are read directly.
+
+Layout (little-endian), with every column padded to 8 bytes:
+
+    header      magic, version, row count, string count, crc32 of the body
+    start       int64[rows]   seconds since 1970-01-01 (naive local time)
+    end         int64[rows]   seconds since 1970-01-01 (naive local time)
+    cogload     float64[rows]
+    physload    float64[rows]
+    energy      float64[rows]
+    name        uint32[rows]  index into the string table
+    qualifiers  uint16[rows]  bitset, see activitylog.qualifier_bitmask
+    offsets     uint32[strings + 1]  byte offsets of each string in the blob
+    blob        utf-8 encoded names, concatenated
+"""
+
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from datetime import (
+    datetime,
+    timedelta,
+)
+from typing import (
+    Dict,
+    List,
+)
+
+from spooncalc.dbtools import Database
+from spooncalc.models.activitylog import (
+    ActivityLog,
+    qualifier_bitmask,
+    qualifiers_from_bitmask,
+)
+
+MAGIC = b"SPNS"
+VERSION = 1
+HEADER = struct.Struct("<4sHHQII")  # magic, version, reserved, rows, strings, crc32
+EPOCH = datetime(1970, 1, 1)
+
+# Typecode of each fixed-width column, in file order
+COLUMNS = [
+    ("start", "q"),
+    ("end", "q"),
+    ("cogload", "d"),
+    ("physload", "d"),
+    ("energy", "d"),
+    ("name", "I"),
+    ("qualifiers", "H"),
+]
+
+
+class SnapshotError(ValueError):
+    """Raised when a file is not a valid snapshot"""
+
+
+def padded(n_bytes: int) -> int:
+    """Round a number of bytes up to a multiple of 8"""
+    return (n_bytes + 7) // 8 * 8
+
+
+def to_bytes(values: array) -> bytes:
+    """Get the little-endian bytes of an array, padded to 8 bytes"""
+    if sys.byteorder == "big":
+        values.byteswap()
+    data = values.tobytes()
+    return data + bytes(padded(len(data)) - len(data))
+
+
+def write_snapshot(logs: List[ActivityLog], filename: str) -> None:
+    """
+    Write activity logs to a snapshot file
+
+    Parameters
+    ----------
+    logs : list(ActivityLog)
+        the logs to write
+    filename : str
+        the path of the snapshot file, which is overwritten
+    """
+    strings: Dict[str, int] = {}
+    columns: Dict[str, array] = {name: array(typecode) for name, typecode in COLUMNS}
+    for log in logs:
+        name = str(log.name)
+        columns["start"].append(int((log.start - EPOCH).total_seconds()))
+        columns["end"].append(int((log.end - EPOCH).total_seconds()))
+        columns["cogload"].append(float(log.cogload))
+        columns["physload"].append(float(log.physload))
+        columns["energy"].append(float(log.energy))
+        columns["name"].append(strings.setdefault(name, len(strings)))
+        columns["qualifiers"].append(qualifier_bitmask(log))
+
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = array("I", [0])
+    for s in encoded:
+        offsets.append(offsets[-1] + len(s))
+
+    body = b"".join(to_bytes(columns[name]) for name, _ in COLUMNS)
+    body += to_bytes(offsets) + b"".join(encoded)
+    header = HEADER.pack(MAGIC, VERSION, 0, len(logs), len(strings), zlib.crc32(body))
+
+    with open(filename, "wb") as fp:
+        fp.write(header)
+        fp.write(body)
+
+
+def read_snapshot(filename: str) -> List[ActivityLog]:
+    """
+    Read the activity logs of a snapshot file, via a memory map.
+
+    Raises
+    ------
+    SnapshotError
+        if the file is not a snapshot, is of an unsupported version, is
+        truncated, fails its checksum, or holds invalid names
+    """
+    with open(filename, "rb") as fp:
+        # Checked before mapping, as an empty file can't be memory-mapped
+        if os.fstat(fp.fileno()).st_size < HEADER.size:
+            raise SnapshotError(f"{filename} is too short to be a snapshot")
+        mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    with mm:
+        magic, version, _, n_rows, n_strings, checksum = HEADER.unpack_from(mm)
+        if magic != MAGIC:
+            raise SnapshotError(f"{filename} is not a snapshot")
+        if version != VERSION:
+            raise SnapshotError(f"Unsupported snapshot version: {version}")
+
+        with memoryview(mm) as view:
+            body = view[HEADER.size :]
+            if zlib.crc32(body) != checksum:
+                body.release()
+                raise SnapshotError(f"{filename} failed its checksum")
+
+            def read_column(offset: int, typecode: str, n: int) -> list:
+                values = array(typecode)
+                values.frombytes(body[offset : offset + values.itemsize * n])
+                if sys.byteorder == "big":
+                    values.byteswap()
+                return values.tolist()
+
+            columns_size = sum(padded(array(typecode).itemsize * n_rows) for _, typecode in COLUMNS)
+            if len(body) < columns_size + padded(array("I").itemsize * (n_strings + 1)):
+                body.release()
+                raise SnapshotError(f"{filename} is truncated")
+
+            offset = 0
+            columns = {}
+            for name, typecode in COLUMNS:
+                columns[name] = read_column(offset, typecode, n_rows)
+                offset += padded(array(typecode).itemsize * n_rows)
+            string_offsets = read_column(offset, "I", n_strings + 1)
+            offset += padded(array("I").itemsize * (n_strings + 1))
+            blob = bytes(body[offset : offset + string_offsets[-1]])
+            body.release()
+
+    if len(blob) < string_offsets[-1]:
+        raise SnapshotError(f"{filename} is truncated")
+    try:
+        strings = [blob[a:b].decode("utf-8") for a, b in zip(string_offsets, string_offsets[1:])]
+    except UnicodeDecodeError as e:
+        raise SnapshotError(f"{filename} holds an invalid name: {e}") from e
+    if columns["name"] and max(columns["name"]) >= len(strings):
+        raise SnapshotError(f"{filename} refers to a name outside its table of {len(strings)} names")
+
+    logs = []
+    for i in range(n_rows):
+        logs.append(
+            ActivityLog(
+                start=EPOCH + timedelta(seconds=columns["start"][i]),
+                end=EPOCH + timedelta(seconds=columns["end"][i]),
+                name=strings[columns["name"][i]],
+                cogload=columns["cogload"][i],
+                physload=columns["physload"][i],
+                energy=columns["energy"][i],
+                **qualifiers_from_bitmask(columns["qualifiers"][i]),
+            )
+        )
+    return logs
+
+
+def export_snapshot(db: Database, filename: str) -> int:
+    """
+    Export the entire activities database as a snapshot file.
+
+    Returns
+    -------
+    int
+        the number of exported logs
+    """
+    logs = db.get_all_logs()
+    # Avoid exporting empty database (and risking an overwrite)
+    if logs:
+        write_snapshot(logs, filename)
+    return len(logs)
+
+
+def import_snapshot(db: Database, filename: str) -> int:
+    """
+    Import a snapshot file in a single transaction, skipping duplicates
+    of existing logs.
+
+    Returns
+    -------
+    int
+        the number of inserted logs
+    """
+    return db.insert_activitylogs(read_snapshot(filename))
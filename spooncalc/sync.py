@@ -0,0 +1,126 @@
+"""
+Export and import incremental changes of the activities database, for
+syncing devices without transferring the whole history every time.
+
+A changes file holds one json change per line (see Database.get_changes),
+each tagged with the id of the exporting database. Each export appends to
+the file, such that a peer importing it after several exports still
+receives every change. The importer records the sequence number of the
+latest change it applied from each source, and skips changes up to it when
+the file is imported again, such that logs it has since deleted aren't
+brought back by replaying their insertion.
+"""
+
+from __future__ import annotations
+
+import json
+import uuid
+from typing import (
+    Any,
+    Dict,
+    List,
+)
+
+from spooncalc.dbtools import Database
+
+# Meta table key of the sequence number of the latest exported change
+EXPORTED_SEQ_KEY = "sync_exported_seq"
+# Meta table key of the id tagging the changes exported by this database
+SOURCE_ID_KEY = "sync_source_id"
+# Meta table key prefix of the sequence number of the latest change applied
+# from each source, followed by the id of the source
+APPLIED_SEQ_KEY = "sync_applied_seq:"
+
+
+def get_source_id(db: Database) -> str:
+    """Get the id tagging the changes exported by a database, created on first use"""
+    source = db.get_meta(SOURCE_ID_KEY)
+    if source is None:
+        source = uuid.uuid4().hex
+        db.set_meta(SOURCE_ID_KEY, source)
+    return source
+
+
+def export_changes(db: Database, filename: str) -> int:
+    """
+    Export every change since the previous export, appended to a changes
+    file (created if missing).
+
+    Returns
+    -------
+    int
+        the number of exported changes
+    """
+    since = int(db.get_meta(EXPORTED_SEQ_KEY) or 0)
+    changes = db.get_changes(since)
+    if not changes:
+        return 0
+    source = get_source_id(db)
+
+    # Append, rather than overwrite, such that the changes of previous
+    # exports not yet imported by a peer aren't lost
+    with open(filename, "a") as fp:
+        for change in changes:
+            fp.write(json.dumps({"source": source, **change}) + "\n")
+    db.set_meta(EXPORTED_SEQ_KEY, str(changes[-1]["seq"]))
+    return len(changes)
+
+
+def import_changes(db: Database, filename: str) -> int:
+    """
+    Apply the changes of a changes file, skipping those of each source up
+to the latest already applied from it, and those exported by `db` itself.
+Changes without a source (exported by older versions) are always applied.
+
+    Returns
+    -------
+    int
+        the number of changes that had an effect
+
+    Raises
+    ------
+    ValueError
+        if a line of the file is not a valid change, in which case no
+        change is applied
+    """
+    changes = []
+    with open(filename) as fp:
+        for i, line in enumerate(fp, start=1):
+            if not line.strip():
+                continue
+            try:
+                change = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid change on line {i} of {filename}: {e}") from e
+            if (
+                not isinstance(change, dict)
+                or "op" not in change
+                or "content_hash" not in change
+                or ("source" in change and not isinstance(change.get("seq"), int))
+            ):
+                raise ValueError(f"Invalid change on line {i} of {filename}")
+            changes.append(change)
+
+    own_source = db.get_meta(SOURCE_ID_KEY)
+    applied_seqs: Dict[str, int] = {}
+    new_changes: List[Dict[str, Any]] = []
+    for change in changes:
+        source = change.get("source")
+        if source is None:
+            new_changes.append(change)
+            continue
+        if source == own_source:
+            continue
+        if source not in applied_seqs:
+            applied_seqs[source] = int(db.get_meta(APPLIED_SEQ_KEY + source) or 0)
+        if change["seq"] > applied_seqs[source]:
+            new_changes.append(change)
+
+    with db.batch():
+        applied = db.apply_changes(new_changes)
+        for change in new_changes:
+            if "source" in change:
+                applied_seqs[change["source"]] = max(applied_seqs[change["source"]], change["seq"])
+        for source, seq in applied_seqs.items():
+            db.set_meta(APPLIED_SEQ_KEY + source, str(seq))
+    return applied
@@ -4,15 +4,105 @@ A collection of helpful functions for using datetime
 
 from __future__ import annotations
 
+import threading
+from contextlib import contextmanager
 from datetime import (
+    date,
     datetime,
     time,
     timedelta,
 )
+from typing import (
+    Callable,
+    Dict,
+    Iterator,
+    NamedTuple,
+    Optional,
+)
 
 DATE_FORMATSTRING = "%Y-%m-%d"
 DATETIME_FORMATSTRING = "%Y-%m-%d %H:%M:%S"
 DAY_BOUNDARY = 3  # o'Clock chosen as the divider between days
+PERIOD_LEVELS = ("day", "week", "month", "year")  # resolutions of rollups
+EPOCH_DATE = date(1970, 1, 1)  # day index 0
+
+
+class DayBounds(NamedTuple):
+    """The start of a day, as both the calendar midnight and DAY_BOUNDARY"""
+
+    midnight: datetime
+    start: datetime
+    start_epoch: float  # seconds since the epoch of `start`, in local time
+    index: int  # the day index, see `day_index`
+
+
+class Clock:
+    """
+    The source of the current time for all of SpoonCalc.
+
+    A clock can be frozen for the duration of an operation, such that
+    e.g. every day of a 14 day average is relative to the same "now", even
+    if the computation crosses midnight or DAY_BOUNDARY. The bounds of each
+    day offset are cached until the date changes, separately per thread,
+    as threads may be frozen at different dates.
+
+    Examples
+    --------
+    >>> with clock.frozen():
+    ...     start = datetime_from_offset(-14)
+    ...     end = datetime_from_offset(0)  # relative to the same today
+    """
+
+    def __init__(self, now: Optional[Callable[[], datetime]] = None) -> None:
+        """
+        Parameters
+        ----------
+        now : Callable | None
+            the source of the (unfrozen) current time, e.g. a fake in
+            benchmarks. By default, datetime.now.
+        """
+        self.source = now or datetime.now
+        # Frozen times, and the bounds cached for the date of each, are per thread
+        self.local = threading.local()
+
+    def now(self) -> datetime:
+        """Get the current time, or the time at which the clock was frozen"""
+        frozen_at = getattr(self.local, "frozen_at", None)
+        return frozen_at if frozen_at is not None else self.source()
+
+    @contextmanager
+    def frozen(self, at: Optional[datetime] = None) -> Iterator[datetime]:
+        """
+        Freeze the clock (in the current thread) within this context, at
+        `at` or now. Within an already frozen context, the clock stays
+        frozen at its original time.
+        """
+        if getattr(self.local, "frozen_at", None) is not None:
+            yield self.local.frozen_at
+            return
+        self.local.frozen_at = at or self.source()
+        try:
+            yield self.local.frozen_at
+        finally:
+            self.local.frozen_at = None
+
+    def day_bounds(self, day_offset: int) -> DayBounds:
+        """Get the bounds of the day `day_offset` days from today"""
+        today = self.now().date()
+        if getattr(self.local, "today", None) != today:
+            self.local.today = today
+            self.local.bounds = {}
+        cache: Dict[int, DayBounds] = self.local.bounds
+        bounds = cache.get(day_offset)
+        if bounds is None:
+            midnight = datetime.combine(today + timedelta(days=day_offset), time())
+            start = midnight + timedelta(hours=DAY_BOUNDARY)
+            index = (midnight.date() - EPOCH_DATE).days
+            bounds = cache[day_offset] = DayBounds(midnight, start, start.timestamp(), index)
+        return bounds
+
+
+clock = Clock()
 
 
 def day_start_hour() -> int:
@@ -53,14 +143,84 @@ def hours_between(start: datetime | str, end: datetime | str) -> float:
 
 def datetime_from_offset(day_offset: int) -> datetime:
     """Get the start of the day `day_offset` from today, as a datetime"""
-    day_start = datetime.now().replace(hour=DAY_BOUNDARY, minute=0, second=0, microsecond=0)
-    return day_start + timedelta(days=day_offset)
+    return clock.day_bounds(day_offset).start
 
 
 def date_midnight_from_offset(day_offset: int) -> datetime:
     """Get the starting midnight of the day `day_offset` as a datetime"""
-    day_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    return day_start + timedelta(days=day_offset)
+    return clock.day_bounds(day_offset).midnight
+
+
+def day_index_from_offset(day_offset: int) -> int:
+    """Get the day index (see `day_index`) of the day `day_offset` from today"""
+    return clock.day_bounds(day_offset).index
+
+
+def day_of(dati: datetime) -> date:
+    """Get the date of the day containing `dati`, factoring in
+    a non-midnight day boundary"""
+    return (dati - timedelta(hours=DAY_BOUNDARY)).date()
+
+
+def day_index(dati: datetime) -> int:
+    """Get the number of days between 1970-01-01 and the day containing
+    `dati`, factoring in a non-midnight day boundary"""
+    return (day_of(dati) - EPOCH_DATE).days
+
+
+def period_start(day: date, level: str) -> date:
+    """
+    Get the first date of the period at resolution `level` that
+    contains `day`.
+
+    Weeks are ISO weeks, i.e. they start on Monday.
+
+    Parameters
+    ----------
+    day : date
+        any date within the period
+    level : str {"day", "week", "month", "year"}
+        the resolution of the period
+    """
+    if level == "day":
+        return day
+    if level == "week":
+        return day - timedelta(days=day.weekday())
+    if level == "month":
+        return day.replace(day=1)
+    if level == "year":
+        return day.replace(month=1, day=1)
+    raise ValueError(f"Unknown period level: {level}")
+
+
+def period_offset(period: date, level: str, reference: date) -> int:
+    """
+    Get the number of periods between the period containing `reference`
+    and the period containing `period`, e.g. -1 is the previous period.
+    """
+    period = period_start(period, level)
+    reference = period_start(reference, level)
+    if level == "day":
+        return (period - reference).days
+    if level == "week":
+        return (period - reference).days // 7
+    if level == "month":
+        return (period.year * 12 + period.month) - (reference.year * 12 + reference.month)
+    return period.year - reference.year
+
+
+def period_from_offset(offset: int, level: str, reference: date) -> date:
+    """Get the first date of the period `offset` periods from the
+    period containing `reference`. The inverse of `period_offset`"""
+    reference = period_start(reference, level)
+    if level == "day":
+        return reference + timedelta(days=offset)
+    if level == "week":
+        return reference + timedelta(weeks=offset)
+    if level == "month":
+        year, month = divmod(reference.year * 12 + reference.month - 1 + offset, 12)
+        return date(year, month + 1, 1)
+    return date(reference.year + offset, 1, 1)
 
 
 def time2decimal(time_in: time | str | timedelta) -> float:
@@ -117,4 +277,4 @@ def round_datetime(dati: datetime, minute_interval=15) -> datetime:
 
 def get_nowish(interval_mins=15) -> datetime:
     """Get the datetime for now, rounded to nearest 15 mins"""
-    return round_datetime(datetime.now(), minute_interval=interval_mins)
+    return round_datetime(clock.now(), minute_interval=interval_mins)
@@ -0,0 +1,173 @@
+"""
+Archiving past years into partition files (see Database.archive_year),
+which must leave every read, search, delete and backup of the database
+unchanged, including with more partitions than sqlite3 can attach at once.
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import shutil
+from datetime import (
+    datetime,
+    timedelta,
+)
+from typing import List
+
+import pytest
+
+from spooncalc import timeutils
+from spooncalc.backup import (
+    BackupError,
+    BackupManager,
+    validate_backup,
+)
+from spooncalc.dbtools import Database
+from spooncalc.models.activitylog import ActivityLog
+
+N_YEARS = Database.MAX_ATTACHED + 3
+
+
+def make_logs(first_year: int, n_years: int, seed: int = 0) -> List[ActivityLog]:
+    """Generate a few random logs in each month of `n_years` years"""
+    rng = random.Random(seed)
+    logs = []
+    for year in range(first_year, first_year + n_years):
+        for month in range(1, 13):
+            for day in (3, 17):
+                start = datetime(year, month, day, rng.randrange(6, 20), rng.randrange(60))
+                logs.append(
+                    ActivityLog(
+                        start=start,
+                        end=start + timedelta(minutes=rng.randrange(10, 120)),
+                        name=rng.choice(["walk", "work", "café", "nap"]),
+                        cogload=rng.choice([0.0, 1.0, 2.0]),
+                        physload=rng.choice([0.0, 1.0, 2.0]),
+                    )
+                )
+    return logs
+
+
+def sort_logs(logs: List[ActivityLog]) -> List[ActivityLog]:
+    return sorted(logs, key=lambda log: (log.start, log.id))
+
+
+def all_pages(db: Database, limit: int = 50) -> List[ActivityLog]:
+    logs: List[ActivityLog] = []
+    before = None
+    while True:
+        page = db.get_logs_page(before, limit)
+        logs += page
+        if len(page) < limit:
+            return logs
+        before = (page[-1].start, page[-1].id)
+
+
+@pytest.fixture
+def archived(tmp_path):
+    """A database with more archived years than MAX_ATTACHED, and its logs before archiving"""
+    first_year = timeutils.clock.now().year - N_YEARS
+    db = Database(str(tmp_path / "spooncalc.db"))
+    db.insert_activitylogs(make_logs(first_year, N_YEARS + 1))
+    logs = sort_logs(db.get_all_logs())
+    for year in range(first_year, first_year + N_YEARS):
+        assert db.archive_year(year) == 24
+    return db, logs
+
+
+def test_archive_keeps_every_log(archived, tmp_path):
+    db, logs = archived
+    assert len(db.submit_query("SELECT year FROM partitions")) == N_YEARS
+    assert len(list(tmp_path.glob("spooncalc-*.db"))) == N_YEARS
+    assert db.submit_query("SELECT COUNT(*) FROM activities")[0][0] == 24
+
+    assert sort_logs(db.get_all_logs()) == logs
+    assert all_pages(db) == sorted(logs, key=lambda log: (log.start, log.id), reverse=True)
+    assert db.query().aggregate("count") == len(logs)
+    assert db.reader().query().aggregate("count") == len(logs)
+
+
+def test_routed_reads_and_search(tmp_path):
+    first_year = timeutils.clock.now().year - N_YEARS
+    db = Database(str(tmp_path / "spooncalc.db"))
+    db.insert_activitylogs(make_logs(first_year, N_YEARS + 1))
+    old_range = (datetime(first_year + 1, 1, 1), datetime(first_year + 4, 1, 1))
+    old_log = sort_logs(db.get_all_logs())[30]
+
+    def reads():
+        return (
+            db.get_logs_between_datetimes(*old_range),
+            db.search_activities("wal", limit=1000),
+            db.search_activities("caf", date_range=old_range),
+            # Rounded, as archiving changes the order in which spoons are summed
+            [(name, count, round(spoons, 6)) for name, count, spoons in db.search_activity_totals("a")],
+            [log.id for log in db.find_overlapping(old_log.start, old_log.end)],
+            db.daily_breakdown(-(timeutils.clock.now() - datetime(first_year, 1, 1)).days, 1),
+        )
+
+    before = reads()
+    for year in range(first_year, first_year + N_YEARS):
+        db.archive_year(year)
+    assert reads() == before
+    assert old_log.id in before[4]
+
+
+def test_delete_archived_entries(archived):
+    db, logs = archived
+    # One log of every archived year, more than can be attached at once
+    victims = [log.id for log in logs[:-24:24]]
+    assert len(victims) == N_YEARS
+
+    assert db.delete_entries(victims) == N_YEARS
+    remaining = [log for log in logs if log.id not in victims]
+    assert sort_logs(db.get_all_logs()) == remaining
+    assert db.query().aggregate("count") == len(remaining)
+    assert db.submit_query("SELECT COUNT(*) FROM archived_hashes")[0][0] == 24 * N_YEARS - N_YEARS
+    assert not db.search_activities(logs[0].name, date_range=(logs[0].start, logs[0].end))
+
+
+def test_failed_batch_keeps_archived_entries(archived):
+    db, logs = archived
+    victims = [log.id for log in logs[:-24:24]]
+
+    with pytest.raises(RuntimeError):
+        with db.batch():
+            assert db.delete_entries(victims) == N_YEARS
+            raise RuntimeError("abort the batch")
+
+    assert sort_logs(db.get_all_logs()) == logs
+    assert db.submit_query("SELECT COUNT(*) FROM archived_hashes")[0][0] == 24 * N_YEARS
+
+
+def test_archived_logs_are_not_inserted_again(archived):
+    db, logs = archived
+    first_year = timeutils.clock.now().year - N_YEARS
+
+    assert db.insert_activitylogs(make_logs(first_year, N_YEARS + 1)) == 0
+    assert sort_logs(db.get_all_logs()) == logs
+
+
+def test_backup_and_restore_partitions(archived, tmp_path):
+    db, logs = archived
+    manager = BackupManager(db, str(tmp_path / "backups"))
+    path = manager.backup()
+    stem = os.path.splitext(os.path.basename(path))[0]
+    assert len(list((tmp_path / "backups").glob(f"{stem}-*.db"))) == N_YEARS
+    assert validate_backup(path) == Database.SCHEMA_VERSION
+
+    # A copy elsewhere reads its own partitions
+    copy_dir = tmp_path / "copy"
+    shutil.copytree(tmp_path / "backups", copy_dir)
+    copy_path = str(copy_dir / os.path.basename(path))
+    assert sort_logs(Database(copy_path).get_all_logs()) == logs
+
+    db.delete_entries([log.id for log in logs[::7]])
+    db.archive_year(timeutils.clock.now().year - 1)
+    manager.restore(path)
+    assert sort_logs(db.get_all_logs()) == logs
+    assert len(list(tmp_path.glob("spooncalc-*.db"))) == N_YEARS
+
+    os.remove(copy_dir / f"{stem}-{logs[0].start.year}.db")
+    with pytest.raises(BackupError):
+        validate_backup(copy_path)
@@ -0,0 +1,142 @@
+"""
+Round trips of the activities database through csv exports and binary
+snapshots (see spooncalc.snapshot), which must import identically.
+"""
+
+from __future__ import annotations
+
+import random
+import struct
+import zlib
+from array import array
+from datetime import (
+    datetime,
+    timedelta,
+)
+from typing import List
+
+import pytest
+
+from spooncalc import (
+    csvimport,
+    snapshot,
+)
+from spooncalc.dbtools import Database
+from spooncalc.models.activitylog import (
+    QUALIFIERS,
+    ActivityLog,
+)
+
+
+def make_logs(n_logs: int = 200, seed: int = 0) -> List[ActivityLog]:
+    """Generate back-to-back random logs, with repeated names and random qualifiers"""
+    rng = random.Random(seed)
+    start = datetime(2024, 3, 1, 8, 0)
+    logs = []
+    for _ in range(n_logs):
+        end = start + timedelta(minutes=rng.randrange(5, 180))
+        log = ActivityLog(
+            start=start,
+            end=end,
+            name=rng.choice(["walk", "work", "café", "nap", "reading"]),
+            cogload=rng.choice([0.0, 0.5, 1.0, 1.5, 2.0]),
+            physload=rng.choice([0.0, 0.5, 1.0, 1.5, 2.0]),
+            energy=rng.choice([-1.0, 0.0, 1.0]),
+        )
+        for qual in QUALIFIERS:
+            setattr(log, qual, rng.random() < 0.3)
+        logs.append(log)
+        start = end + timedelta(minutes=rng.randrange(0, 60))
+    return logs
+
+
+@pytest.fixture
+def populated(tmp_path) -> Database:
+    db = Database(str(tmp_path / "source.db"))
+    db.insert_activitylogs(make_logs())
+    return db
+
+
+def test_csv_and_snapshot_round_trips_are_identical(populated, tmp_path):
+    csv_path = str(tmp_path / "spoon-output.csv")
+    snapshot_path = str(tmp_path / "spoon-output.spoon")
+    populated.export_database(csv_path)
+    assert snapshot.export_snapshot(populated, snapshot_path) == 200
+
+    from_csv = Database(str(tmp_path / "from-csv.db"))
+    result = csvimport.import_csv(from_csv, csv_path, workers=1)
+    assert result.inserted == 200
+    assert not result.errors
+    from_snapshot = Database(str(tmp_path / "from-snapshot.db"))
+    assert snapshot.import_snapshot(from_snapshot, snapshot_path) == 200
+
+    assert from_snapshot.get_all_logs() == from_csv.get_all_logs()
+    assert from_snapshot.get_all_logs() == populated.get_all_logs()
+
+
+def test_import_snapshot_skips_duplicates(populated, tmp_path):
+    snapshot_path = str(tmp_path / "spoon-output.spoon")
+    snapshot.export_snapshot(populated, snapshot_path)
+
+    assert snapshot.import_snapshot(populated, snapshot_path) == 0
+    assert len(populated.get_all_logs()) == 200
+
+
+def test_empty_database_is_not_exported(tmp_path):
+    snapshot_path = tmp_path / "spoon-output.spoon"
+    assert snapshot.export_snapshot(Database(str(tmp_path / "empty.db")), str(snapshot_path)) == 0
+    assert not snapshot_path.exists()
+
+
+@pytest.mark.parametrize(
+    "corrupt",
+    [
+        lambda data: b"",
+        lambda data: data[:10],
+        lambda data: data[: len(data) // 2],
+        lambda data: b"NOPE" + data[4:],
+        lambda data: data[:-1] + bytes([data[-1] ^ 0xFF]),
+    ],
+    ids=["empty", "header only", "truncated", "bad magic", "bad checksum"],
+)
+def test_invalid_snapshot_raises(populated, tmp_path, corrupt):
+    snapshot_path = tmp_path / "spoon-output.spoon"
+    snapshot.export_snapshot(populated, str(snapshot_path))
+    snapshot_path.write_bytes(corrupt(snapshot_path.read_bytes()))
+
+    with pytest.raises(snapshot.SnapshotError):
+        snapshot.read_snapshot(str(snapshot_path))
+
+
+def test_name_index_outside_name_table_raises(populated, tmp_path):
+    snapshot_path = tmp_path / "spoon-output.spoon"
+    snapshot.export_snapshot(populated, str(snapshot_path))
+    data = bytearray(snapshot_path.read_bytes())
+    magic, version, reserved, n_rows, n_strings, _ = snapshot.HEADER.unpack_from(data)
+    offset = snapshot.HEADER.size
+    for name, typecode in snapshot.COLUMNS:
+        if name == "name":
+            break
+        offset += snapshot.padded(array(typecode).itemsize * n_rows)
+    struct.pack_into("<I", data, offset, n_strings)
+    # A valid checksum, such that only the name index is invalid
+    checksum = zlib.crc32(data[snapshot.HEADER.size :])
+    snapshot.HEADER.pack_into(data, 0, magic, version, reserved, n_rows, n_strings, checksum)
+    snapshot_path.write_bytes(bytes(data))
+
+    with pytest.raises(snapshot.SnapshotError):
+        snapshot.read_snapshot(str(snapshot_path))
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_invalid_utf8_csv_raises(populated, tmp_path, monkeypatch, workers):
+    csv_path = tmp_path / "spoon-output.csv"
+    populated.export_database(str(csv_path))
+    data = csv_path.read_bytes()
+    csv_path.write_bytes(data[: len(data) // 2] + b"\xff" + data[len(data) // 2 :])
+    monkeypatch.setattr(csvimport, "PARALLEL_MIN_BYTES", 0)
+
+    target = Database(str(tmp_path / "target.db"))
+    with pytest.raises(csvimport.CSVError):
+        csvimport.import_csv(target, str(csv_path), workers=workers)
+    assert target.get_all_logs() == []
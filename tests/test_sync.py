@@ -0,0 +1,82 @@
+"""
+Syncing databases through changes files (see spooncalc.sync), which grow
+with each export and may be imported any number of times.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import List
+
+import pytest
+
+from spooncalc import sync
+from spooncalc.dbtools import Database
+from spooncalc.models.activitylog import ActivityLog
+
+
+def make_log(name: str, hour: int) -> ActivityLog:
+    return ActivityLog(
+        start=datetime(2024, 3, 1, hour, 0),
+        end=datetime(2024, 3, 1, hour, 30),
+        name=name,
+        cogload=1.0,
+        physload=0.5,
+    )
+
+
+def names(db: Database) -> List[str]:
+    return sorted(log.name for log in db.get_all_logs())
+
+
+@pytest.fixture
+def peers(tmp_path):
+    return Database(str(tmp_path / "a.db")), Database(str(tmp_path / "b.db")), str(tmp_path / "spoon-changes.jsonl")
+
+
+def test_reimport_does_not_restore_deleted_logs(peers):
+    a, b, changes_path = peers
+    a.insert_activitylog(make_log("x", 8))
+    sync.export_changes(a, changes_path)
+    assert sync.import_changes(b, changes_path) == 1
+
+    b.delete_entry(b.get_all_logs()[0].id)
+    a.insert_activitylog(make_log("y", 10))
+    sync.export_changes(a, changes_path)
+    assert sync.import_changes(b, changes_path) == 1
+    assert names(b) == ["y"]
+
+
+def test_reimporting_unchanged_file_has_no_effect(peers):
+    a, b, changes_path = peers
+    a.insert_activitylog(make_log("x", 8))
+    a.insert_activitylog(make_log("y", 10))
+    sync.export_changes(a, changes_path)
+    sync.import_changes(b, changes_path)
+    seq = b.latest_change_seq()
+
+    assert sync.import_changes(b, changes_path) == 0
+    assert names(b) == ["x", "y"]
+    assert b.latest_change_seq() == seq
+
+
+def test_insert_then_delete_is_applied_as_delete(peers):
+    a, b, _ = peers
+    a.insert_activitylog(make_log("x", 8))
+    a.delete_entry(a.get_all_logs()[0].id)
+
+    changes = a.get_changes()
+    assert [change["op"] for change in changes] == ["insert", "delete"]
+    assert b.apply_changes(changes) == 0
+    assert names(b) == []
+    assert b.latest_change_seq() == 0
+
+
+def test_own_changes_are_skipped(peers):
+    a, _, changes_path = peers
+    a.insert_activitylog(make_log("x", 8))
+    sync.export_changes(a, changes_path)
+    a.delete_entry(a.get_all_logs()[0].id)
+
+    assert sync.import_changes(a, changes_path) == 0
+    assert names(a) == []